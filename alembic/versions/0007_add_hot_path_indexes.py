@@ -0,0 +1,69 @@
+"""add indexes for foreign keys and hot filter columns
+
+Revision ID: 0007_add_hot_path_indexes
+Revises: 0006_add_space_field_values
+Create Date: 2026-10-17 09:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_add_hot_path_indexes'
+down_revision = '0006_add_space_field_values'
+branch_labels = None
+depends_on = None
+
+
+# (table, index name, columns). Composite indexes lead with the equality column of the
+# query they serve and follow with the range/sort column.
+INDEXES = [
+    # /agents/tickets: current_queue_id IN (...) [AND status = ?] [AND priority = ?]
+    ('tickets', 'ix_tickets_queue_status_priority', ['current_queue_id', 'status', 'priority']),
+    # /tickets/me
+    ('tickets', 'ix_tickets_client_user_id', ['client_user_id']),
+    ('tickets', 'ix_tickets_ticket_type_id', ['ticket_type_id']),
+    # /tickets/{id}/history: filter by ticket, ordered by time
+    ('ticket_movement_log', 'ix_ticket_movement_log_ticket_ts', ['ticket_id', 'timestamp']),
+    ('ticket_comments', 'ix_ticket_comments_ticket_created', ['ticket_id', 'created_at']),
+    ('attachments', 'ix_attachments_ticket_id', ['ticket_id']),
+    ('ticket_field_values', 'ix_ticket_field_values_ticket_id', ['ticket_id']),
+    ('ticket_type_fields', 'ix_ticket_type_fields_type_id', ['ticket_type_id']),
+    # booking overlap checks: space/item + Confirmed status, then join to the activity
+    ('space_bookings', 'ix_space_bookings_space_status', ['space_id', 'status']),
+    ('space_bookings', 'ix_space_bookings_activity_id', ['activity_id']),
+    ('stock_bookings', 'ix_stock_bookings_item_status', ['item_id', 'status']),
+    ('stock_bookings', 'ix_stock_bookings_activity_id', ['activity_id']),
+    # /activities/ range filters
+    ('activities', 'ix_activities_start_end', ['start_time', 'end_time']),
+    ('activities', 'ix_activities_organizer', ['organizer_user_id']),
+    ('activity_type_fields', 'ix_activity_type_fields_type_id', ['activity_type_id']),
+    ('activity_field_values', 'ix_activity_field_values_activity_id', ['activity_id']),
+    ('space_template_fields', 'ix_space_template_fields_template_id', ['space_template_id']),
+    ('space_field_values', 'ix_space_field_values_space_id', ['space_id']),
+    # permission checks on every agent/ticket request
+    ('agent_assignments', 'ix_agent_assignments_agent_queue', ['agent_user_id', 'queue_id']),
+    ('queue_permissions', 'ix_queue_permissions_queue_group', ['queue_id', 'group_id']),
+    # user_groups' primary key (user_id, group_id) already serves lookups by user; this
+    # covers the reverse direction used by group membership listings
+    ('user_groups', 'ix_user_groups_group_id', ['group_id']),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    for table, name, columns in INDEXES:
+        if table not in tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        try:
+            op.drop_index(name, table_name=table)
+        except Exception:
+            pass
@@ -0,0 +1,33 @@
+"""backfill tickets.updated_at and index it for keyset pagination
+
+Revision ID: 0008_ticket_updated_at_keyset
+Revises: 0007_add_hot_path_indexes
+Create Date: 2026-10-17 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008_ticket_updated_at_keyset'
+down_revision = '0007_add_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'tickets' not in inspector.get_table_names():
+        return
+    # tickets that were never updated have NULL updated_at; the model now sets it on insert
+    op.execute('UPDATE tickets SET updated_at = created_at WHERE updated_at IS NULL')
+    existing = {ix['name'] for ix in inspector.get_indexes('tickets')}
+    if 'ix_tickets_queue_updated' not in existing:
+        op.create_index('ix_tickets_queue_updated', 'tickets', ['current_queue_id', 'updated_at', 'id'])
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_tickets_queue_updated', table_name='tickets')
+    except Exception:
+        pass
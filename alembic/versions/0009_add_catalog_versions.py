@@ -0,0 +1,35 @@
+"""add catalog_versions for version-stamped definition caches
+
+Revision ID: 0009_add_catalog_versions
+Revises: 0008_ticket_updated_at_keyset
+Create Date: 2026-10-17 11:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009_add_catalog_versions'
+down_revision = '0008_ticket_updated_at_keyset'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'catalog_versions' in inspector.get_table_names():
+        return
+    table = op.create_table(
+        'catalog_versions',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # seed the row so the first concurrent bumps all take the UPDATE path
+    op.bulk_insert(table, [{'name': 'ticket_types', 'version': 0}])
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'catalog_versions' in inspector.get_table_names():
+        op.drop_table('catalog_versions')
@@ -0,0 +1,51 @@
+"""add attachment_blobs for deduplicated attachment storage
+
+Revision ID: 0010_add_attachment_blobs
+Revises: 0009_add_catalog_versions
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_attachment_blobs'
+down_revision = '0009_add_catalog_versions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    if 'attachment_blobs' not in tables:
+        op.create_table(
+            'attachment_blobs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('sha256', sa.String(64), nullable=False, unique=True),
+            sa.Column('size', sa.BigInteger(), nullable=False),
+            sa.Column('path', sa.String(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+    if 'attachments' in tables:
+        columns = {c['name'] for c in inspector.get_columns('attachments')}
+        if 'blob_id' not in columns:
+            # existing attachments keep blob_id NULL and are served from file_path
+            with op.batch_alter_table('attachments') as batch:
+                batch.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+                batch.create_foreign_key('fk_attachments_blob_id', 'attachment_blobs', ['blob_id'], ['id'])
+        existing = {ix['name'] for ix in inspector.get_indexes('attachments')}
+        if 'ix_attachments_blob_id' not in existing:
+            op.create_index('ix_attachments_blob_id', 'attachments', ['blob_id'])
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_attachments_blob_id', table_name='attachments')
+        with op.batch_alter_table('attachments') as batch:
+            batch.drop_constraint('fk_attachments_blob_id', type_='foreignkey')
+            batch.drop_column('blob_id')
+        op.drop_table('attachment_blobs')
+    except Exception:
+        pass
@@ -0,0 +1,58 @@
+"""denormalize activity times onto bookings for indexed overlap checks
+
+Revision ID: 0011_booking_time_windows
+Revises: 0010_add_attachment_blobs
+Create Date: 2026-10-17 13:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011_booking_time_windows'
+down_revision = '0010_add_attachment_blobs'
+branch_labels = None
+depends_on = None
+
+
+# (table, resource column, new window index, index it supersedes)
+TABLES = [
+    ('space_bookings', 'space_id', 'ix_space_bookings_space_window', 'ix_space_bookings_space_status'),
+    ('stock_bookings', 'item_id', 'ix_stock_bookings_item_window', 'ix_stock_bookings_item_status'),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    for table, resource, index, superseded in TABLES:
+        if table not in tables:
+            continue
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        with op.batch_alter_table(table) as batch:
+            for name in ('start_time', 'end_time'):
+                if name not in columns:
+                    batch.add_column(sa.Column(name, sa.DateTime(), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET "
+            f"start_time = (SELECT a.start_time FROM activities a WHERE a.id = {table}.activity_id), "
+            f"end_time = (SELECT a.end_time FROM activities a WHERE a.id = {table}.activity_id)"
+        )
+        existing = {ix['name'] for ix in inspector.get_indexes(table)}
+        if index not in existing:
+            op.create_index(index, table, [resource, 'status', 'start_time', 'end_time'])
+        # the window index has (resource, status) as its prefix
+        if superseded in existing:
+            op.drop_index(superseded, table_name=table)
+
+
+def downgrade():
+    for table, resource, index, superseded in TABLES:
+        try:
+            op.create_index(superseded, table, [resource, 'status'])
+            op.drop_index(index, table_name=table)
+            with op.batch_alter_table(table) as batch:
+                batch.drop_column('end_time')
+                batch.drop_column('start_time')
+        except Exception:
+            pass
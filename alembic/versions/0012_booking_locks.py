@@ -0,0 +1,59 @@
+"""add booking_locks and, on PostgreSQL, booking exclusion constraints
+
+Revision ID: 0012_booking_locks
+Revises: 0011_booking_time_windows
+Create Date: 2026-10-17 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0012_booking_locks'
+down_revision = '0011_booking_time_windows'
+branch_labels = None
+depends_on = None
+
+
+# table -> (constraint name, resource column)
+EXCLUSION_CONSTRAINTS = {
+    'space_bookings': ('excl_space_bookings_no_overlap', 'space_id'),
+    'stock_bookings': ('excl_stock_bookings_no_overlap', 'item_id'),
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    if 'booking_locks' not in tables:
+        op.create_table(
+            'booking_locks',
+            sa.Column('resource_type', sa.String(), primary_key=True),
+            sa.Column('resource_id', sa.Integer(), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        )
+    if conn.dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for table, (name, resource) in EXCLUSION_CONSTRAINTS.items():
+        if table not in tables:
+            continue
+        # fails if the table already holds overlapping confirmed bookings; resolve those first
+        existing = conn.execute(sa.text('SELECT 1 FROM pg_constraint WHERE conname = :name'), {'name': name}).first()
+        if existing is None:
+            op.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist "
+                f"({resource} WITH =, tsrange(start_time, end_time) WITH &&) "
+                f"WHERE (status = 'Confirmed' AND start_time IS NOT NULL)"
+            )
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        for table, (name, _) in EXCLUSION_CONSTRAINTS.items():
+            op.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+    try:
+        op.drop_table('booking_locks')
+    except Exception:
+        pass
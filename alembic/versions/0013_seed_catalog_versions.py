@@ -0,0 +1,32 @@
+"""seed catalog_versions rows for every cached catalog
+
+Revision ID: 0013_seed_catalog_versions
+Revises: 0012_booking_locks
+Create Date: 2026-10-17 16:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0013_seed_catalog_versions'
+down_revision = '0012_booking_locks'
+branch_labels = None
+depends_on = None
+
+
+CATALOGS = ('ticket_types', 'activity_types', 'space_templates')
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'catalog_versions' not in sa.inspect(conn).get_table_names():
+        return
+    # 0009 only seeded ticket_types; without a row the first bumps race on the INSERT
+    existing = {name for (name,) in conn.execute(sa.text('SELECT name FROM catalog_versions'))}
+    for name in CATALOGS:
+        if name not in existing:
+            conn.execute(sa.text('INSERT INTO catalog_versions (name, version) VALUES (:name, 0)'), {'name': name})
+
+
+def downgrade():
+    pass
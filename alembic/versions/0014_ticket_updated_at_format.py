@@ -0,0 +1,27 @@
+"""store tickets.updated_at in one text format on SQLite
+
+Revision ID: 0014_ticket_updated_at_format
+Revises: 0013_seed_catalog_versions
+Create Date: 2026-10-17 18:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0014_ticket_updated_at_format'
+down_revision = '0013_seed_catalog_versions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'sqlite' or 'tickets' not in sa.inspect(conn).get_table_names():
+        return
+    # CURRENT_TIMESTAMP wrote 'YYYY-MM-DD HH:MM:SS'; keyset cursors bind 'YYYY-MM-DD HH:MM:SS.ffffff'
+    # and SQLite compares the two as strings
+    op.execute("UPDATE tickets SET updated_at = updated_at || '.000000' WHERE length(updated_at) = 19")
+
+
+def downgrade():
+    pass
@@ -0,0 +1,31 @@
+"""track each resource's longest booking on booking_locks
+
+Revision ID: 0015_booking_lock_max_duration
+Revises: 0014_ticket_updated_at_format
+Create Date: 2026-10-17 19:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015_booking_lock_max_duration'
+down_revision = '0014_ticket_updated_at_format'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'booking_locks' not in inspector.get_table_names():
+        return
+    if 'max_duration' not in {c['name'] for c in inspector.get_columns('booking_locks')}:
+        # left NULL: the next lock of each resource computes it from the bookings
+        op.add_column('booking_locks', sa.Column('max_duration', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    try:
+        op.drop_column('booking_locks', 'max_duration')
+    except Exception:
+        pass
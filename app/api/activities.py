@@ -1,14 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Body, Query
 from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import datetime, date, time
-from sqlalchemy import and_, or_
+from datetime import datetime
+from sqlalchemy import insert
 
 from app.core.database import get_db
 from app import models, schemas
 from app.core.security import get_current_user, get_current_user_bypass, require_role
 from app.core.config import settings
+from app.core.catalog import activity_type_catalog, bump_catalog_version, ACTIVITY_TYPES
+from app.core.custom_fields import EMPTY_FIELDS
+from app.core import bookings
+from app.core.recurrence import parse_rrule, expand
+from app.core.pagination import PageParams, paginate, schema_serializer, STREAM_CHUNK_SIZE
+from app.core.ical import render_activities
 import json
 
 router = APIRouter(prefix="/activities", tags=["activities"])
@@ -24,20 +32,7 @@ def create_category(payload: dict, db: Session = Depends(get_db)):
     return c
 
 
-@router.post('/types', dependencies=[Depends(require_role('admin'))])
-async def create_activity_type(request: Request, db: Session = Depends(get_db)):
-    # support JSON body or query params for backward compatibility
-    try:
-        payload = await request.json()
-        if not isinstance(payload, dict):
-            payload = {}
-    except Exception:
-        payload = {}
-    # fallback to query params if fields missing
-    qp = request.query_params
-    name = payload.get('name') or qp.get('name')
-    metadata = payload.get('metadata') or qp.get('metadata')
-    fields = payload.get('fields') or []
+def _create_activity_type(db: Session, name, metadata, fields):
     t = models.ActivityType(name=name, meta=metadata)
     db.add(t)
     db.flush()
@@ -50,6 +45,7 @@ async def create_activity_type(request: Request, db: Session = Depends(get_db)):
         db.add(af)
         db.flush()
         created_fields.append(af)
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     db.refresh(t)
     out_fields = []
@@ -61,20 +57,27 @@ async def create_activity_type(request: Request, db: Session = Depends(get_db)):
     return {'id': t.id, 'name': t.name, 'metadata': t.meta, 'fields': out_fields}
 
 
+@router.post('/types', dependencies=[Depends(require_role('admin'))])
+async def create_activity_type(request: Request, db: Session = Depends(get_db)):
+    # support JSON body or query params for backward compatibility
+    try:
+        payload = await request.json()
+        if not isinstance(payload, dict):
+            payload = {}
+    except Exception:
+        payload = {}
+    # fallback to query params if fields missing
+    qp = request.query_params
+    name = payload.get('name') or qp.get('name')
+    metadata = payload.get('metadata') or qp.get('metadata')
+    fields = payload.get('fields') or []
+    # the body is parsed on the event loop; the blocking Session work runs in the threadpool
+    return await run_in_threadpool(_create_activity_type, db, name, metadata, fields)
+
+
 @router.get('/types')
 def list_activity_types(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    tts = db.query(models.ActivityType).all()
-    out = []
-    for tt in tts:
-        frows = db.query(models.ActivityTypeField).filter(models.ActivityTypeField.activity_type_id == tt.id).all()
-        fields = []
-        for f in frows:
-            opts = None
-            if f.options:
-                opts = json.loads(f.options)
-            fields.append({'id': f.id, 'name': f.name, 'field_type': f.field_type, 'options': opts})
-        out.append({'id': tt.id, 'name': tt.name, 'metadata': tt.meta, 'fields': fields})
-    return out
+    return [e.out for e in activity_type_catalog.get(db).values()]
 
 
 @router.patch('/types/{type_id}', dependencies=[Depends(require_role('admin'))])
@@ -102,6 +105,7 @@ def update_activity_type(type_id: int, payload: dict, db: Session = Depends(get_
             db.add(af)
             db.flush()
             created_fields.append(af)
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     # build response
     frows = created_fields if created_fields else db.query(models.ActivityTypeField).filter(models.ActivityTypeField.activity_type_id == at.id).all()
@@ -129,6 +133,7 @@ def delete_activity_type(type_id: int, db: Session = Depends(get_db)):
         else:
             raise HTTPException(status_code=400, detail='Cannot delete ActivityType in use')
     db.delete(at)
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     return Response(status_code=204)
 
@@ -144,6 +149,7 @@ def create_activity_field(type_id: int, payload: dict, db: Session = Depends(get
         opts_json = json.dumps(payload.get('options'))
     af = models.ActivityTypeField(activity_type_id=type_id, name=payload.get('name'), field_type=payload.get('field_type'), options=opts_json)
     db.add(af)
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     db.refresh(af)
     opts = None
@@ -166,6 +172,7 @@ def update_activity_field(type_id: int, field_id: int, payload: dict, db: Sessio
         af.field_type = payload.get('field_type')
     if 'options' in payload:
         af.options = json.dumps(payload.get('options')) if payload.get('options') is not None else None
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     # cleanup values if necessary
     if payload.get('field_type') is not None and payload.get('field_type') != old_type:
@@ -194,6 +201,7 @@ def delete_activity_field(type_id: int, field_id: int, db: Session = Depends(get
     # delete related values
     db.query(models.ActivityFieldValue).filter(models.ActivityFieldValue.field_id == af.id).delete()
     db.delete(af)
+    bump_catalog_version(db, ACTIVITY_TYPES)
     db.commit()
     return Response(status_code=204)
 
@@ -208,84 +216,9 @@ def create_activity(payload: schemas.ActivityCreateRequest, db: Session = Depend
     created_field_values = []
     # persist custom field values if provided
     if getattr(payload, 'custom_fields', None):
-        # load field defs
-        frows = db.query(models.ActivityTypeField).filter(models.ActivityTypeField.activity_type_id == payload.activity_type_id).all() if payload.activity_type_id else []
-        field_defs = {f.id: f for f in frows}
-        for cf in payload.custom_fields:
-            field_id = cf.get('field_id')
-            value = cf.get('value')
-            if field_id:
-                fdef = field_defs.get(field_id)
-                if not fdef:
-                    raise HTTPException(status_code=400, detail=f'Unknown custom field id {field_id}')
-            else:
-                fdef = None
-                for fd in field_defs.values():
-                    if fd.name == cf.get('name'):
-                        fdef = fd
-                        break
-                if not fdef:
-                    raise HTTPException(status_code=400, detail=f'Unknown custom field name {cf.get("name")}')
-            # validate and normalize based on field type
-            ft = fdef.field_type if fdef and getattr(fdef, 'field_type', None) else 'text'
-            norm = None
-            if ft == 'select':
-                if fdef.options:
-                    opts = json.loads(fdef.options)
-                    if value not in opts:
-                        raise HTTPException(status_code=400, detail=f'Invalid option for field {fdef.name}')
-                norm = str(value) if value is not None else None
-            elif ft == 'space':
-                try:
-                    sid = int(value)
-                except Exception:
-                    raise HTTPException(status_code=400, detail=f'Invalid space id for field {fdef.name}')
-                sp = db.query(models.Space).filter(models.Space.id == sid).first()
-                if not sp:
-                    raise HTTPException(status_code=400, detail=f'Invalid space id for field {fdef.name}')
-                norm = str(sid)
-            elif ft == 'boolean':
-                if isinstance(value, bool):
-                    norm = 'true' if value else 'false'
-                elif isinstance(value, str):
-                    lv = value.strip().lower()
-                    if lv in ('true', '1', 'yes', 'y'):
-                        norm = 'true'
-                    elif lv in ('false', '0', 'no', 'n'):
-                        norm = 'false'
-                    else:
-                        raise HTTPException(status_code=400, detail=f'Invalid boolean value for field {fdef.name}')
-                else:
-                    raise HTTPException(status_code=400, detail=f'Invalid boolean value for field {fdef.name}')
-            elif ft == 'number':
-                try:
-                    # allow ints and floats
-                    _ = float(value)
-                    norm = str(value)
-                except Exception:
-                    raise HTTPException(status_code=400, detail=f'Invalid numeric value for field {fdef.name}')
-            elif ft == 'datetime':
-                try:
-                    dt = datetime.fromisoformat(value)
-                    norm = dt.isoformat()
-                except Exception:
-                    raise HTTPException(status_code=400, detail=f'Invalid datetime format for field {fdef.name}; expected ISO format')
-            elif ft == 'date':
-                try:
-                    d = date.fromisoformat(value)
-                    norm = d.isoformat()
-                except Exception:
-                    raise HTTPException(status_code=400, detail=f'Invalid date format for field {fdef.name}; expected YYYY-MM-DD')
-            elif ft == 'time':
-                try:
-                    t = time.fromisoformat(value)
-                    norm = t.isoformat()
-                except Exception:
-                    raise HTTPException(status_code=400, detail=f'Invalid time format for field {fdef.name}; expected HH:MM[:SS]')
-            else:
-                # treat as text
-                norm = str(value) if value is not None else None
-
+        entry = activity_type_catalog.get(db).get(payload.activity_type_id) if payload.activity_type_id else None
+        fields = entry.fields if entry else EMPTY_FIELDS
+        for fdef, norm in fields.validate(db, payload.custom_fields):
             afv = models.ActivityFieldValue(activity_id=a.id, field_id=fdef.id, value=norm)
             db.add(afv)
             created_field_values.append(afv)
@@ -299,6 +232,75 @@ def create_activity(payload: schemas.ActivityCreateRequest, db: Session = Depend
     return a
 
 
+@router.post('/recurring', response_model=schemas.RecurringActivityOut, dependencies=[Depends(get_current_user_bypass)])
+def create_recurring_activity(payload: schemas.RecurringActivityCreate, db: Session = Depends(get_db)):
+    """Create every occurrence of a recurrence rule, booking the given spaces and items.
+
+    All occurrences are checked against existing bookings in one pass and inserted in bulk
+    in a single transaction. Each occurrence gets a result: 201 with its activity id, 409
+    with the bookings it collides with, or 424 when an atomic request had a conflict.
+    """
+    if payload.end_time <= payload.start_time:
+        raise HTTPException(status_code=400, detail='end_time must be after start_time')
+    try:
+        windows = expand(parse_rrule(payload.rrule), payload.start_time, payload.end_time, settings.ACTIVITY_RECURRENCE_MAX_OCCURRENCES)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # BYDAY is matched in the caller's offset; from here on the times are the stored naive UTC
+    windows = [(bookings.naive_utc(start), bookings.naive_utc(end)) for start, end in windows]
+    if not windows:
+        raise HTTPException(status_code=400, detail='Recurrence yields no occurrences')
+    space_ids = list(dict.fromkeys(payload.space_ids))
+    item_ids = list(dict.fromkeys(payload.item_ids))
+    if space_ids and db.query(models.Space.id).filter(models.Space.id.in_(space_ids)).count() != len(space_ids):
+        raise HTTPException(status_code=404, detail='Space not found')
+    if item_ids and db.query(models.StockItem.id).filter(models.StockItem.id.in_(item_ids)).count() != len(item_ids):
+        raise HTTPException(status_code=404, detail='Item not found')
+    values = []
+    if payload.custom_fields:
+        entry = activity_type_catalog.get(db).get(payload.activity_type_id) if payload.activity_type_id else None
+        fields = entry.fields if entry else EMPTY_FIELDS
+        values = [(fdef.id, norm) for fdef, norm in fields.validate(db, payload.custom_fields)]
+
+    # serialized with other bookers of these resources until commit
+    bookings.lock_resources(db, spaces=space_ids, items=item_ids, duration=payload.end_time - payload.start_time)
+    conflicts = bookings.find_conflicts_for_windows(db, windows, spaces=space_ids, items=item_ids)
+    results = []
+    valid = []
+    for index, ((start, end), found) in enumerate(zip(windows, conflicts)):
+        result = schemas.RecurringOccurrenceResult(index=index, start_time=start, end_time=end, status_code=201)
+        results.append(result)
+        if found:
+            result.status_code, result.detail = 409, 'Conflicts with existing bookings'
+            result.conflicts = [schemas.BookingConflictOut(kind=c.kind, resource_id=c.resource_id, activity_id=c.activity_id) for c in found]
+        else:
+            valid.append(result)
+
+    failed = len(results) - len(valid)
+    if valid and not (payload.atomic and failed):
+        ids = db.execute(
+            insert(models.Activity).returning(models.Activity.id, sort_by_parameter_order=True),
+            [{'title': payload.title, 'category_id': payload.category_id, 'activity_type_id': payload.activity_type_id, 'organizer_user_id': payload.organizer_user_id, 'start_time': r.start_time, 'end_time': r.end_time} for r in valid],
+        ).scalars().all()
+        field_rows, space_rows, stock_rows = [], [], []
+        status = payload.booking_status or 'Confirmed'
+        for activity_id, result in zip(ids, valid):
+            result.activity_id = activity_id
+            window = {'activity_id': activity_id, 'status': status, 'start_time': result.start_time, 'end_time': result.end_time}
+            field_rows.extend({'activity_id': activity_id, 'field_id': fid, 'value': value} for fid, value in values)
+            space_rows.extend({**window, 'space_id': space_id} for space_id in space_ids)
+            stock_rows.extend({**window, 'item_id': item_id} for item_id in item_ids)
+        for model, rows in ((models.ActivityFieldValue, field_rows), (models.SpaceBooking, space_rows), (models.StockBooking, stock_rows)):
+            if rows:
+                db.execute(insert(model), rows)
+        db.commit()
+    elif valid:
+        for result in valid:
+            result.status_code, result.detail = 424, 'Not created: another occurrence in the atomic request has a conflict'
+    created = sum(1 for r in results if r.activity_id is not None)
+    return schemas.RecurringActivityOut(created=created, failed=len(results) - created, occurrences=results)
+
+
 @router.post('/{activity_id}/space_bookings')
 def book_space(activity_id: int, payload: Optional[schemas.SpaceBookingRequest] = Body(None), space_id: Optional[int] = Query(None), status: Optional[str] = Query(None), db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
     # Verify activity and space
@@ -314,17 +316,11 @@ def book_space(activity_id: int, payload: Optional[schemas.SpaceBookingRequest]
     space = db.query(models.Space).filter(models.Space.id == space_id).first()
     if not space:
         raise HTTPException(status_code=404, detail='Space not found')
-    # Check for conflicting confirmed bookings on the same space
-    overlapping = db.query(models.SpaceBooking).join(models.Activity, models.SpaceBooking.activity_id == models.Activity.id).filter(
-        models.SpaceBooking.space_id == space_id,
-        models.SpaceBooking.status == 'Confirmed',
-        models.Activity.start_time < activity.end_time,
-        models.Activity.end_time > activity.start_time
-    ).first()
-    if overlapping:
+    # serialized with other bookers of this space; refused if it overlaps a confirmed booking
+    try:
+        booking = bookings.reserve(db, activity, 'space', space_id, status=payload.status or 'Confirmed')
+    except bookings.BookingConflict:
         raise HTTPException(status_code=409, detail='Space already booked for this time range')
-    booking = models.SpaceBooking(activity_id=activity_id, space_id=space_id, status=payload.status or 'Confirmed')
-    db.add(booking)
     db.commit()
     db.refresh(booking)
     return booking
@@ -340,21 +336,42 @@ def book_stock(activity_id: int, payload: schemas.StockBookingRequest, db: Sessi
     if not item:
         raise HTTPException(status_code=404, detail='Item not found')
     # Check item not in use for overlapping confirmed bookings
-    overlapping = db.query(models.StockBooking).join(models.Activity, models.StockBooking.activity_id == models.Activity.id).filter(
-        models.StockBooking.item_id == item_id,
-        models.StockBooking.status == 'Confirmed',
-        models.Activity.start_time < activity.end_time,
-        models.Activity.end_time > activity.start_time
-    ).first()
-    if overlapping:
+    try:
+        booking = bookings.reserve(db, activity, 'stock', item_id, status=payload.status or 'Confirmed')
+    except bookings.BookingConflict:
         raise HTTPException(status_code=409, detail='Stock item already booked for this time range')
-    booking = models.StockBooking(activity_id=activity_id, item_id=item_id, status=payload.status or 'Confirmed')
-    db.add(booking)
     db.commit()
     db.refresh(booking)
     return booking
 
 
+def _activity_range_query(db: Session, start, end, organizer, space_id, building_id):
+    q = db.query(models.Activity)
+    if organizer:
+        q = q.filter(models.Activity.organizer_user_id == organizer)
+    # overlap with [start, end) as two range bounds, served by ix_activities_start_end
+    if end:
+        q = q.filter(models.Activity.start_time < bookings.naive_utc(end))
+    if start:
+        q = q.filter(models.Activity.end_time > bookings.naive_utc(start))
+    if space_id is not None or building_id is not None:
+        booked = db.query(models.SpaceBooking.activity_id)
+        if space_id is not None:
+            booked = booked.filter(models.SpaceBooking.space_id == space_id)
+        if building_id is not None:
+            booked = booked.filter(models.SpaceBooking.space_id.in_(db.query(models.Space.id).filter(models.Space.building_id == building_id)))
+        q = q.filter(models.Activity.id.in_(booked))
+    return q
+
+
+@router.get('/calendar.ics', dependencies=[Depends(get_current_user_bypass)])
+def activities_calendar(start: Optional[datetime] = None, end: Optional[datetime] = None, organizer: Optional[int] = None, space_id: Optional[int] = None, building_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """The activities of GET /activities/ as an iCalendar feed, streamed event by event."""
+    q = _activity_range_query(db, start, end, organizer, space_id, building_id)
+    rows = q.order_by(models.Activity.start_time, models.Activity.id).yield_per(STREAM_CHUNK_SIZE)
+    return StreamingResponse(render_activities(rows), media_type='text/calendar; charset=utf-8', headers={'Content-Disposition': 'inline; filename="activities.ics"'})
+
+
 # Full Activity CRUD
 @router.get('/{activity_id}', response_model=schemas.ActivityOut)
 def get_activity(activity_id: int, db: Session = Depends(get_db)):
@@ -374,22 +391,13 @@ def update_activity(activity_id: int, payload: schemas.ActivityUpdateRequest, db
     new_end = payload.end_time if payload.end_time is not None else act.end_time
     if new_end <= new_start:
         raise HTTPException(status_code=400, detail='end_time must be after start_time')
-    # check space booking conflicts if start/end changed
-    # get any confirmed space bookings for this activity
-    bookings = db.query(models.SpaceBooking).filter(models.SpaceBooking.activity_id == activity_id).all()
-    for b in bookings:
-        conflict = db.query(models.SpaceBooking).join(models.Activity, models.SpaceBooking.activity_id == models.Activity.id).filter(
-            models.SpaceBooking.space_id == b.space_id,
-            models.SpaceBooking.status == 'Confirmed',
-            models.SpaceBooking.activity_id != activity_id,
-            or_(
-                and_(models.Activity.start_time <= new_start, models.Activity.end_time > new_start),
-                and_(models.Activity.start_time < new_end, models.Activity.end_time >= new_end),
-                and_(models.Activity.start_time >= new_start, models.Activity.end_time <= new_end),
-            )
-        ).first()
-        if conflict:
-            raise HTTPException(status_code=400, detail='Space booking conflict with updated time range')
+    # check every space and stock item this activity holds against the new window
+    spaces, items = bookings.activity_resources(db, activity_id)
+    longest = bookings.lock_resources(db, spaces=spaces, items=items, duration=new_end - new_start)
+    conflicts = bookings.find_conflicts(db, new_start, new_end, spaces=spaces, items=items, exclude_activity_id=activity_id, longest=longest)
+    if conflicts:
+        kind = 'Space' if conflicts[0].kind == 'space' else 'Stock'
+        raise HTTPException(status_code=400, detail=f'{kind} booking conflict with updated time range')
     if payload.title is not None:
         act.title = payload.title
     if payload.category_id is not None:
@@ -398,6 +406,7 @@ def update_activity(activity_id: int, payload: schemas.ActivityUpdateRequest, db
         act.start_time = payload.start_time
     if payload.end_time is not None:
         act.end_time = payload.end_time
+    bookings.reschedule(db, activity_id, new_start, new_end)
     db.commit()
     db.refresh(act)
     return act
@@ -418,19 +427,11 @@ def delete_activity(activity_id: int, db: Session = Depends(get_db)):
     return Response(status_code=204)
 
 
-@router.get('/', response_model=List[schemas.ActivityOut])
-def list_activities(start: Optional[datetime] = None, end: Optional[datetime] = None, organizer: Optional[int] = None, db: Session = Depends(get_db)):
-    q = db.query(models.Activity)
-    if organizer:
-        q = q.filter(models.Activity.organizer_user_id == organizer)
-    if start and end:
-        q = q.filter(or_(
-            and_(models.Activity.start_time <= start, models.Activity.end_time > start),
-            and_(models.Activity.start_time < end, models.Activity.end_time >= end),
-            and_(models.Activity.start_time >= start, models.Activity.end_time <= end),
-        ))
-    elif start:
-        q = q.filter(models.Activity.end_time > start)
-    elif end:
-        q = q.filter(models.Activity.start_time < end)
-    return q.all()
+@router.get('/', response_model=List[schemas.ActivityOut], dependencies=[Depends(get_current_user_bypass)])
+def list_activities(response: Response, start: Optional[datetime] = None, end: Optional[datetime] = None, organizer: Optional[int] = None, space_id: Optional[int] = None, building_id: Optional[int] = None, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    """Activities overlapping [start, end), optionally booked in a space or building.
+
+    Ordered by start time; paged with limit/cursor like the other listings.
+    """
+    q = _activity_range_query(db, start, end, organizer, space_id, building_id)
+    return paginate(q, [models.Activity.start_time, models.Activity.id], page, schema_serializer(schemas.ActivityOut), response, key_types=[datetime, int])
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import io
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi import UploadFile, File
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, pool_metrics
+from app.core.cache import cache_stats
+from app.core.catalog import load_ticket_types, bump_catalog_version, activity_type_catalog, TICKET_TYPES
+from app.core.pagination import PageParams, paginate, schema_serializer
+from app.core.user_import import import_users
+from app.core.blobs import MIN_STRAY_AGE_SECONDS, collect_garbage, storage_report
 from app import models, schemas
-from app.core.security import require_role, get_current_user_bypass
+from app.core.security import require_role, get_current_user_bypass, invalidate_user_roles
 
 router = APIRouter(prefix='/admin', tags=['admin'])
 
@@ -55,28 +64,49 @@ def admin_ui_activity_types(db: Session = Depends(get_db), user=Depends(require_
 
 @router.get('/ui/activity_types/{type_id}', response_model=None)
 def admin_ui_activity_type_detail(type_id: int, db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    tt = db.query(models.ActivityType).filter(models.ActivityType.id == type_id).first()
-    if not tt:
+    entry = activity_type_catalog.get(db).get(type_id)
+    if not entry:
         raise HTTPException(status_code=404, detail='ActivityType not found')
-    html = [f'<html><head><title>Activity Type {tt.id}</title></head><body>']
-    html.append(f'<h1>Activity Type {tt.id} - {tt.name}</h1>')
-    html.append(f'<p>Metadata: {tt.meta or ""}</p>')
+    tt = entry.out
+    html = [f'<html><head><title>Activity Type {tt["id"]}</title></head><body>']
+    html.append(f'<h1>Activity Type {tt["id"]} - {tt["name"]}</h1>')
+    html.append(f'<p>Metadata: {tt["metadata"] or ""}</p>')
     # fields list
-    frows = db.query(models.ActivityTypeField).filter(models.ActivityTypeField.activity_type_id == tt.id).all()
     html.append('<h2>Fields</h2>')
     html.append('<ul>')
-    import json
-    for f in frows:
-        opts = ''
-        if f.options:
-            opts = json.loads(f.options)
-        html.append(f'<li>{f.id} - {f.name} ({f.field_type}) - options: {opts} - <a href="/admin/types/{tt.id}/fields/{f.id}">edit</a> - <a href="/activities/types/{tt.id}">json</a></li>')
+    for f in tt['fields']:
+        opts = f['options'] or ''
+        html.append(f'<li>{f["id"]} - {f["name"]} ({f["field_type"]}) - options: {opts} - <a href="/admin/types/{tt["id"]}/fields/{f["id"]}">edit</a> - <a href="/activities/types/{tt["id"]}">json</a></li>')
     html.append('</ul>')
-    html.append(f'<p><a href="/admin/types/{tt.id}/fields">Add field (json)</a></p>')
+    html.append(f'<p><a href="/admin/types/{tt["id"]}/fields">Add field (json)</a></p>')
     html.append('</body></html>')
     return '\n'.join(html)
 
 
+@router.get('/metrics/caches')
+def cache_metrics(user=Depends(require_role('admin'))):
+    # hit/miss counters for the in-process caches (per worker)
+    return cache_stats()
+
+
+@router.get('/metrics/db_pool')
+def db_pool_metrics(user=Depends(require_role('admin'))):
+    # connection pool usage of this worker's engine
+    return pool_metrics()
+
+
+@router.get('/attachments/storage')
+def attachment_storage_report(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    """Stored vs. logical attachment bytes, i.e. the space saved by deduplication."""
+    return storage_report(db)
+
+
+@router.post('/attachments/gc')
+def attachment_gc(min_age_seconds: float = Query(3600, ge=MIN_STRAY_AGE_SECONDS), dry_run: bool = False, db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    """Remove unreferenced attachment blobs and stray files from storage."""
+    return collect_garbage(db, min_age_seconds=min_age_seconds, dry_run=dry_run)
+
+
 @router.get('/roles')
 def list_roles(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
     return db.query(models.Role).all()
@@ -97,6 +127,7 @@ def assign_role(payload: schemas.UserRoleAssign, db: Session = Depends(get_db),
     ur = models.UserRole(user_id=payload.user_id, role_id=role.id)
     db.add(ur)
     db.commit()
+    invalidate_user_roles(payload.user_id)
     return {'status': 'assigned'}
 
 
@@ -110,6 +141,7 @@ def remove_role(payload: schemas.UserRoleAssign, db: Session = Depends(get_db),
         return {'status': 'not_assigned'}
     db.delete(ur)
     db.commit()
+    invalidate_user_roles(payload.user_id)
     return {'status': 'removed'}
 
 
@@ -139,6 +171,7 @@ def create_ticket_type(payload: schemas.TicketTypeCreate, db: Session = Depends(
             db.flush()
             created_fields.append(tf)
 
+    bump_catalog_version(db, TICKET_TYPES)
     db.commit()
     db.refresh(tt)
 
@@ -161,41 +194,15 @@ def create_ticket_type(payload: schemas.TicketTypeCreate, db: Session = Depends(
 
 @router.get('/ticket_types', response_model=list[schemas.TicketTypeOut])
 def list_ticket_types(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    tts = db.query(models.TicketType).all()
-    out = []
-    import json
-    for tt in tts:
-        # gather fields
-        frows = db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id == tt.id).all()
-        fields = []
-        for f in frows:
-            opts = None
-            if f.options:
-                opts = json.loads(f.options)
-            fields.append(schemas.TicketFieldOut(id=f.id, name=f.name, field_type=f.field_type, options=opts))
-        # gather allowed groups
-        agr = db.query(models.TicketTypeAllowedGroup).filter(models.TicketTypeAllowedGroup.ticket_type_id == tt.id).all()
-        allowed = [a.group_id for a in agr]
-        out.append(schemas.TicketTypeOut(id=tt.id, queue_id=tt.queue_id, name=tt.name, allowed_group_ids=allowed, fields=fields))
-    return out
+    return load_ticket_types(db)
 
 
 @router.get('/ticket_types/{ticket_type_id}', response_model=schemas.TicketTypeOut)
 def get_ticket_type(ticket_type_id: int, db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    tt = db.query(models.TicketType).filter(models.TicketType.id == ticket_type_id).first()
-    if not tt:
+    found = load_ticket_types(db, type_ids=[ticket_type_id])
+    if not found:
         raise HTTPException(status_code=404, detail='Ticket type not found')
-    import json
-    frows = db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id == tt.id).all()
-    fields = []
-    for f in frows:
-        opts = None
-        if f.options:
-            opts = json.loads(f.options)
-        fields.append(schemas.TicketFieldOut(id=f.id, name=f.name, field_type=f.field_type, options=opts))
-    agr = db.query(models.TicketTypeAllowedGroup).filter(models.TicketTypeAllowedGroup.ticket_type_id == tt.id).all()
-    allowed = [a.group_id for a in agr]
-    return schemas.TicketTypeOut(id=tt.id, queue_id=tt.queue_id, name=tt.name, allowed_group_ids=allowed, fields=fields)
+    return found[0]
 
 
 @router.put('/ticket_types/{ticket_type_id}', response_model=schemas.TicketTypeOut)
@@ -238,6 +245,7 @@ def update_ticket_type(ticket_type_id: int, payload: schemas.TicketTypeUpdate, d
             db.flush()
             created_fields.append(tf)
 
+    bump_catalog_version(db, TICKET_TYPES)
     db.commit()
     db.refresh(tt)
 
@@ -276,6 +284,7 @@ def delete_ticket_type(ticket_type_id: int, db: Session = Depends(get_db), user=
     db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id == tt.id).delete()
     db.query(models.TicketTypeAllowedGroup).filter(models.TicketTypeAllowedGroup.ticket_type_id == tt.id).delete()
     db.delete(tt)
+    bump_catalog_version(db, TICKET_TYPES)
     db.commit()
     return {'status': 'deleted'}
 
@@ -308,62 +317,14 @@ def get_user_roles(user_id: int, db: Session = Depends(get_db), user=Depends(req
 
 
 @router.post('/users/bulk')
-def bulk_create_users(file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+def bulk_create_users(file: UploadFile = File(...), batch_size: Optional[int] = Query(None, ge=1), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
     """Accepts a CSV file with columns: keycloak_id,email,first_name,last_name,dni,roles
     roles is optional and can be semicolon-separated role names.
     Returns per-row results.
     """
-    import csv
-    import io
-
-    content = file.file.read().decode('utf-8')
-    reader = csv.DictReader(io.StringIO(content))
-    results = []
-    for idx, row in enumerate(reader, start=1):
-        kc = row.get('keycloak_id')
-        if not kc:
-            results.append({'row': idx, 'status': 'error', 'message': 'missing keycloak_id'})
-            continue
-        # check existing
-        u = db.query(models.User).filter(models.User.keycloak_id == kc).first()
-        try:
-            if not u:
-                u = models.User(keycloak_id=kc, email=row.get('email'), first_name=row.get('first_name'), last_name=row.get('last_name'), dni=row.get('dni'))
-                db.add(u)
-                db.flush()
-                created = True
-            else:
-                # update basic fields if provided
-                if row.get('email'):
-                    u.email = row.get('email')
-                if row.get('first_name'):
-                    u.first_name = row.get('first_name')
-                if row.get('last_name'):
-                    u.last_name = row.get('last_name')
-                if row.get('dni'):
-                    u.dni = row.get('dni')
-                created = False
-
-            # handle roles column
-            roles_cell = row.get('roles') or ''
-            roles = [r.strip() for r in roles_cell.split(';') if r.strip()]
-            for rn in roles:
-                role = db.query(models.Role).filter(models.Role.name == rn).first()
-                if not role:
-                    role = models.Role(name=rn)
-                    db.add(role)
-                    db.flush()
-                ur = db.query(models.UserRole).filter(models.UserRole.user_id == u.id, models.UserRole.role_id == role.id).first()
-                if not ur:
-                    db.add(models.UserRole(user_id=u.id, role_id=role.id))
-
-            db.commit()
-            results.append({'row': idx, 'status': 'created' if created else 'updated', 'user_id': u.id})
-        except Exception as e:
-            db.rollback()
-            results.append({'row': idx, 'status': 'error', 'message': str(e)})
-
-    return {'results': results}
+    # decode the spooled upload as it is read instead of loading it whole
+    reader = csv.DictReader(io.TextIOWrapper(file.file, encoding='utf-8', newline=''))
+    return {'results': import_users(db, reader, batch_size)}
 
 
 @router.put('/users/{user_id}', response_model=schemas.UserBase)
@@ -403,6 +364,7 @@ def delete_user(user_id: int, db: Session = Depends(get_db), user=Depends(requir
     db.query(models.UserGroup).filter(models.UserGroup.user_id == user_id).delete()
     db.delete(u)
     db.commit()
+    invalidate_user_roles(user_id)
     return {'status': 'deleted'}
 
 
@@ -416,9 +378,8 @@ def create_group(payload: schemas.GroupCreate, db: Session = Depends(get_db), us
 
 
 @router.get('/groups', response_model=list[schemas.GroupOut])
-def list_groups(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    gs = db.query(models.Group).all()
-    return gs
+def list_groups(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    return paginate(db.query(models.Group), models.Group.id, page, schema_serializer(schemas.GroupOut), response)
 
 
 @router.post('/groups/{group_id}/users')
@@ -455,8 +416,8 @@ def create_queue(payload: schemas.QueueCreate, db: Session = Depends(get_db), us
 
 
 @router.get('/queues', response_model=list[schemas.QueueOut])
-def list_queues(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    return db.query(models.Queue).all()
+def list_queues(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    return paginate(db.query(models.Queue), models.Queue.id, page, schema_serializer(schemas.QueueOut), response)
 
 
 @router.put('/queues/{queue_id}', response_model=schemas.QueueOut)
@@ -487,26 +448,27 @@ def delete_queue(queue_id: int, db: Session = Depends(get_db), user=Depends(requ
     return {'status': 'deleted'}
 
 
+def _user_row(u):
+    return {'id': u.id, 'keycloak_id': u.keycloak_id, 'first_name': u.first_name, 'last_name': u.last_name, 'email': u.email}
+
+
 @router.get('/users')
-def list_users(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    # Return a lightweight JSON-friendly list to avoid Pydantic response validation errors
-    rows = db.query(models.User).all()
-    out = []
-    for u in rows:
-        out.append({'id': u.id, 'keycloak_id': u.keycloak_id, 'first_name': u.first_name, 'last_name': u.last_name, 'email': u.email})
-    return out
+def list_users(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    # Return a lightweight JSON-friendly list to avoid Pydantic response validation errors;
+    # only the listed columns are loaded
+    q = db.query(models.User.id, models.User.keycloak_id, models.User.first_name, models.User.last_name, models.User.email)
+    rows = paginate(q, models.User.id, page, _user_row, response)
+    return rows if isinstance(rows, Response) else [_user_row(u) for u in rows]
 
 
 @router.get('/agent_assignments', response_model=list[schemas.AgentAssignmentOut])
-def list_agent_assignments(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    a = db.query(models.AgentAssignment).all()
-    return a
+def list_agent_assignments(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    return paginate(db.query(models.AgentAssignment), models.AgentAssignment.id, page, schema_serializer(schemas.AgentAssignmentOut), response)
 
 
 @router.get('/queue_permissions', response_model=list[schemas.QueuePermissionOut])
-def list_queue_permissions(db: Session = Depends(get_db), user=Depends(require_role('admin'))):
-    q = db.query(models.QueuePermission).all()
-    return q
+def list_queue_permissions(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(require_role('admin'))):
+    return paginate(db.query(models.QueuePermission), models.QueuePermission.id, page, schema_serializer(schemas.QueuePermissionOut), response)
 
 
 @router.get('/groups/{group_id}/members', response_model=list[schemas.UserMinimalOut])
@@ -1,34 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Optional
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.core.security import get_current_user, get_current_user_bypass, require_role
+from app.core.database import get_async_db
+from app.core.security import get_current_user_async, require_role_async
 from app.core.movement import record_ticket_movement
+from app.core.pagination import keyset_page
 from app import models, schemas
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
 
 def require_agent_role():
-    return require_role('agent')
+    return require_role_async('agent')
 
 
-@router.get('/queues', dependencies=[Depends(require_agent_role())])
-def agent_queues(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+def _agent_queues(db: Session, user):
     assignments = db.query(models.AgentAssignment).filter(models.AgentAssignment.agent_user_id == user.id).all()
     queue_ids = [a.queue_id for a in assignments]
     queues = db.query(models.Queue).filter(models.Queue.id.in_(queue_ids)).all()
     return queues
 
 
-@router.get('/tickets', dependencies=[Depends(require_agent_role())])
-def agent_tickets(status: Optional[str] = None, priority: Optional[str] = None, unassigned: Optional[bool] = False, queue_id: Optional[int] = None, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.get('/queues', dependencies=[Depends(require_agent_role())])
+async def agent_queues(db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_agent_queues, user)
+
+
+# columns selectable through /agents/tickets?fields=
+TICKET_FIELDS = ('id', 'subject', 'description', 'status', 'priority', 'client_user_id', 'current_agent_id', 'current_queue_id', 'ticket_type_id', 'created_at', 'updated_at', 'resolved_at')
+
+
+def _agent_tickets(db: Session, status: Optional[str], priority: Optional[str], unassigned: Optional[bool], queue_id: Optional[int], user, limit: int = 100, cursor: Optional[str] = None, since: Optional[datetime] = None, fields: Optional[str] = None, order: str = 'desc'):
     assignments = db.query(models.AgentAssignment).filter(models.AgentAssignment.agent_user_id == user.id).all()
     queue_ids = [a.queue_id for a in assignments]
     if queue_id and queue_id not in queue_ids:
         raise HTTPException(status_code=403, detail='Not assigned to this queue')
-    q = db.query(models.Ticket).filter(models.Ticket.current_queue_id.in_(queue_ids))
+    selected = None
+    if fields:
+        selected = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in selected if f not in TICKET_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f'Unknown ticket fields: {", ".join(unknown)}')
+        # the sort keys are always loaded so the cursor can be built
+        cols = dict.fromkeys(selected + ['updated_at', 'id'])
+        q = db.query(*[getattr(models.Ticket, c) for c in cols])
+    else:
+        q = db.query(models.Ticket)
+    q = q.filter(models.Ticket.current_queue_id.in_(queue_ids))
     if status:
         q = q.filter(models.Ticket.status == status)
     if priority:
@@ -37,11 +58,30 @@ def agent_tickets(status: Optional[str] = None, priority: Optional[str] = None,
         q = q.filter(models.Ticket.current_agent_id == None)
     if queue_id:
         q = q.filter(models.Ticket.current_queue_id == queue_id)
-    return q.all()
+    if since:
+        # incremental refresh: only tickets changed after the client's last sync
+        q = q.filter(models.Ticket.updated_at > since)
+    rows, next_cursor = keyset_page(q, [models.Ticket.updated_at, models.Ticket.id], cursor, [datetime, int], limit, descending=(order == 'desc'))
+    if selected is not None:
+        rows = [{f: getattr(r, f) for f in selected} for r in rows]
+    return rows, next_cursor
 
 
-@router.post('/tickets/{ticket_id}/claim', dependencies=[Depends(require_agent_role())])
-def claim_ticket(ticket_id: int, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.get('/tickets', dependencies=[Depends(require_agent_role())])
+async def agent_tickets(response: Response, status: Optional[str] = None, priority: Optional[str] = None, unassigned: Optional[bool] = False, queue_id: Optional[int] = None, limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None, since: Optional[datetime] = None, fields: Optional[str] = None, order: str = Query('desc', pattern='^(asc|desc)$'), db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    """Tickets in the caller's queues, newest change first (order=asc for oldest first).
+
+    Pages are keyset-ordered on (updated_at, id): pass the `X-Next-Cursor` response header
+    back as `cursor` for the next page. `since` limits to tickets updated after that
+    instant and `fields` (comma-separated) projects the returned columns.
+    """
+    rows, next_cursor = await db.run_sync(_agent_tickets, status, priority, unassigned, queue_id, user, limit, cursor, since, fields, order)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return rows
+
+
+def _claim_ticket(db: Session, ticket_id: int, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).with_for_update(of=models.Ticket).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
@@ -60,8 +100,12 @@ def claim_ticket(ticket_id: int, db: Session = Depends(get_db), user=Depends(get
     return ticket
 
 
-@router.post('/tickets/{ticket_id}/assign', dependencies=[Depends(require_agent_role())])
-def assign_ticket(ticket_id: int, payload: schemas.AgentAssignRequest, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.post('/tickets/{ticket_id}/claim', dependencies=[Depends(require_agent_role())])
+async def claim_ticket(ticket_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_claim_ticket, ticket_id, user)
+
+
+def _assign_ticket(db: Session, ticket_id: int, payload: schemas.AgentAssignRequest, user):
     target_agent_id = payload.target_agent_id
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).with_for_update(of=models.Ticket).first()
     if not ticket:
@@ -89,8 +133,12 @@ def assign_ticket(ticket_id: int, payload: schemas.AgentAssignRequest, db: Sessi
     return ticket
 
 
-@router.post('/tickets/{ticket_id}/transfer', dependencies=[Depends(require_agent_role())])
-def transfer_ticket(ticket_id: int, payload: schemas.TicketTransferRequest, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.post('/tickets/{ticket_id}/assign', dependencies=[Depends(require_agent_role())])
+async def assign_ticket(ticket_id: int, payload: schemas.AgentAssignRequest, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_assign_ticket, ticket_id, payload, user)
+
+
+def _transfer_ticket(db: Session, ticket_id: int, payload: schemas.TicketTransferRequest, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).with_for_update(of=models.Ticket).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
@@ -115,8 +163,12 @@ def transfer_ticket(ticket_id: int, payload: schemas.TicketTransferRequest, db:
     return ticket
 
 
-@router.patch('/tickets/{ticket_id}/status', dependencies=[Depends(require_agent_role())])
-def change_status(ticket_id: int, payload: schemas.AgentStatusChangeRequest, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.post('/tickets/{ticket_id}/transfer', dependencies=[Depends(require_agent_role())])
+async def transfer_ticket(ticket_id: int, payload: schemas.TicketTransferRequest, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_transfer_ticket, ticket_id, payload, user)
+
+
+def _change_status(db: Session, ticket_id: int, payload: schemas.AgentStatusChangeRequest, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).with_for_update(of=models.Ticket).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
@@ -135,8 +187,12 @@ def change_status(ticket_id: int, payload: schemas.AgentStatusChangeRequest, db:
     return ticket
 
 
-@router.post('/tickets/{ticket_id}/comments', dependencies=[Depends(require_agent_role())])
-def post_comment(ticket_id: int, payload: schemas.AgentCommentRequest, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+@router.patch('/tickets/{ticket_id}/status', dependencies=[Depends(require_agent_role())])
+async def change_status(ticket_id: int, payload: schemas.AgentStatusChangeRequest, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_change_status, ticket_id, payload, user)
+
+
+def _post_comment(db: Session, ticket_id: int, payload: schemas.AgentCommentRequest, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
@@ -151,3 +207,8 @@ def post_comment(ticket_id: int, payload: schemas.AgentCommentRequest, db: Sessi
     db.commit()
     db.refresh(comment)
     return comment
+
+
+@router.post('/tickets/{ticket_id}/comments', dependencies=[Depends(require_agent_role())])
+async def post_comment(ticket_id: int, payload: schemas.AgentCommentRequest, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_post_comment, ticket_id, payload, user)
@@ -1,23 +1,70 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+import os
+
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.core.storage import storage
-from app.core.security import get_current_user, get_current_user_bypass
-from app import models
+from app.core.storage import UploadTooLarge
+from app.core.blobs import store_blob
+from app.core.security import get_current_user, get_current_user_bypass, authorize_ticket_view
+from app import models, schemas
 
 router = APIRouter(prefix="/attachments", tags=["attachments"])
 
 
-@router.post('/upload')
+@router.post('/upload', response_model=schemas.AttachmentOut)
 def upload_attachment(ticket_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
-    # Save file to local storage
-    path = storage.save(file.file, file.filename)
-    attachment = models.Attachment(ticket_id=ticket_id, file_name=file.filename, file_path=path, uploader_user_id=user.id)
+    # Stream the upload into storage; identical content shares one stored blob
+    try:
+        blob = store_blob(db, file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    attachment = models.Attachment(ticket_id=ticket_id, file_name=file.filename, file_path=blob.path, uploader_user_id=user.id, blob_id=blob.id)
     db.add(attachment)
     db.commit()
     db.refresh(attachment)
-    return attachment
+    u = db.query(models.User).filter(models.User.id == user.id).first()
+    uploader = {'id': u.id, 'keycloak_id': u.keycloak_id, 'first_name': u.first_name, 'last_name': u.last_name, 'email': u.email} if u else None
+    return schemas.AttachmentOut(id=attachment.id, ticket_id=attachment.ticket_id, comment_id=attachment.comment_id, file_name=attachment.file_name, download_url=f'/attachments/{attachment.id}', uploader=uploader)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" matches "x"
+    candidates = [t.strip() for t in if_none_match.split(',')]
+    return '*' in candidates or any(t.removeprefix('W/') == etag for t in candidates)
+
+
+@router.get('/{attachment_id}')
+def download_attachment(attachment_id: int, request: Request, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+    """Serve an attachment to whoever may view its ticket's history.
+
+    Deduplicated attachments carry a strong ETag (the content SHA-256), so revalidation
+    with If-None-Match answers 304; FileResponse handles Range/If-Range for resumed
+    downloads and uses the ASGI pathsend extension for zero-copy where the server has it.
+    """
+    attachment = db.query(models.Attachment).filter(models.Attachment.id == attachment_id).first()
+    if not attachment:
+        raise HTTPException(status_code=404, detail='Attachment not found')
+    ticket = db.query(models.Ticket).filter(models.Ticket.id == attachment.ticket_id).first()
+    if not ticket:
+        raise HTTPException(status_code=404, detail='Ticket not found')
+    authorize_ticket_view(db, ticket, user, detail='Not authorized to download this attachment')
+
+    blob = db.query(models.AttachmentBlob).filter(models.AttachmentBlob.id == attachment.blob_id).first() if attachment.blob_id else None
+    path = blob.path if blob else attachment.file_path
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail='Attachment file missing')
+
+    # private: attachments are per-user authorized, so shared caches must not keep them
+    headers = {'Cache-Control': 'private, no-cache'}
+    if blob:
+        etag = f'"{blob.sha256}"'
+        headers['ETag'] = etag
+        inm = request.headers.get('if-none-match')
+        if inm and _etag_matches(inm, etag):
+            return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=attachment.file_name, headers=headers)
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, Query
+from typing import List, Optional
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
@@ -7,13 +8,16 @@ from app import models
 from app import schemas
 from app.core.security import get_current_user_bypass, require_role
 from app.core.config import settings
+from app.core.pagination import PageParams, paginate, schema_serializer
+from app.core.catalog import space_template_catalog, bump_catalog_version, SPACE_TEMPLATES
+from app.core.bookings import free_slots, naive_utc
 
 router = APIRouter(prefix="/logistics", tags=["logistics"])
 
 
 @router.get('/buildings', response_model=List[schemas.BuildingOut])
-def list_buildings(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    return db.query(models.Building).all()
+def list_buildings(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+    return paginate(db.query(models.Building), models.Building.id, page, schema_serializer(schemas.BuildingOut), response)
 
 
 @router.post('/buildings', response_model=schemas.BuildingOut, dependencies=[Depends(require_role('admin'))])
@@ -113,8 +117,8 @@ def delete_space(space_id: int, db: Session = Depends(get_db)):
 
 
 @router.get('/stock_items', response_model=List[schemas.StockItemOut])
-def list_items(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    return db.query(models.StockItem).all()
+def list_items(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+    return paginate(db.query(models.StockItem), models.StockItem.id, page, schema_serializer(schemas.StockItemOut), response)
 
 
 @router.post('/stock_items', response_model=schemas.StockItemOut, dependencies=[Depends(require_role('admin'))])
@@ -126,6 +130,63 @@ def create_item(i: schemas.StockItemCreate, db: Session = Depends(get_db)):
     return item
 
 
+@router.get('/availability', response_model=schemas.AvailabilityOut)
+def availability(
+    start: datetime,
+    end: datetime,
+    resource: str = Query('space', pattern='^(space|stock)$'),
+    min_capacity: Optional[int] = Query(None, ge=0),
+    template: Optional[int] = None,
+    building_id: Optional[int] = None,
+    stock_type_id: Optional[int] = None,
+    min_free_minutes: Optional[int] = Query(None, ge=1),
+    fully_free: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user_bypass),
+):
+    """Spaces or stock items with free time in [start, end), and their free slots.
+
+    Resources without a free slot (of at least min_free_minutes) are left out; with
+    fully_free only those free for the whole window are returned.
+    """
+    start, end = naive_utc(start), naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail='end must be after start')
+    if resource == 'space':
+        if stock_type_id is not None:
+            raise HTTPException(status_code=400, detail='stock_type_id applies to stock items only')
+        q = db.query(models.Space)
+        if min_capacity is not None:
+            q = q.filter(models.Space.capacity >= min_capacity)
+        if template is not None:
+            q = q.filter(models.Space.space_template_id == template)
+        if building_id is not None:
+            q = q.filter(models.Space.building_id == building_id)
+        # smallest room that fits first
+        candidates = q.order_by(models.Space.capacity, models.Space.id).all()
+        describe = lambda s: {'id': s.id, 'name': s.name, 'building_id': s.building_id, 'capacity': s.capacity, 'space_template_id': s.space_template_id}
+        kind = 'space'
+    else:
+        if min_capacity is not None or template is not None or building_id is not None:
+            raise HTTPException(status_code=400, detail='min_capacity, template and building_id apply to spaces only')
+        q = db.query(models.StockItem).filter(models.StockItem.status == 'Available')
+        if stock_type_id is not None:
+            q = q.filter(models.StockItem.stock_type_id == stock_type_id)
+        candidates = q.order_by(models.StockItem.id).all()
+        describe = lambda i: {'id': i.id, 'name': i.name}
+        kind = 'stock'
+    min_length = timedelta(minutes=min_free_minutes) if min_free_minutes else None
+    slots = free_slots(db, kind, [c.id for c in candidates], start, end, min_length=min_length)
+    out = []
+    for c in candidates:
+        free = slots[c.id]
+        whole = free == [(start, end)]
+        if not free or (fully_free and not whole):
+            continue
+        out.append({**describe(c), 'fully_free': whole, 'free_slots': [{'start': s, 'end': e} for s, e in free]})
+    return {'resource_type': resource, 'start': start, 'end': end, 'resources': out}
+
+
 # --- Types management ---
 @router.post('/space_types', dependencies=[Depends(require_role('admin'))])
 def create_space_type(name: str, metadata: str = None, db: Session = Depends(get_db)):
@@ -235,6 +296,7 @@ def create_space_template(payload: dict, db: Session = Depends(get_db)):
         db.add(sf)
         db.flush()
         created_fields.append(sf)
+    bump_catalog_version(db, SPACE_TEMPLATES)
     db.commit()
     db.refresh(st)
     out_fields = []
@@ -249,19 +311,7 @@ def create_space_template(payload: dict, db: Session = Depends(get_db)):
 
 @router.get('/space_templates')
 def list_space_templates(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    tts = db.query(models.SpaceTemplate).all()
-    out = []
-    import json as _json
-    for tt in tts:
-        frows = db.query(models.SpaceTemplateField).filter(models.SpaceTemplateField.space_template_id == tt.id).all()
-        fields = []
-        for f in frows:
-            opts = None
-            if f.options:
-                opts = _json.loads(f.options)
-            fields.append({'id': f.id, 'name': f.name, 'field_type': f.field_type, 'options': opts})
-        out.append({'id': tt.id, 'name': tt.name, 'description': tt.description, 'fields': fields})
-    return out
+    return list(space_template_catalog.get(db).values())
 
 
 @router.patch('/space_templates/{template_id}', dependencies=[Depends(require_role('admin'))])
@@ -288,6 +338,7 @@ def update_space_template(template_id: int, payload: dict, db: Session = Depends
             db.add(sf)
             db.flush()
             created_fields.append(sf)
+    bump_catalog_version(db, SPACE_TEMPLATES)
     db.commit()
     db.refresh(st)
     # build response
@@ -313,5 +364,6 @@ def delete_space_template(template_id: int, db: Session = Depends(get_db)):
     # delete fields
     db.query(models.SpaceTemplateField).filter(models.SpaceTemplateField.space_template_id == st.id).delete()
     db.delete(st)
+    bump_catalog_version(db, SPACE_TEMPLATES)
     db.commit()
     return Response(status_code=204)
@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+import json
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app import models
 from app import schemas
-from app.core.security import get_current_user, get_current_user_bypass
+from app.core.config import settings
+from app.core.security import get_current_user_async, authorize_ticket_view
 from app.core.movement import record_ticket_movement
+from app.core.catalog import ticket_type_catalog
+from app.core.custom_fields import EMPTY_FIELDS
+from app.core.pagination import PageParams, paginate_async, schema_serializer
 
 router = APIRouter(prefix="/tickets", tags=["tickets"])
 
 
-@router.post('/', response_model=schemas.TicketOut)
-def create_ticket(payload: schemas.TicketCreate, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+def _create_ticket(db: Session, payload: schemas.TicketCreate, user):
     # Verify queue exists
     queue = db.query(models.Queue).filter(models.Queue.id == payload.queue_id).first()
     if not queue:
@@ -38,58 +44,20 @@ def create_ticket(payload: schemas.TicketCreate, db: Session = Depends(get_db),
     db.flush()
 
     # If a ticket type with allowed groups is set, ensure user belongs to allowed groups
+    tt = None
     if payload.ticket_type_id:
-        tt = db.query(models.TicketType).filter(models.TicketType.id == payload.ticket_type_id).first()
+        tt = ticket_type_catalog.get(db).get(payload.ticket_type_id)
         if not tt:
             raise HTTPException(status_code=404, detail='Ticket type not found')
-        allowed = db.query(models.TicketTypeAllowedGroup).filter(models.TicketTypeAllowedGroup.ticket_type_id == tt.id).all()
-        if allowed:
-            allowed_group_ids = [a.group_id for a in allowed]
-            # ensure intersection
-            if not set(allowed_group_ids).intersection(set(group_ids)):
-                raise HTTPException(status_code=403, detail='User groups not allowed to create this ticket type')
+        if not tt.allows(group_ids):
+            raise HTTPException(status_code=403, detail='User groups not allowed to create this ticket type')
 
     # Persist custom field values if provided
     created_field_values = []
     if payload.custom_fields:
-        # load field defs
-        field_defs = {}
-        frows = db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id == payload.ticket_type_id).all() if payload.ticket_type_id else []
-        for f in frows:
-            field_defs[f.id] = f
-
-        import json
-        for cf in payload.custom_fields:
-            # expect dict with either 'field_id' or 'name'
-            field_id = cf.get('field_id')
-            value = cf.get('value')
-            if field_id:
-                fdef = field_defs.get(field_id)
-                if not fdef:
-                    raise HTTPException(status_code=400, detail=f'Unknown custom field id {field_id}')
-            else:
-                # try match by name
-                fdef = None
-                for fd in field_defs.values():
-                    if fd.name == cf.get('name'):
-                        fdef = fd
-                        break
-                if not fdef:
-                    raise HTTPException(status_code=400, detail=f'Unknown custom field name {cf.get("name")}')
-
-            # validate based on type
-            if fdef.field_type == 'select' and fdef.options:
-                opts = json.loads(fdef.options)
-                if value not in opts:
-                    raise HTTPException(status_code=400, detail=f'Invalid option for field {fdef.name}')
-            if fdef.field_type == 'space':
-                # ensure space exists
-                sid = int(value)
-                sp = db.query(models.Space).filter(models.Space.id == sid).first()
-                if not sp:
-                    raise HTTPException(status_code=400, detail=f'Invalid space id for field {fdef.name}')
-
-            tfv = models.TicketFieldValue(ticket_id=ticket.id, field_id=fdef.id, value=str(value) if value is not None else None)
+        fields = tt.fields if tt else EMPTY_FIELDS
+        for fdef, value in fields.validate(db, payload.custom_fields, typed=False):
+            tfv = models.TicketFieldValue(ticket_id=ticket.id, field_id=fdef.id, value=value)
             db.add(tfv)
             created_field_values.append(tfv)
     record_ticket_movement(db, ticket, user.id, 'CREATE', {'queue_id': payload.queue_id})
@@ -106,14 +74,122 @@ def create_ticket(payload: schemas.TicketCreate, db: Session = Depends(get_db),
     return resp
 
 
+@router.post('/', response_model=schemas.TicketOut)
+async def create_ticket(payload: schemas.TicketCreate, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_create_ticket, payload, user)
+
+
+def _create_tickets_batch(db: Session, payload: schemas.TicketBatchCreate, user):
+    items = payload.tickets
+    if len(items) > settings.TICKET_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f'At most {settings.TICKET_BATCH_MAX_SIZE} tickets per batch')
+
+    # everything _create_ticket checks per call is loaded once for the whole batch
+    group_ids = {g for (g,) in db.query(models.UserGroup.group_id).filter(models.UserGroup.user_id == user.id)}
+    queue_ids = {t.queue_id for t in items}
+    existing_queues = {q for (q,) in db.query(models.Queue.id).filter(models.Queue.id.in_(queue_ids))}
+    permitted_queues = set()
+    if group_ids:
+        permitted_queues = {q for (q,) in db.query(models.QueuePermission.queue_id).filter(models.QueuePermission.queue_id.in_(queue_ids), models.QueuePermission.group_id.in_(group_ids))}
+    catalog = ticket_type_catalog.get(db) if any(t.ticket_type_id for t in items) else {}
+
+    checked = {}
+
+    def check(queue_id, type_id):
+        # same order and messages as _create_ticket; returns the type entry or raises
+        if queue_id not in existing_queues:
+            raise HTTPException(status_code=404, detail='Queue not found')
+        if not group_ids:
+            raise HTTPException(status_code=403, detail='User does not belong to any group allowed to create tickets')
+        if queue_id not in permitted_queues:
+            raise HTTPException(status_code=403, detail='User groups lack permission to post in this queue')
+        if not type_id:
+            return None
+        tt = catalog.get(type_id)
+        if not tt:
+            raise HTTPException(status_code=404, detail='Ticket type not found')
+        if not tt.allows(group_ids):
+            raise HTTPException(status_code=403, detail='User groups not allowed to create this ticket type')
+        return tt
+
+    results = []
+    valid = []  # (result, item, [(field_id, value)])
+    for index, item in enumerate(items):
+        result = schemas.TicketBatchItemResult(index=index, status_code=201)
+        results.append(result)
+        try:
+            key = (item.queue_id, item.ticket_type_id)
+            if key not in checked:
+                try:
+                    checked[key] = check(*key)
+                except HTTPException as exc:
+                    checked[key] = exc
+            tt = checked[key]
+            if isinstance(tt, HTTPException):
+                raise tt
+            values = []
+            if item.custom_fields:
+                fields = tt.fields if tt else EMPTY_FIELDS
+                values = [(fdef.id, value) for fdef, value in fields.validate(db, item.custom_fields, typed=False)]
+        except HTTPException as exc:
+            result.status_code, result.detail = exc.status_code, exc.detail
+            continue
+        valid.append((result, item, values))
+
+    failed = len(items) - len(valid)
+    if valid and not (payload.atomic and failed):
+        ids = db.execute(
+            insert(models.Ticket).returning(models.Ticket.id, sort_by_parameter_order=True),
+            [{'subject': item.subject, 'description': item.description, 'client_user_id': user.id, 'current_queue_id': item.queue_id, 'ticket_type_id': item.ticket_type_id} for _, item, _ in valid],
+        ).scalars().all()
+        field_rows = []
+        log_rows = []
+        for ticket_id, (result, item, values) in zip(ids, valid):
+            result.ticket_id = ticket_id
+            field_rows.extend({'ticket_id': ticket_id, 'field_id': fid, 'value': value} for fid, value in values)
+            log_rows.append({'ticket_id': ticket_id, 'action_user_id': user.id, 'action_type': 'CREATE', 'details': json.dumps({'queue_id': item.queue_id})})
+        if field_rows:
+            db.execute(insert(models.TicketFieldValue), field_rows)
+        db.execute(insert(models.TicketMovementLog), log_rows)
+        db.commit()
+    elif valid:
+        for result, _, _ in valid:
+            result.status_code, result.detail = 424, 'Not created: another item in the atomic batch failed'
+    created = sum(1 for r in results if r.ticket_id is not None)
+    return schemas.TicketBatchOut(created=created, failed=len(items) - created, results=results)
+
+
+@router.post('/batch', response_model=schemas.TicketBatchOut)
+async def create_tickets_batch(payload: schemas.TicketBatchCreate, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    """Create many tickets in one transaction.
+
+    Permissions are checked once per (queue, ticket type) and rows are bulk inserted.
+    Each item gets a result with its index, the new ticket id (status 201) or the
+    status/detail that POST /tickets/ would have returned for it.
+    """
+    return await db.run_sync(_create_tickets_batch, payload, user)
+
+
 @router.get('/me', response_model=List[schemas.TicketOut])
-def my_tickets(db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    tickets = db.query(models.Ticket).filter(models.Ticket.client_user_id == user.id).all()
-    return tickets
+async def my_tickets(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    def query(s: Session):
+        return s.query(models.Ticket).filter(models.Ticket.client_user_id == user.id)
+    return await paginate_async(db, query, models.Ticket.id, page, schema_serializer(schemas.TicketOut), response)
 
 
-@router.get('/{ticket_id}', response_model=schemas.TicketOut)
-def get_ticket(ticket_id: int, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+def _list_ticket_types_for_user(db: Session, queue_id: int | None, user):
+    group_ids = {g for (g,) in db.query(models.UserGroup.group_id).filter(models.UserGroup.user_id == user.id)}
+    entries = ticket_type_catalog.get(db).values()
+    return [e.out for e in entries if (queue_id is None or e.out.queue_id == queue_id) and e.allows(group_ids)]
+
+
+# declared before /{ticket_id} so 'types' is not parsed as a ticket id
+@router.get('/types', response_model=List[schemas.TicketTypeOut])
+async def list_ticket_types_for_user(queue_id: int | None = None, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_list_ticket_types_for_user, queue_id, user)
+
+
+def _get_ticket(db: Session, ticket_id: int, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
@@ -123,58 +199,18 @@ def get_ticket(ticket_id: int, db: Session = Depends(get_db), user=Depends(get_c
     return ticket
 
 
-
-@router.get('/types', response_model=List[schemas.TicketTypeOut])
-def list_ticket_types_for_user(queue_id: int | None = None, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
-    # get user's groups
-    user_groups = db.query(models.UserGroup).filter(models.UserGroup.user_id == user.id).all()
-    group_ids = [g.group_id for g in user_groups]
-
-    q = db.query(models.TicketType)
-    if queue_id is not None:
-        q = q.filter(models.TicketType.queue_id == queue_id)
-    tts = q.all()
-
-    result = []
-    import json
-    for tt in tts:
-        # check allowed groups
-        allowed_rows = db.query(models.TicketTypeAllowedGroup).filter(models.TicketTypeAllowedGroup.ticket_type_id == tt.id).all()
-        if allowed_rows:
-            allowed_ids = [a.group_id for a in allowed_rows]
-            if not set(allowed_ids).intersection(set(group_ids)):
-                # skip ticket types user isn't allowed to create
-                continue
-
-        # include fields
-        frows = db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id == tt.id).all()
-        fields = []
-        for f in frows:
-            opts = None
-            if f.options:
-                opts = json.loads(f.options)
-            fields.append(schemas.TicketFieldOut(id=f.id, name=f.name, field_type=f.field_type, options=opts))
-
-        # allowed group ids
-        allowed = [a.group_id for a in allowed_rows]
-        result.append(schemas.TicketTypeOut(id=tt.id, queue_id=tt.queue_id, name=tt.name, allowed_group_ids=allowed, fields=fields))
-
-    return result
-
+@router.get('/{ticket_id}', response_model=schemas.TicketOut)
+async def get_ticket(ticket_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_get_ticket, ticket_id, user)
 
 
-@router.get('/{ticket_id}/history', response_model=schemas.TicketHistoryOut)
-def ticket_history(ticket_id: int, db: Session = Depends(get_db), user=Depends(get_current_user_bypass)):
+def _ticket_history(db: Session, ticket_id: int, user):
     ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail='Ticket not found')
 
     # Authorization: allow ticket creator, assigned agent for the queue, or admin
-    if ticket.client_user_id != user.id:
-        # check agent assignment for user's agent assignments
-        is_agent_assigned = db.query(models.AgentAssignment).filter(models.AgentAssignment.agent_user_id == user.id, models.AgentAssignment.queue_id == ticket.current_queue_id).first()
-        if not is_agent_assigned and 'admin' not in getattr(user, 'roles', []):
-            raise HTTPException(status_code=403, detail='Not authorized to view this ticket history')
+    authorize_ticket_view(db, ticket, user)
 
     # movements
     mrows = db.query(models.TicketMovementLog).filter(models.TicketMovementLog.ticket_id == ticket.id).order_by(models.TicketMovementLog.timestamp.asc()).all()
@@ -213,6 +249,11 @@ def ticket_history(ticket_id: int, db: Session = Depends(get_db), user=Depends(g
 
     attachments = []
     for a in arows:
-        attachments.append(schemas.AttachmentOut(id=a.id, ticket_id=a.ticket_id, comment_id=a.comment_id, file_name=a.file_name, file_path=a.file_path, uploader=user_map.get(a.uploader_user_id)))
+        attachments.append(schemas.AttachmentOut(id=a.id, ticket_id=a.ticket_id, comment_id=a.comment_id, file_name=a.file_name, download_url=f'/attachments/{a.id}', uploader=user_map.get(a.uploader_user_id)))
 
     return schemas.TicketHistoryOut(ticket_id=ticket.id, movements=movements, comments=comments, attachments=attachments)
+
+
+@router.get('/{ticket_id}/history', response_model=schemas.TicketHistoryOut)
+async def ticket_history(ticket_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
+    return await db.run_sync(_ticket_history, ticket_id, user)
@@ -0,0 +1,160 @@
+"""Deduplicated attachment storage.
+
+Every distinct upload is stored once (LocalStorage is content-addressed) and recorded as
+an AttachmentBlob with a reference count; Attachment rows point at their blob. Counts are
+taken when a blob is handed out by store_blob() and released when an Attachment row is
+deleted, both inside the caller's transaction.
+
+The write on a blob's row (the claim) is also what orders uploads against the collector:
+store_blob() only moves content to its path after claiming the row, and
+collect_garbage() deletes the row and unlinks the file before releasing it.
+"""
+import os
+import time
+from typing import IO, Optional
+
+from sqlalchemy import event, exists, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.storage import storage
+
+# stray files younger than this may belong to an upload that has not committed yet
+MIN_STRAY_AGE_SECONDS = 300
+
+
+def store_blob(db: Session, file_obj: IO, filename: Optional[str] = None) -> models.AttachmentBlob:
+    """Stream an upload into storage and return its blob with one reference taken.
+
+    The caller must attach the blob to an Attachment in the same transaction; if that
+    transaction rolls back the reference is rolled back with it.
+    """
+    staged = storage.stage(file_obj)
+    blob_table = models.AttachmentBlob.__table__
+    try:
+        # claim first: a blob with a live reference is never collected
+        claimed = db.execute(
+            update(blob_table).where(blob_table.c.sha256 == staged.sha256).values(ref_count=blob_table.c.ref_count + 1)
+        ).rowcount
+        if not claimed:
+            try:
+                with db.begin_nested():
+                    db.add(models.AttachmentBlob(sha256=staged.sha256, size=staged.size, path=storage.path_for(staged.sha256), ref_count=1))
+            except IntegrityError:
+                # a concurrent upload of the same content created it first
+                db.execute(update(blob_table).where(blob_table.c.sha256 == staged.sha256).values(ref_count=blob_table.c.ref_count + 1))
+    except BaseException:
+        storage.discard(staged)
+        raise
+    # (re)publish under the claim, in case the collector unlinked the content meanwhile
+    storage.publish(staged)
+    blob = db.query(models.AttachmentBlob).filter(models.AttachmentBlob.sha256 == staged.sha256).one()
+    db.refresh(blob)
+    return blob
+
+
+@event.listens_for(models.Attachment, 'after_delete')
+def _release_blob(mapper, connection, target):
+    if target.blob_id is not None:
+        blob_table = models.AttachmentBlob.__table__
+        connection.execute(update(blob_table).where(blob_table.c.id == target.blob_id).values(ref_count=blob_table.c.ref_count - 1))
+
+
+def storage_report(db: Session) -> dict:
+    """Bytes stored versus bytes that would be stored without deduplication."""
+    Blob = models.AttachmentBlob
+    blobs, stored_bytes, references, logical_bytes = db.query(
+        func.count(Blob.id), func.coalesce(func.sum(Blob.size), 0), func.coalesce(func.sum(Blob.ref_count), 0), func.coalesce(func.sum(Blob.size * Blob.ref_count), 0)
+    ).one()
+    unreferenced, unreferenced_bytes = db.query(func.count(Blob.id), func.coalesce(func.sum(Blob.size), 0)).filter(Blob.ref_count <= 0).one()
+    legacy = db.query(func.count(models.Attachment.id)).filter(models.Attachment.blob_id == None).scalar()
+    return {
+        'blobs': blobs,
+        'blob_references': references,
+        'stored_bytes': stored_bytes,
+        'logical_bytes': logical_bytes,
+        'saved_bytes': logical_bytes - (stored_bytes - unreferenced_bytes),
+        'unreferenced_blobs': unreferenced,
+        'unreferenced_bytes': unreferenced_bytes,
+        'legacy_attachments': legacy,
+    }
+
+
+def _is_managed(path: str) -> bool:
+    """Only files the store itself writes (ab/cd/<sha256> and tmp/*) are ever swept;
+    anything else under the directory predates content addressing and is left alone."""
+    rel = os.path.relpath(path, storage.base_path).split(os.sep)
+    if len(rel) == 2 and rel[0] == 'tmp':
+        return True
+    return len(rel) == 3 and len(rel[2]) == 64 and rel[2][:2] == rel[0] and rel[2][2:4] == rel[1]
+
+
+def _unlink_unreferenced(db: Session, path: str, sha256: str) -> Optional[int]:
+    """Delete the blob row of `sha256` if unreferenced and unlink its file if nothing
+    points at it, holding the same row claim store_blob() takes until both are done.
+
+    Returns the number of bytes unlinked, or None if the file was kept.
+    """
+    Blob = models.AttachmentBlob
+    try:
+        db.query(Blob).filter(
+            Blob.sha256 == sha256, Blob.ref_count <= 0, ~exists().where(models.Attachment.blob_id == Blob.id)
+        ).delete(synchronize_session=False)
+        freed = None
+        if not db.query(exists().where(Blob.sha256 == sha256)).scalar() and os.path.exists(path):
+            freed = os.path.getsize(path)
+            os.remove(path)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return freed
+
+
+def collect_garbage(db: Session, min_age_seconds: float = 3600, dry_run: bool = False) -> dict:
+    """Delete unreferenced blobs and stray files in the store.
+
+    A blob is removed only if its count is zero and no attachment row points at it. Each
+    row is deleted and its file unlinked in one transaction that re-checks the count
+    under the blob's claim, so a blob claimed by a concurrent upload survives with its
+    content. Files written by the store that belong to no blob or legacy attachment
+    (e.g. left by a crashed upload) are removed once older than `min_age_seconds`, and
+    never younger than MIN_STRAY_AGE_SECONDS, since an upload in progress owns them.
+    """
+    Blob = models.AttachmentBlob
+    candidates = db.query(Blob.sha256, Blob.path, Blob.size).filter(
+        Blob.ref_count <= 0, ~exists().where(models.Attachment.blob_id == Blob.id)
+    ).all()
+    removed_blobs, freed = 0, 0
+    for sha256, path, size in candidates:
+        if dry_run:
+            removed_blobs, freed = removed_blobs + 1, freed + size
+            continue
+        gone = _unlink_unreferenced(db, path, sha256)
+        if gone is not None:
+            removed_blobs, freed = removed_blobs + 1, freed + gone
+
+    # a snapshot is only a filter here; blob files are re-checked under the claim before unlinking
+    known = {os.path.normpath(p) for (p,) in db.query(Blob.path).yield_per(1000)}
+    # legacy rows are never created any more, so this set cannot grow
+    known.update(os.path.normpath(p) for (p,) in db.query(models.Attachment.file_path).filter(models.Attachment.blob_id == None).yield_per(1000))
+    db.commit()
+    cutoff = time.time() - max(min_age_seconds, MIN_STRAY_AGE_SECONDS)
+    removed_files = 0
+    for root, _, files in os.walk(storage.base_path):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            if not _is_managed(path) or path in known or os.path.getmtime(path) >= cutoff:
+                continue
+            if dry_run:
+                removed_files, freed = removed_files + 1, freed + os.path.getsize(path)
+            elif os.path.dirname(path) == os.path.normpath(os.path.join(storage.base_path, 'tmp')):
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed_files += 1
+            else:
+                gone = _unlink_unreferenced(db, path, name)
+                if gone is not None:
+                    removed_files, freed = removed_files + 1, freed + gone
+    return {'removed_blobs': removed_blobs, 'freed_bytes': freed, 'removed_files': removed_files, 'dry_run': dry_run}
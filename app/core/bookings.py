@@ -0,0 +1,303 @@
+"""Booking conflict detection.
+
+Space and stock bookings carry a copy of their activity's start/end (filled on insert and
+kept in step by reschedule()) and are indexed on (resource, status, start_time, end_time).
+Each check is the plain overlap predicate (start_time < end AND end_time > start) per
+resource with LIMIT 1; all resources of an activity are probed in one UNION ALL statement.
+Nothing here assumes confirmed bookings never overlap: rows written before this module or
+by other paths may well do so. What bounds the index range from below is the resource's
+longest booking, kept in its booking_locks row: nothing starting earlier than
+start - longest can still be running at start, so a probe reads only the bookings of that
+stretch, however long the resource's history.
+
+Check-then-insert is only safe if no one else books the same resource in between, so
+reserve() first takes the resource's booking_locks row (lock_resources(), which also
+returns the longest-booking bounds). On PostgreSQL
+that is a row lock scoped to the resource, backed by an exclusion constraint on the
+booking tables; on SQLite the first write of a transaction takes the database write lock,
+which serializes every booker (waiting up to busy_timeout) until commit.
+"""
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Integer, String, case, event, literal, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+# kind -> (booking model, resource column name)
+RESOURCES = {
+    'space': (models.SpaceBooking, 'space_id'),
+    'stock': (models.StockBooking, 'item_id'),
+}
+
+# stays well below SQLite's limit on terms in a compound SELECT
+_MAX_PROBES_PER_STATEMENT = 200
+
+
+def naive_utc(value: datetime) -> datetime:
+    # activity and booking times are stored as naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+class Conflict(NamedTuple):
+    kind: str
+    resource_id: int
+    booking_id: int
+    activity_id: int
+
+
+class BookingConflict(Exception):
+    """Raised by reserve() when the resource is already booked for the activity's window."""
+
+    def __init__(self, conflicts: List[Conflict]):
+        super().__init__(f'{len(conflicts)} conflicting booking(s)')
+        self.conflicts = conflicts
+
+
+def _probe(kind: str, resource_id: int, start: datetime, end: datetime, exclude_activity_id: Optional[int], longest: Optional[timedelta] = None):
+    model, column = RESOURCES[kind]
+    q = select(
+        literal(kind, String).label('kind'),
+        literal(resource_id, Integer).label('resource_id'),
+        model.id.label('booking_id'),
+        model.activity_id.label('activity_id'),
+    ).where(
+        getattr(model, column) == resource_id,
+        model.status == 'Confirmed',
+        model.start_time < end,
+        model.end_time > start,
+    )
+    if longest is not None:
+        q = q.where(model.start_time >= start - longest)
+    if exclude_activity_id is not None:
+        q = q.where(model.activity_id != exclude_activity_id)
+    # a subquery, since SQLite allows no LIMIT on the members of a compound SELECT
+    return select(q.order_by(model.start_time.desc()).limit(1).subquery())
+
+
+def find_conflicts(db: Session, start: datetime, end: datetime, spaces: Iterable[int] = (), items: Iterable[int] = (), exclude_activity_id: Optional[int] = None, longest: Optional[Dict[Tuple[str, int], timedelta]] = None) -> List[Conflict]:
+    """Confirmed bookings overlapping [start, end) on any of the given spaces or stock items.
+
+    Bookings of exclude_activity_id are ignored, which is what a reschedule needs. Pass the
+    bounds lock_resources() returned as `longest`; resources without one are scanned from
+    their first booking.
+    """
+    longest = longest or {}
+    probes = [('space', r) for r in dict.fromkeys(spaces)] + [('stock', r) for r in dict.fromkeys(items)]
+    conflicts = []
+    for i in range(0, len(probes), _MAX_PROBES_PER_STATEMENT):
+        chunk = [_probe(kind, r, start, end, exclude_activity_id, longest.get((kind, r))) for kind, r in probes[i:i + _MAX_PROBES_PER_STATEMENT]]
+        stmt = chunk[0] if len(chunk) == 1 else union_all(*chunk)
+        conflicts.extend(Conflict(*row) for row in db.execute(stmt))
+    return conflicts
+
+
+def find_conflicts_for_windows(db: Session, windows: List[Tuple[datetime, datetime]], spaces: Iterable[int] = (), items: Iterable[int] = ()) -> List[List[Conflict]]:
+    """Conflicts of each window (e.g. every occurrence of a series) on all the resources.
+
+    One query reads the confirmed bookings of the resources that touch the overall span.
+    Per resource they are sorted by start, with the running maximum of their ends, so each
+    window bisects to the last booking starting before it ends and walks back only while
+    some earlier booking still ends after the window starts.
+    """
+    spaces, items = list(dict.fromkeys(spaces)), list(dict.fromkeys(items))
+    result = [[] for _ in windows]
+    if not windows or not (spaces or items):
+        return result
+    span_start = min(s for s, _ in windows)
+    span_end = max(e for _, e in windows)
+    selects = []
+    for kind, ids in (('space', spaces), ('stock', items)):
+        if not ids:
+            continue
+        model, column = RESOURCES[kind]
+        resource = getattr(model, column)
+        selects.append(select(
+            literal(kind, String).label('kind'), resource.label('resource_id'), model.id, model.activity_id, model.start_time, model.end_time,
+        ).where(resource.in_(ids), model.status == 'Confirmed', model.start_time < span_end, model.end_time > span_start))
+    stmt = selects[0] if len(selects) == 1 else union_all(*selects)
+    per_resource = {}
+    for kind, resource_id, booking_id, activity_id, start, end in db.execute(stmt):
+        per_resource.setdefault((kind, resource_id), []).append((start, end, booking_id, activity_id))
+    for (kind, resource_id), booked in per_resource.items():
+        booked.sort()
+        starts = [b[0] for b in booked]
+        reach = list(accumulate((b[1] for b in booked), max))
+        for i, (start, end) in enumerate(windows):
+            j = bisect_left(starts, end) - 1
+            while j >= 0 and reach[j] > start:
+                if booked[j][1] > start:
+                    result[i].append(Conflict(kind, resource_id, booked[j][2], booked[j][3]))
+                j -= 1
+    return result
+
+
+def activity_resources(db: Session, activity_id: int):
+    """(space ids, stock item ids) booked by an activity, in one round trip."""
+    space = select(literal('space', String).label('kind'), models.SpaceBooking.space_id.label('resource_id')).where(models.SpaceBooking.activity_id == activity_id)
+    stock = select(literal('stock', String).label('kind'), models.StockBooking.item_id.label('resource_id')).where(models.StockBooking.activity_id == activity_id)
+    spaces, items = [], []
+    for kind, resource_id in db.execute(union_all(space, stock)):
+        (spaces if kind == 'space' else items).append(resource_id)
+    return spaces, items
+
+
+def free_slots(db: Session, kind: str, resource_ids: Iterable[int], start: datetime, end: datetime, min_length: Optional[timedelta] = None) -> Dict[int, List[Tuple[datetime, datetime]]]:
+    """Free intervals within [start, end) for each resource, keyed by resource id.
+
+    Confirmed bookings touching the window are read in one query ordered by
+    (resource, start_time) and swept in a single pass. Gaps shorter than min_length are
+    dropped, so a resource may map to an empty list.
+    """
+    model, column = RESOURCES[kind]
+    resource = getattr(model, column)
+    ids = list(dict.fromkeys(resource_ids))
+    slots = {r: [] for r in ids}
+    if not ids:
+        return slots
+    rows = db.execute(
+        select(resource, model.start_time, model.end_time).where(
+            resource.in_(ids),
+            model.status == 'Confirmed',
+            model.start_time < end,
+            model.end_time > start,
+        ).order_by(resource, model.start_time)
+    )
+
+    def add(r, slot_start, slot_end):
+        if slot_end > slot_start and (min_length is None or slot_end - slot_start >= min_length):
+            slots[r].append((slot_start, slot_end))
+
+    # cursor: end of the busy time swept so far for the current resource
+    current, cursor = None, start
+    busy = set()
+    for r, busy_start, busy_end in rows:
+        if r != current:
+            if current is not None:
+                add(current, cursor, end)
+            current, cursor = r, start
+            busy.add(r)
+        if busy_start > cursor:
+            add(r, cursor, busy_start)
+        cursor = max(cursor, busy_end)
+    if current is not None:
+        add(current, cursor, end)
+    for r in ids:
+        if r not in busy:
+            add(r, start, end)
+    return slots
+
+
+def _seconds(duration: Optional[timedelta]) -> int:
+    return math.ceil(duration.total_seconds()) if duration else 0
+
+
+def _grow_longest(table, seconds: int):
+    # NULL stays NULL: the bound is unknown until lock_resources() computes it from the data
+    return case((table.c.max_duration < seconds, seconds), else_=table.c.max_duration)
+
+
+def _longest_booking(db: Session, kind: str, resource_id: int) -> int:
+    model, column = RESOURCES[kind]
+    rows = db.execute(select(model.start_time, model.end_time).where(getattr(model, column) == resource_id, model.start_time != None, model.end_time != None))
+    return max((_seconds(end - start) for start, end in rows), default=0)
+
+
+def lock_resources(db: Session, spaces: Iterable[int] = (), items: Iterable[int] = (), duration: Optional[timedelta] = None) -> Dict[Tuple[str, int], timedelta]:
+    """Hold the booking locks of these resources until the caller's transaction ends.
+
+    Locks are taken in a fixed order so two activities sharing resources cannot deadlock.
+    Returns each resource's longest booking, counting one of `duration` about to be placed,
+    for find_conflicts(); a resource's first lock computes it from its existing bookings.
+    """
+    table = models.BookingLock.__table__
+    seconds = _seconds(duration)
+    keys = sorted({('space', r) for r in spaces} | {('stock', r) for r in items})
+    longest = {}
+    for kind, resource_id in keys:
+        row = (table.c.resource_type == kind, table.c.resource_id == resource_id)
+        bump = update(table).where(*row).values(version=table.c.version + 1, max_duration=_grow_longest(table, seconds)).returning(table.c.max_duration)
+        found = db.execute(bump).first()
+        if found is None:
+            try:
+                with db.begin_nested():
+                    db.add(models.BookingLock(resource_type=kind, resource_id=resource_id, version=0))
+            except IntegrityError:
+                # another booker created the row first; queue on it
+                pass
+            found = db.execute(bump).first()
+        current = found[0]
+        if current is None:
+            current = max(_longest_booking(db, kind, resource_id), seconds)
+            db.execute(update(table).where(*row).values(max_duration=current))
+        longest[(kind, resource_id)] = timedelta(seconds=current)
+    return longest
+
+
+def _is_exclusion_violation(exc: IntegrityError) -> bool:
+    return any(name in str(exc.orig) for name, _ in models.BOOKING_EXCLUSION_CONSTRAINTS.values())
+
+
+def reserve(db: Session, activity: models.Activity, kind: str, resource_id: int, status: str = 'Confirmed'):
+    """Book a space or stock item for an activity, or raise BookingConflict.
+
+    The booking is flushed but not committed; the lock is released when the caller's
+    transaction ends, so commit promptly.
+    """
+    model, column = RESOURCES[kind]
+    resources = {'spaces': [resource_id]} if kind == 'space' else {'items': [resource_id]}
+    longest = lock_resources(db, duration=activity.end_time - activity.start_time, **resources)
+    conflicts = find_conflicts(db, activity.start_time, activity.end_time, longest=longest, **resources)
+    if conflicts:
+        raise BookingConflict(conflicts)
+    booking = model(activity_id=activity.id, status=status, start_time=activity.start_time, end_time=activity.end_time, **{column: resource_id})
+    try:
+        with db.begin_nested():
+            db.add(booking)
+    except IntegrityError as exc:
+        if not _is_exclusion_violation(exc):
+            raise
+        raise BookingConflict([]) from exc
+    return booking
+
+
+def reschedule(db: Session, activity_id: int, start: datetime, end: datetime) -> None:
+    """Move the denormalized windows of an activity's bookings along with the activity.
+
+    Lock the activity's resources with the new duration first, so their bounds cover it.
+    """
+    for model, _ in RESOURCES.values():
+        db.execute(update(model).where(model.activity_id == activity_id).values(start_time=start, end_time=end))
+
+
+def _fill_window(mapper, connection, target):
+    if target.activity_id is not None and (target.start_time is None or target.end_time is None):
+        row = connection.execute(
+            select(models.Activity.start_time, models.Activity.end_time).where(models.Activity.id == target.activity_id)
+        ).first()
+        if row is not None:
+            target.start_time, target.end_time = row
+
+
+def _listen(kind: str, model, column: str):
+    def grow_longest(mapper, connection, target):
+        # bookings added without lock_resources() still widen a known bound
+        if target.start_time is not None and target.end_time is not None:
+            table = models.BookingLock.__table__
+            connection.execute(
+                update(table).where(table.c.resource_type == kind, table.c.resource_id == getattr(target, column))
+                .values(max_duration=_grow_longest(table, _seconds(target.end_time - target.start_time)))
+            )
+
+    event.listen(model, 'before_insert', _fill_window)
+    event.listen(model, 'after_insert', grow_longest)
+
+
+for _kind, (_model, _column) in RESOURCES.items():
+    _listen(_kind, _model, _column)
@@ -0,0 +1,189 @@
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.core.cache import register_cache
+from app.core.custom_fields import CompiledField, CompiledFieldSet
+
+
+def catalog_version(db: Session, name: str) -> int:
+    """Current change counter of catalog `name` (0 if it was never bumped)."""
+    version = db.query(models.CatalogVersion.version).filter(models.CatalogVersion.name == name).scalar()
+    return version or 0
+
+
+def bump_catalog_version(db: Session, name: str) -> None:
+    """Mark catalog `name` as changed. Call inside the transaction that edits the
+    definitions so the new version becomes visible exactly when the edit commits."""
+    def bump():
+        return db.query(models.CatalogVersion).filter(models.CatalogVersion.name == name).update(
+            {models.CatalogVersion.version: models.CatalogVersion.version + 1}, synchronize_session=False
+        )
+
+    if bump():
+        return
+    # no row yet (seed_catalog_versions() normally creates them)
+    try:
+        with db.begin_nested():
+            db.add(models.CatalogVersion(name=name, version=1))
+    except IntegrityError:
+        # a concurrent first bump created it; count this change on top
+        bump()
+
+
+def seed_catalog_versions(conn) -> None:
+    """Create the version row of every catalog that lacks one, so that concurrent bumps all
+    take the UPDATE path. Run after create_all (migrations seed the rows themselves)."""
+    table = models.CatalogVersion.__table__
+    existing = set(conn.execute(select(table.c.name)).scalars())
+    for name in CATALOG_NAMES:
+        if name in existing:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(table.insert().values(name=name, version=0))
+        except IntegrityError:
+            # another worker seeded it at the same time
+            pass
+
+
+# names of every VersionedCatalog, in creation order
+CATALOG_NAMES: List[str] = []
+
+
+class VersionedCatalog:
+    """Process-local copy of a set of definitions, reloaded when its catalog version moves.
+
+    Each get() costs one primary-key lookup of the version row; the loader only runs after
+    a writer has called bump_catalog_version(), in this worker or any other.
+    """
+
+    def __init__(self, name: str, loader: Callable[[Session], Any]):
+        self.name = name
+        self._loader = loader
+        CATALOG_NAMES.append(name)
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._data: Any = None
+        self.hits = 0
+        self.reloads = 0
+        register_cache(self)
+
+    def get(self, db: Session) -> Any:
+        # read the version before loading: a concurrent bump then makes the next
+        # request reload instead of pinning data older than the stamped version
+        version = catalog_version(db, self.name)
+        with self._lock:
+            if self._version == version:
+                self.hits += 1
+                return self._data
+        data = self._loader(db)
+        with self._lock:
+            self._version, self._data = version, data
+            self.reloads += 1
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version, self._data = None, None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.reloads
+            return {
+                'name': self.name,
+                'version': self._version,
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def load_ticket_types(db: Session, queue_id: Optional[int] = None, type_ids: Optional[Iterable[int]] = None) -> List[schemas.TicketTypeOut]:
+    """Ticket types with their fields and allowed groups, in three queries however many
+    types match (types, then fields and allowed groups by IN-list)."""
+    q = db.query(models.TicketType)
+    if queue_id is not None:
+        q = q.filter(models.TicketType.queue_id == queue_id)
+    if type_ids is not None:
+        q = q.filter(models.TicketType.id.in_(list(type_ids)))
+    tts = q.order_by(models.TicketType.id).all()
+    ids = [tt.id for tt in tts]
+    if not ids:
+        return []
+
+    fields = defaultdict(list)
+    frows = db.query(models.TicketTypeField).filter(models.TicketTypeField.ticket_type_id.in_(ids)).order_by(models.TicketTypeField.id).all()
+    for f in frows:
+        opts = json.loads(f.options) if f.options else None
+        fields[f.ticket_type_id].append(schemas.TicketFieldOut(id=f.id, name=f.name, field_type=f.field_type, options=opts))
+
+    allowed = defaultdict(list)
+    arows = db.query(models.TicketTypeAllowedGroup.ticket_type_id, models.TicketTypeAllowedGroup.group_id).filter(models.TicketTypeAllowedGroup.ticket_type_id.in_(ids)).all()
+    for type_id, group_id in arows:
+        allowed[type_id].append(group_id)
+
+    return [schemas.TicketTypeOut(id=tt.id, queue_id=tt.queue_id, name=tt.name, allowed_group_ids=allowed[tt.id], fields=fields[tt.id]) for tt in tts]
+
+
+class TicketTypeEntry:
+    __slots__ = ('out', 'allowed_group_ids', 'fields')
+
+    def __init__(self, out: schemas.TicketTypeOut):
+        self.out = out
+        self.allowed_group_ids = frozenset(out.allowed_group_ids or ())
+        self.fields = CompiledFieldSet(CompiledField(f.id, f.name, f.field_type, f.options) for f in out.fields or ())
+
+    def allows(self, group_ids) -> bool:
+        # types with no allowed groups are open to everyone
+        return not self.allowed_group_ids or not self.allowed_group_ids.isdisjoint(group_ids)
+
+
+def _load_ticket_type_entries(db: Session) -> Dict[int, TicketTypeEntry]:
+    return {tt.id: TicketTypeEntry(tt) for tt in load_ticket_types(db)}
+
+
+TICKET_TYPES = 'ticket_types'
+ticket_type_catalog = VersionedCatalog(TICKET_TYPES, _load_ticket_type_entries)
+
+
+class ActivityTypeEntry:
+    """An activity type as served by GET /activities/types (`out`) plus its compiled fields."""
+
+    __slots__ = ('out', 'fields')
+
+    def __init__(self, out: dict):
+        self.out = out
+        self.fields = CompiledFieldSet(CompiledField(f['id'], f['name'], f['field_type'], f['options']) for f in out['fields'])
+
+
+def _load_activity_type_entries(db: Session) -> Dict[int, ActivityTypeEntry]:
+    fields = defaultdict(list)
+    for f in db.query(models.ActivityTypeField).order_by(models.ActivityTypeField.id).all():
+        opts = json.loads(f.options) if f.options else None
+        fields[f.activity_type_id].append({'id': f.id, 'name': f.name, 'field_type': f.field_type, 'options': opts})
+    types = db.query(models.ActivityType).order_by(models.ActivityType.id).all()
+    return {t.id: ActivityTypeEntry({'id': t.id, 'name': t.name, 'metadata': t.meta, 'fields': fields[t.id]}) for t in types}
+
+
+ACTIVITY_TYPES = 'activity_types'
+activity_type_catalog = VersionedCatalog(ACTIVITY_TYPES, _load_activity_type_entries)
+
+
+def _load_space_templates(db: Session) -> Dict[int, dict]:
+    fields = defaultdict(list)
+    for f in db.query(models.SpaceTemplateField).order_by(models.SpaceTemplateField.id).all():
+        opts = json.loads(f.options) if f.options else None
+        fields[f.space_template_id].append({'id': f.id, 'name': f.name, 'field_type': f.field_type, 'options': opts})
+    templates = db.query(models.SpaceTemplate).order_by(models.SpaceTemplate.id).all()
+    return {t.id: {'id': t.id, 'name': t.name, 'description': t.description, 'fields': fields[t.id]} for t in templates}
+
+
+SPACE_TEMPLATES = 'space_templates'
+space_template_catalog = VersionedCatalog(SPACE_TEMPLATES, _load_space_templates)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 try:
     # pydantic v2 moved BaseSettings to pydantic-settings package
     from pydantic_settings import BaseSettings
@@ -12,6 +14,20 @@ class Settings(BaseSettings):
     KEYCLOAK_CLIENT_ID: str = "institution-client"
 
     DATABASE_URL: str = "sqlite:///./institution_manager.db"
+    # URL for the async engine used by the ticket/agent routers. Derived from DATABASE_URL
+    # when unset (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg).
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # Connection pool (see app.core.database.create_db_engine). Recycle only applies to
+    # server databases; pre-ping guards against connections dropped by the server.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # PRAGMA profile for SQLite connections: 'default' (driver defaults) or 'wal'
+    # (WAL journal, synchronous=NORMAL, busy_timeout, mmap and page cache sizing).
+    SQLITE_PRAGMA_PROFILE: str = "default"
+
     # If True, Keycloak auth is bypassed (for tests/dev). When enabled, the app will accept a header
     # X-Test-User: <user_id> to act as that user. Use only in tests/dev.
     KEYCLOAK_BYPASS: bool = False
@@ -20,6 +36,38 @@ class Settings(BaseSettings):
     # or deleting children as appropriate. Default is False (prevent deletion if referenced).
     TYPE_CASCADE_DELETE: bool = False
 
+    # Authenticated principal cache: token `sub` -> local user id, so repeat requests
+    # resolve the caller without touching the database.
+    PRINCIPAL_CACHE_TTL: int = 300
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    # Role membership cache used by get_current_user_bypass/require_role. Role changes made
+    # through the admin API invalidate it immediately; the TTL bounds staleness across workers.
+    ROLE_CACHE_TTL: int = 60
+    ROLE_CACHE_SIZE: int = 10000
+
+    # JWKS verification keys: refetched in the background JWKS_REFRESH_AHEAD seconds before
+    # JWKS_TTL runs out; an unknown kid triggers at most one refetch per interval.
+    JWKS_TTL: int = 3600
+    JWKS_REFRESH_AHEAD: int = 300
+    JWKS_MIN_REFETCH_INTERVAL: int = 10
+
+    # Verified-token cache: sha256(token) -> decoded claims, each entry expiring at the token's `exp`
+    TOKEN_CACHE_SIZE: int = 10000
+
+    # Largest number of tickets accepted by one POST /tickets/batch request
+    TICKET_BATCH_MAX_SIZE: int = 10000
+
+    # Most occurrences a single POST /activities/recurring rule may expand to
+    ACTIVITY_RECURRENCE_MAX_OCCURRENCES: int = 500
+
+    # Rows per transaction for CSV user imports (admin bulk endpoint and scripts/bulk_create_users.py)
+    USER_IMPORT_BATCH_SIZE: int = 1000
+
+    # Attachment storage: directory, largest accepted upload, and copy chunk size (bytes)
+    STORAGE_PATH: str = './uploads'
+    ATTACHMENT_MAX_BYTES: int = 100 * 1024 * 1024
+    STORAGE_CHUNK_SIZE: int = 1024 * 1024
+
     class Config:
         env_file = ".env"
 
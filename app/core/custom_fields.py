@@ -0,0 +1,171 @@
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+def _invalid(detail: str):
+    raise HTTPException(status_code=400, detail=detail)
+
+
+def _text(field, value):
+    return str(value) if value is not None else None
+
+
+def _select(field, value):
+    # lists and dicts from the JSON payload are never options (and are unhashable)
+    if field.options is not None and (not isinstance(value, (str, int, float, bool)) or value not in field.options):
+        _invalid(f'Invalid option for field {field.name}')
+    return str(value) if value is not None else None
+
+
+def _space(field, value):
+    # existence is checked for the whole payload at once in CompiledFieldSet.validate
+    try:
+        return str(int(value))
+    except Exception:
+        _invalid(f'Invalid space id for field {field.name}')
+
+
+_TRUE = frozenset(('true', '1', 'yes', 'y'))
+_FALSE = frozenset(('false', '0', 'no', 'n'))
+
+
+def _boolean(field, value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str):
+        lv = value.strip().lower()
+        if lv in _TRUE:
+            return 'true'
+        if lv in _FALSE:
+            return 'false'
+    _invalid(f'Invalid boolean value for field {field.name}')
+
+
+def _number(field, value):
+    try:
+        # allow ints and floats
+        float(value)
+    except Exception:
+        _invalid(f'Invalid numeric value for field {field.name}')
+    return str(value)
+
+
+def _datetime(field, value):
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except Exception:
+        _invalid(f'Invalid datetime format for field {field.name}; expected ISO format')
+
+
+def _date(field, value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except Exception:
+        _invalid(f'Invalid date format for field {field.name}; expected YYYY-MM-DD')
+
+
+def _time(field, value):
+    try:
+        return time.fromisoformat(value).isoformat()
+    except Exception:
+        _invalid(f'Invalid time format for field {field.name}; expected HH:MM[:SS]')
+
+
+# field_type -> normalizer(field, value) returning the stored string; unknown types are text
+NORMALIZERS: Dict[str, Callable[[Any, Any], Optional[str]]] = {
+    'text': _text,
+    'select': _select,
+    'space': _space,
+    'boolean': _boolean,
+    'number': _number,
+    'datetime': _datetime,
+    'date': _date,
+    'time': _time,
+}
+
+# tickets only ever checked select options and space references; other types are stored as text
+UNTYPED_NORMALIZERS: Dict[str, Callable[[Any, Any], Optional[str]]] = {
+    'select': _select,
+    'space': _space,
+}
+
+
+def _compile_options(options):
+    if not options:
+        return None
+    try:
+        return frozenset(options)
+    except TypeError:
+        # hand-edited definitions may hold non-string options; keep them searchable
+        return list(options)
+
+
+class CompiledField:
+    """A custom field definition with its options parsed once (into a frozenset when they
+    are hashable) and its normalizers resolved up front."""
+
+    __slots__ = ('id', 'name', 'field_type', 'options', 'normalize', 'normalize_untyped')
+
+    def __init__(self, id: int, name: str, field_type: str, options: Optional[Iterable[str]]):
+        self.id = id
+        self.name = name
+        self.field_type = field_type or 'text'
+        self.options = _compile_options(options)
+        self.normalize = NORMALIZERS.get(self.field_type, _text)
+        self.normalize_untyped = UNTYPED_NORMALIZERS.get(self.field_type, _text)
+
+
+class CompiledFieldSet:
+    """The custom fields of one ticket/activity type, indexed by id and name."""
+
+    __slots__ = ('fields', 'by_id', 'by_name')
+
+    def __init__(self, fields: Iterable[CompiledField]):
+        self.fields = list(fields)
+        self.by_id = {f.id: f for f in self.fields}
+        self.by_name = {}
+        for f in self.fields:
+            # first definition wins, as the linear scans did
+            self.by_name.setdefault(f.name, f)
+
+    def resolve(self, cf: dict) -> CompiledField:
+        # expect dict with either 'field_id' or 'name'
+        field_id = cf.get('field_id')
+        if field_id:
+            fdef = self.by_id.get(field_id)
+            if not fdef:
+                _invalid(f'Unknown custom field id {field_id}')
+        else:
+            fdef = self.by_name.get(cf.get('name'))
+            if not fdef:
+                _invalid(f'Unknown custom field name {cf.get("name")}')
+        return fdef
+
+    def validate(self, db: Session, custom_fields: Iterable[dict], typed: bool = True) -> List[Tuple[CompiledField, Optional[str]]]:
+        """Resolve and normalize a payload's custom fields; returns (field, stored value) pairs.
+
+        With typed=False only select options and space references are checked and every
+        other value is stored as text. Every 'space' reference in the payload is checked
+        with a single IN query.
+        """
+        out = []
+        for cf in custom_fields:
+            fdef = self.resolve(cf)
+            normalize = fdef.normalize if typed else fdef.normalize_untyped
+            out.append((fdef, normalize(fdef, cf.get('value'))))
+        space_refs = [(fdef, int(v)) for fdef, v in out if fdef.field_type == 'space']
+        if space_refs:
+            ids = {sid for _, sid in space_refs}
+            found = {sid for (sid,) in db.query(models.Space.id).filter(models.Space.id.in_(ids))}
+            for fdef, sid in space_refs:
+                if sid not in found:
+                    _invalid(f'Invalid space id for field {fdef.name}')
+        return out
+
+
+EMPTY_FIELDS = CompiledFieldSet(())
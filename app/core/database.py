@@ -1,10 +1,150 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, StaticPool, AsyncAdaptedQueuePool
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection.
+
+    Only checkouts that find the pool exhausted (no idle connection and no overflow left)
+    block, so only those are counted; opening a new connection is not a wait.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self._overflow >= self._max_overflow and self._pool.empty()
+        if not exhausted:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+# PRAGMAs applied to every new SQLite connection, selected by Settings.SQLITE_PRAGMA_PROFILE.
+# 'wal' suits single-node deployments: readers no longer block on writers, commits skip
+# the per-transaction fsync (still durable at checkpoints), and lock contention waits
+# busy_timeout ms instead of failing with "database is locked".
+SQLITE_PRAGMA_PROFILES = {
+    'default': {},
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268435456,
+        'cache_size': -64000,
+    },
+}
+
+
+def _install_sqlite_pragmas(engine: Engine, profile: str) -> None:
+    if profile not in SQLITE_PRAGMA_PROFILES:
+        raise ValueError(f'Unknown SQLITE_PRAGMA_PROFILE {profile!r}')
+    pragmas = SQLITE_PRAGMA_PROFILES[profile]
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def _engine_kwargs(url, poolclass) -> dict:
+    kwargs = {'pool_pre_ping': settings.DB_POOL_PRE_PING}
+    if url.get_backend_name() == 'sqlite':
+        kwargs['connect_args'] = {'check_same_thread': False}
+        if url.database in (None, '', ':memory:'):
+            kwargs['poolclass'] = StaticPool
+        else:
+            kwargs.update(poolclass=poolclass, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW, pool_timeout=settings.DB_POOL_TIMEOUT)
+    else:
+        kwargs.update(
+            poolclass=poolclass,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return kwargs
+
+
+def create_db_engine(url: str = None, pragma_profile: str = None) -> Engine:
+    """Build an engine with pool settings appropriate for the URL's dialect.
+
+    SQLite gets `check_same_thread=False` (and a StaticPool for in-memory databases) plus
+    the PRAGMA profile named by `pragma_profile` / Settings.SQLITE_PRAGMA_PROFILE; server
+    databases get a sized QueuePool with pre-ping and recycle from Settings.
+    """
+    url = make_url(url or settings.DATABASE_URL)
+    engine = create_engine(url, **_engine_kwargs(url, TimedQueuePool))
+    if url.get_backend_name() == 'sqlite':
+        _install_sqlite_pragmas(engine, pragma_profile or settings.SQLITE_PRAGMA_PROFILE)
+    return engine
+
+
+# async drivers used when ASYNC_DATABASE_URL is not set explicitly
+_ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def async_database_url(url: str = None) -> str:
+    """Derive the async-driver URL for DATABASE_URL (e.g. sqlite -> sqlite+aiosqlite)."""
+    if url is None and settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(url or settings.DATABASE_URL)
+    driver = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No async driver known for {url.get_backend_name()!r}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{url.get_backend_name()}+{driver}').render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: str = None, pragma_profile: str = None):
+    """Async counterpart of create_db_engine (same pool sizing and SQLite PRAGMAs)."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(async_database_url(url))
+    engine = create_async_engine(url, **_engine_kwargs(url, AsyncAdaptedQueuePool))
+    if url.get_backend_name() == 'sqlite':
+        _install_sqlite_pragmas(engine.sync_engine, pragma_profile or settings.SQLITE_PRAGMA_PROFILE)
+    return engine
+
+
+def pool_metrics(bind: Engine = None) -> dict:
+    """Snapshot of connection pool usage for the given engine (default: the app engine)."""
+    pool = (bind or engine).pool
+    out = {'pool_class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            out[name] = fn()
+    if isinstance(pool, TimedQueuePool):
+        out['wait_count'] = pool.wait_count
+        out['wait_total_seconds'] = pool.wait_total
+        out['wait_max_seconds'] = pool.wait_max
+        out['wait_avg_seconds'] = (pool.wait_total / pool.wait_count) if pool.wait_count else 0.0
+    return out
+
+
+engine = create_db_engine(settings.DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -16,3 +156,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# The async engine is built on first use so the async driver is only required by
+# deployments that serve the async routers.
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_sessionmaker = async_sessionmaker(create_async_db_engine(), autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+async def get_async_db():
+    """AsyncSession dependency. Routers run their ORM code through `await db.run_sync(...)`,
+    so database I/O waits on the event loop instead of holding a threadpool worker."""
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,54 @@
+"""Minimal iCalendar (RFC 5545) writer for activity feeds."""
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+
+PRODID = '-//Institution Manager//Activities//EN'
+
+
+def escape_text(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def format_utc(value: datetime) -> str:
+    # naive datetimes are stored as UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def fold(line: str) -> str:
+    """Split a content line into CRLF-terminated lines of at most 75 octets."""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while data:
+        cut = min(limit, len(data))
+        # never split a multi-byte character
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def render_activities(activities: Iterable, name: str = 'Activities') -> Iterator[str]:
+    """Yield a VCALENDAR with one VEVENT per activity, one event at a time."""
+    stamp = format_utc(datetime.now(timezone.utc))
+    yield 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n' + fold(f'PRODID:{PRODID}') + 'CALSCALE:GREGORIAN\r\n' + fold(f'X-WR-CALNAME:{escape_text(name)}')
+    for a in activities:
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:activity-{a.id}@institution-manager',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{format_utc(a.start_time)}',
+            f'DTEND:{format_utc(a.end_time)}',
+            f'SUMMARY:{escape_text(a.title)}',
+        ]
+        if a.description:
+            lines.append(f'DESCRIPTION:{escape_text(a.description)}')
+        lines.append('END:VEVENT')
+        yield ''.join(fold(line) for line in lines)
+    yield 'END:VCALENDAR\r\n'
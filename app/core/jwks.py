@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+from jose import jwk
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSFetchError(RuntimeError):
+    pass
+
+
+class JWKSKeyStore:
+    """kid-indexed store of constructed verification keys for a JWKS endpoint.
+
+    Keys are parsed once per fetch, so token verification is a dict lookup. A daemon
+    thread (see `start`) refreshes the set `refresh_ahead` seconds before it expires;
+    request threads only fetch synchronously when nothing usable is cached or when a
+    token carries an unknown kid (key rotation). Concurrent fetches are collapsed into
+    one (single-flight). Request-path fetches, whether for an expired set or an unknown
+    kid, happen at most once per `min_refetch_interval`, and a failed refresh keeps
+    serving the keys already held instead of blocking every request on the issuer.
+    """
+
+    def __init__(self, url_factory: Callable[[], str], ttl: float = 3600, refresh_ahead: float = 300, min_refetch_interval: float = 10):
+        self._url_factory = url_factory
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl / 2)
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: Optional[Dict[str, object]] = None
+        self._fetched_at = 0.0
+        # request-path fetch attempts, successful or not; used for single-flight and backoff
+        self._attempts = 0
+        self._attempted_at = 0.0
+        self._last_error: Optional[str] = None
+        self._fetch_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get_key(self, kid: Optional[str]):
+        """Return the key for `kid`, or None if the issuer does not publish it.
+
+        Raises JWKSFetchError only when no keys have ever been fetched.
+        """
+        now = time.time()
+        if self._keys is None or now - self._fetched_at >= self.ttl:
+            self._try_fetch(now)
+        key = self._keys.get(kid)
+        if key is None and time.time() - self._fetched_at >= self.min_refetch_interval:
+            # possibly a freshly rotated key; refetch once
+            self._try_fetch(time.time())
+            key = self._keys.get(kid)
+        return key
+
+    def _try_fetch(self, now: float) -> None:
+        if now - self._attempted_at < self.min_refetch_interval:
+            # a fetch was just tried; don't hammer (or wait on) the issuer again
+            if self._keys is None:
+                raise JWKSFetchError(self._last_error or 'JWKS not available')
+            return
+        try:
+            self._fetch()
+        except JWKSFetchError:
+            if self._keys is None:
+                raise
+            logger.warning('JWKS refresh failed; serving keys fetched %.0fs ago', time.time() - self._fetched_at)
+
+    def start(self) -> None:
+        """Start the background refresher (idempotent)."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name='jwks-refresh', daemon=True)
+        self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def clear(self) -> None:
+        self._keys = None
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._last_error = None
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            if self._keys is None:
+                delay = 0.0
+            else:
+                delay = self._fetched_at + self.ttl - self.refresh_ahead - time.time()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            try:
+                self._fetch(force=True)
+            except JWKSFetchError:
+                # keep serving the current keys; retry shortly
+                if self._stop.wait(min(self.refresh_ahead / 4, 30) or 1):
+                    return
+
+    def _fetch(self, force: bool = False) -> None:
+        attempts = self._attempts
+        with self._fetch_lock:
+            if not force and self._attempts != attempts:
+                # another thread fetched (or failed to) while we were waiting
+                if self._keys is None:
+                    raise JWKSFetchError(self._last_error or 'JWKS not available')
+                return
+            if not force:
+                self._attempted_at = time.time()
+            try:
+                self._load()
+            finally:
+                # bumped only once the attempt is over, so threads queued behind it skip theirs
+                self._attempts += 1
+
+    def _load(self) -> None:
+        url = self._url_factory()
+        try:
+            r = requests.get(url, timeout=5)
+            r.raise_for_status()
+            jwks = r.json()
+        except Exception as e:
+            logger.exception('Failed to fetch JWKS')
+            self._last_error = str(e)
+            raise JWKSFetchError(str(e))
+        keys = {}
+        for k in jwks.get('keys', []):
+            if k.get('use', 'sig') != 'sig':
+                continue
+            try:
+                keys[k.get('kid')] = jwk.construct(k, k.get('alg', 'RS256'))
+            except Exception:
+                logger.warning('Skipping unusable JWK kid=%s', k.get('kid'))
+        self._keys = keys
+        self._fetched_at = time.time()
+        self._last_error = None
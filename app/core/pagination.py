@@ -0,0 +1,171 @@
+import base64
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque cursor for the sort-key values of the last row of a page."""
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> tuple:
+    """Inverse of encode_cursor; `types` gives the Python type of each sort key."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(raw) != len(types):
+            raise ValueError('cursor arity')
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for v, t in zip(raw, types))
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def keyset_page(q, columns: Sequence, cursor: str, types: Sequence[type], limit: int, descending: bool = False):
+    """Apply keyset pagination over `columns` (the last one must be unique, e.g. the id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page. Rows past the cursor
+    are located with a row-value comparison, so each page is an index range scan rather than
+    an OFFSET over everything before it.
+    """
+    key = tuple_(*columns)
+    if cursor:
+        after = tuple_(*decode_cursor(cursor, types))
+        q = q.filter(key < after if descending else key > after)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = q.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows, next_cursor
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# rows fetched per round trip when a listing is streamed rather than paged
+STREAM_CHUNK_SIZE = 1000
+
+
+class PageParams:
+    """Query parameters shared by the list endpoints (`page: PageParams = Depends()`).
+
+    Without `limit`/`cursor` the whole listing is streamed; with either, one keyset page is
+    returned and the cursor for the next one is sent in `X-Next-Cursor`. `include_total`
+    adds `X-Total-Count` (an extra COUNT query, so only on demand) and `format=ndjson`
+    switches the body to one JSON object per line.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        include_total: bool = False,
+        format: str = Query('json', pattern='^(json|ndjson)$'),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.include_total = include_total
+        self.format = format
+
+    @property
+    def paged(self) -> bool:
+        return self.limit is not None or self.cursor is not None
+
+
+def schema_serializer(schema) -> Callable:
+    """Row -> JSON-ready dict through a from_attributes Pydantic schema."""
+    return lambda row: schema.model_validate(row).model_dump(mode='json')
+
+
+def _json_body(dicts: Iterable[dict], fmt: str) -> Iterator[str]:
+    if fmt == 'ndjson':
+        for d in dicts:
+            yield json.dumps(d) + '\n'
+        return
+    yield '['
+    first = True
+    for d in dicts:
+        yield (json.dumps(d) if first else ',' + json.dumps(d))
+        first = False
+    yield ']'
+
+
+def _media_type(fmt: str) -> str:
+    return 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+
+
+def paginate(q, key, page: PageParams, serialize: Callable, response: Response, key_types: Sequence[type] = (int,)):
+    """List `q` according to `page`, keyed on the unique integer column `key`.
+
+    `key` may also be a list of columns ending in a unique one (e.g. start time, then id)
+    with `key_types` giving their Python types. A JSON page returns the ORM rows (so the
+    route's response_model still applies) and sets the pagination headers on `response`;
+    streamed output is returned as a StreamingResponse that walks the query with
+    `yield_per`, so at most one chunk of rows is held in the session at a time.
+    """
+    keys = list(key) if isinstance(key, (list, tuple)) else [key]
+    headers = {}
+    if page.include_total:
+        headers['X-Total-Count'] = str(q.order_by(None).count())
+    if page.paged:
+        rows, next_cursor = keyset_page(q, keys, page.cursor, key_types, page.limit or DEFAULT_PAGE_SIZE)
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        if page.format == 'json':
+            response.headers.update(headers)
+            return rows
+        body = _json_body((serialize(r) for r in rows), page.format)
+    else:
+        rows = q.order_by(*keys).yield_per(STREAM_CHUNK_SIZE)
+        body = _json_body((serialize(r) for r in rows), page.format)
+    return StreamingResponse(body, media_type=_media_type(page.format), headers=headers)
+
+
+async def paginate_async(db, query_fn: Callable, key, page: PageParams, serialize: Callable, response: Response):
+    """paginate() for the AsyncSession routers.
+
+    `query_fn(session)` builds the query inside `db.run_sync`. A server-side cursor can't
+    be held across `run_sync` calls, so the streamed form walks the listing in
+    STREAM_CHUNK_SIZE keyset pages instead of `yield_per`.
+    """
+    if page.paged:
+        return await db.run_sync(lambda s: paginate(query_fn(s), key, page, serialize, response))
+
+    headers = {}
+    if page.include_total:
+        headers['X-Total-Count'] = str(await db.run_sync(lambda s: query_fn(s).order_by(None).count()))
+
+    def chunk(s, cursor):
+        rows, next_cursor = keyset_page(query_fn(s), [key], cursor, [int], STREAM_CHUNK_SIZE)
+        return [serialize(r) for r in rows], next_cursor
+
+    async def rows():
+        cursor = None
+        while True:
+            items, cursor = await db.run_sync(chunk, cursor)
+            for item in items:
+                yield item
+            if not cursor:
+                return
+
+    async def body():
+        fmt = page.format
+        first = True
+        if fmt == 'json':
+            yield '['
+        async for d in rows():
+            if fmt == 'ndjson':
+                yield json.dumps(d) + '\n'
+            else:
+                yield json.dumps(d) if first else ',' + json.dumps(d)
+            first = False
+        if fmt == 'json':
+            yield ']'
+
+    return StreamingResponse(body(), media_type=_media_type(page.format), headers=headers)
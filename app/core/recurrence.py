@@ -0,0 +1,139 @@
+"""RRULE subset for recurring activities.
+
+Supported parts: FREQ=DAILY|WEEKLY, INTERVAL, COUNT, UNTIL and BYDAY (plain weekday codes,
+no ordinals). Every rule must be bounded by COUNT or UNTIL. As with dateutil, DTSTART is
+only an occurrence if it matches the rule; expansion never yields anything before it.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+
+# days a rule may step through looking for occurrences (about a century of daily steps)
+MAX_CANDIDATE_DAYS = 36600
+
+
+class RecurrenceRule(NamedTuple):
+    freq: str
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+    byday: Optional[FrozenSet[int]] = None
+
+
+def _parse_until(value: str) -> datetime:
+    try:
+        if 'T' not in value:
+            # a date bound includes the whole day
+            return datetime.combine(datetime.strptime(value, '%Y%m%d').date(), time.max)
+        if value.endswith('Z'):
+            return datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+        return datetime.strptime(value, '%Y%m%dT%H%M%S')
+    except ValueError:
+        raise ValueError(f'Invalid UNTIL value {value!r}')
+
+
+def parse_rrule(text: str) -> RecurrenceRule:
+    """Parse e.g. 'FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20270630'. Raises ValueError."""
+    text = text.strip()
+    if text.upper().startswith('RRULE:'):
+        text = text[6:]
+    parts = {}
+    for part in filter(None, text.split(';')):
+        key, sep, value = part.partition('=')
+        if not sep or not value:
+            raise ValueError(f'Invalid RRULE part {part!r}')
+        key = key.strip().upper()
+        if key in parts:
+            raise ValueError(f'Duplicate RRULE part {key}')
+        parts[key] = value.strip()
+    unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY'}
+    if unsupported:
+        raise ValueError(f'Unsupported RRULE parts: {", ".join(sorted(unsupported))}')
+    freq = parts.get('FREQ', '').upper()
+    if freq not in ('DAILY', 'WEEKLY'):
+        raise ValueError('FREQ must be DAILY or WEEKLY')
+    try:
+        interval = int(parts.get('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+    except ValueError:
+        raise ValueError('INTERVAL and COUNT must be integers')
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError('INTERVAL and COUNT must be positive')
+    until = _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None
+    if (count is None) == (until is None):
+        raise ValueError('Exactly one of COUNT or UNTIL is required')
+    byday = None
+    if 'BYDAY' in parts:
+        codes = [c.strip().upper() for c in parts['BYDAY'].split(',')]
+        if not all(c in WEEKDAYS for c in codes):
+            raise ValueError('BYDAY takes weekday codes MO..SU')
+        byday = frozenset(WEEKDAYS[c] for c in codes)
+    return RecurrenceRule(freq, interval, count, until, byday)
+
+
+def _reachable_byday(rule: RecurrenceRule, first: date):
+    """BYDAY values a DAILY rule can land on; a stride of whole weeks repeats one weekday."""
+    if rule.freq != 'DAILY' or rule.byday is None or rule.interval % 7:
+        return rule.byday
+    return rule.byday & {first.weekday()}
+
+
+def _candidate_days(rule: RecurrenceRule, first: date, last: Optional[date]):
+    """Days the rule lands on from `first`, stopping after `last` (if given).
+
+    Raises ValueError once MAX_CANDIDATE_DAYS days have been stepped through or the
+    calendar runs out.
+    """
+    try:
+        if rule.freq == 'DAILY':
+            for step in range(MAX_CANDIDATE_DAYS):
+                day = first + timedelta(days=step * rule.interval)
+                if last is not None and day > last:
+                    return
+                if rule.byday is None or day.weekday() in rule.byday:
+                    yield day
+        else:
+            days = sorted(rule.byday) if rule.byday else [first.weekday()]
+            week = first - timedelta(days=first.weekday())
+            for step in range(MAX_CANDIDATE_DAYS // 7):
+                start = week + timedelta(weeks=step * rule.interval)
+                for weekday in days:
+                    day = start + timedelta(days=weekday)
+                    if last is not None and day > last:
+                        return
+                    if day >= first:
+                        yield day
+    except OverflowError:
+        pass
+    raise ValueError('Recurrence does not end within the supported date range')
+
+
+def expand(rule: RecurrenceRule, start: datetime, end: datetime, limit: int) -> List[Tuple[datetime, datetime]]:
+    """(start, end) of every occurrence, each lasting as long as the first.
+
+    Raises ValueError when the rule yields more than `limit` occurrences, occurrences
+    that overlap one another, or none at all because BYDAY is out of the stride's reach.
+    """
+    duration = end - start
+    until = rule.until
+    if until is not None and until.tzinfo is not None:
+        until = until.astimezone(start.tzinfo or timezone.utc)
+        if start.tzinfo is None:
+            until = until.replace(tzinfo=None)
+    if rule.byday is not None and not _reachable_byday(rule, start.date()):
+        raise ValueError('BYDAY never falls on a day reached by FREQ=DAILY with this INTERVAL and start')
+    out = []
+    for day in _candidate_days(rule, start.date(), until.date() if until is not None else None):
+        occurrence = datetime.combine(day, start.timetz())
+        if until is not None and occurrence > until:
+            break
+        if len(out) == limit:
+            raise ValueError(f'Recurrence yields more than {limit} occurrences')
+        out.append((occurrence, occurrence + duration))
+        if rule.count is not None and len(out) == rule.count:
+            break
+    for (_, prev_end), (next_start, _) in zip(out, out[1:]):
+        if next_start < prev_end:
+            raise ValueError('Occurrences overlap; shorten the activity or widen the interval')
+    return out
@@ -3,14 +3,20 @@ from fastapi import Depends, HTTPException, Security, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from jose import jwt
-import requests
-import time
+import hashlib
 import logging
+import time
 
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.database import SessionLocal, get_db
-from app.models.models import User
+from app.core.database import get_db, get_async_db
+from app.core.jwks import JWKSKeyStore, JWKSFetchError
+from app.models.models import User, Role, UserRole, Ticket, AgentAssignment
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
@@ -21,55 +27,99 @@ class AuthenticatedUser(BaseModel):
     roles: List[str] = []
 
 
-# JWKS cache
-_JWKS_CACHE = {"keys": None, "fetched_at": 0, "ttl": 3600}
+# Principal cache: keycloak `sub` -> local users.id. Roles are always taken from the
+# verified token, so only the id mapping is cached.
+_PRINCIPAL_CACHE = TTLCache('principals', maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
 
 
-def _get_jwks():
-    """Fetch JWKS from Keycloak and cache for TTL seconds."""
-    now = time.time()
-    if _JWKS_CACHE['keys'] and (now - _JWKS_CACHE['fetched_at'] < _JWKS_CACHE['ttl']):
-        return _JWKS_CACHE['keys']
-    jwks_url = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/certs"
-    try:
-        r = requests.get(jwks_url, timeout=5)
-        r.raise_for_status()
-        jwks = r.json()
-        _JWKS_CACHE['keys'] = jwks
-        _JWKS_CACHE['fetched_at'] = now
-        return jwks
-    except Exception as e:
-        logger.exception('Failed to fetch JWKS')
-        raise HTTPException(status_code=502, detail='Failed to fetch JWKS')
+# Role cache: users.id -> (keycloak_id, role names) for the X-Test-User path.
+_ROLE_CACHE = TTLCache('user_roles', maxsize=settings.ROLE_CACHE_SIZE, ttl=settings.ROLE_CACHE_TTL)
 
 
-def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Security(HTTPBearer(auto_error=False))) -> AuthenticatedUser:
-    # If bypass mode is enabled, prefer the bypass dependency in routes that use it.
-    # This function will still be used as a fallback for routes that call it directly.
-    if settings.KEYCLOAK_BYPASS:
-        raise HTTPException(status_code=500, detail='KEYCLOAK_BYPASS requires using get_current_user_bypass in route')
+def invalidate_user_roles(user_id: int) -> None:
+    """Drop the cached roles of one user; call after changing their role memberships."""
+    _ROLE_CACHE.pop(user_id)
 
-    # If no credentials were provided, return an anonymous user (id=0, no roles).
-    # This allows unauthenticated endpoints to function in tests and in public routes.
-    if credentials is None:
-        return AuthenticatedUser(id=0, keycloak_id='', roles=[])
 
-    token = credentials.credentials
-    # Get JWKS; in tests jwt.decode can be monkeypatched to bypass actual verification
-    jwks = _get_jwks()
+def invalidate_all_roles() -> None:
+    """Drop every cached role set; call after renaming or deleting a role."""
+    _ROLE_CACHE.clear()
+
+
+@event.listens_for(User, 'after_delete')
+def _evict_deleted_principal(mapper, connection, target):
+    _PRINCIPAL_CACHE.pop(target.keycloak_id)
+    invalidate_user_roles(target.id)
+
+
+# ORM-level membership writes (scripts, bulk import, tests) invalidate as well, so the
+# explicit hooks in the admin API are not the only way to keep the cache honest.
+@event.listens_for(UserRole, 'after_insert')
+@event.listens_for(UserRole, 'after_delete')
+def _evict_changed_membership(mapper, connection, target):
+    invalidate_user_roles(target.user_id)
+
+
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _evict_changed_role(mapper, connection, target):
+    invalidate_all_roles()
+
+
+# Verified tokens: sha256(token) -> claims. Entries expire at the token's own `exp`, so a
+# hit never outlives the token; repeat requests skip the RSA signature check.
+_TOKEN_CACHE = TTLCache('verified_tokens', maxsize=settings.TOKEN_CACHE_SIZE)
+
+
+def _jwks_url() -> str:
+    return f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}/protocol/openid-connect/certs"
+
+
+# Verification keys by kid, refreshed in the background (started on app startup)
+jwks_store = JWKSKeyStore(_jwks_url, ttl=settings.JWKS_TTL, refresh_ahead=settings.JWKS_REFRESH_AHEAD, min_refetch_interval=settings.JWKS_MIN_REFETCH_INTERVAL)
+
+
+def _provision_user(db: Session, sub: str, claims: dict) -> int:
+    """Return the local user id for `sub`, creating the row the first time it is seen.
+
+    Uses the request's own session so an authenticated request holds a single connection.
+    """
+    row = db.query(User.id).filter(User.keycloak_id == sub).first()
+    if row:
+        return row.id
+    user = User(
+        keycloak_id=sub,
+        email=claims.get('email'),
+        first_name=claims.get('given_name'),
+        last_name=claims.get('family_name'),
+    )
+    db.add(user)
+    try:
+        db.flush()
+        user_id = user.id
+        db.commit()
+    except IntegrityError:
+        # a concurrent request provisioned the same subject first
+        db.rollback()
+        row = db.query(User.id).filter(User.keycloak_id == sub).first()
+        if not row:
+            raise HTTPException(status_code=409, detail='Could not provision local user')
+        return row.id
+    return user_id
+
+
+def _verify_token(token: str) -> dict:
+    """Validate signature, audience and issuer of a bearer token and return its claims."""
     try:
         # Allow jwt.decode to be mocked in tests; production will validate signature
         unverified_header = jwt.get_unverified_header(token)
-        kid = unverified_header.get('kid')
-        key = None
-        for k in jwks.get('keys', []):
-            if k.get('kid') == kid:
-                key = k
-                break
-        if not key:
+        try:
+            public_key = jwks_store.get_key(unverified_header.get('kid'))
+        except JWKSFetchError:
+            raise HTTPException(status_code=502, detail='Failed to fetch JWKS')
+        if public_key is None:
             raise HTTPException(status_code=401, detail='Public key not found')
 
-        public_key = jwt.construct_rsa_key(key)
         issuer = f"{settings.KEYCLOAK_SERVER_URL}/realms/{settings.KEYCLOAK_REALM}"
         claims = jwt.decode(
             token,
@@ -83,34 +133,64 @@ def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Secur
     except Exception as e:
         logger.exception('Token validation failed')
         raise HTTPException(status_code=401, detail='Invalid token')
+    return claims
+
+
+def _token_claims(token: str, cache_only: bool = False) -> Optional[dict]:
+    """Verified claims of a bearer token, from the token cache when possible.
 
-    sub = claims.get('sub')
-    if not sub:
+    With cache_only, returns None instead of verifying an uncached token.
+    """
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    claims = _TOKEN_CACHE.get(token_key)
+    if claims is None:
+        if cache_only:
+            return None
+        claims = _verify_token(token)
+        exp = claims.get('exp')
+        if isinstance(exp, (int, float)) and exp > time.time():
+            _TOKEN_CACHE.set(token_key, claims, expires_at=exp)
+    if not claims.get('sub'):
         raise HTTPException(status_code=401, detail='Invalid token: missing sub')
+    return claims
+
 
-    roles = []
+def _token_roles(claims: dict) -> List[str]:
     realm_access = claims.get('realm_access')
     if realm_access and isinstance(realm_access, dict):
-        roles = realm_access.get('roles', []) or []
+        return realm_access.get('roles', []) or []
+    return []
 
-    # Ensure local user exists (cache basic profile)
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.keycloak_id == sub).first()
-        if not user:
-            user = User(
-                keycloak_id=sub,
-                email=claims.get('email'),
-                first_name=claims.get('given_name'),
-                last_name=claims.get('family_name'),
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-    finally:
-        db.close()
 
-    return AuthenticatedUser(id=user.id, keycloak_id=sub, roles=roles)
+def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Security(HTTPBearer(auto_error=False)), db: Session = Depends(get_db)) -> AuthenticatedUser:
+    # If bypass mode is enabled, prefer the bypass dependency in routes that use it.
+    # This function will still be used as a fallback for routes that call it directly.
+    if settings.KEYCLOAK_BYPASS:
+        raise HTTPException(status_code=500, detail='KEYCLOAK_BYPASS requires using get_current_user_bypass in route')
+
+    # If no credentials were provided, return an anonymous user (id=0, no roles).
+    # This allows unauthenticated endpoints to function in tests and in public routes.
+    if credentials is None:
+        return AuthenticatedUser(id=0, keycloak_id='', roles=[])
+
+    claims = _token_claims(credentials.credentials)
+    sub = claims['sub']
+    # Resolve the local user id, provisioning it on first sight
+    user_id = _PRINCIPAL_CACHE.get(sub)
+    if user_id is None:
+        user_id = _provision_user(db, sub, claims)
+        _PRINCIPAL_CACHE.set(sub, user_id)
+
+    return AuthenticatedUser(id=user_id, keycloak_id=sub, roles=_token_roles(claims))
+
+
+def authorize_ticket_view(db: Session, ticket: Ticket, user, detail: str = 'Not authorized to view this ticket history') -> None:
+    """Allow the ticket creator, an agent assigned to the ticket's queue, or an admin."""
+    if ticket.client_user_id == user.id or 'admin' in getattr(user, 'roles', []):
+        return
+    is_agent_assigned = db.query(AgentAssignment.id).filter(AgentAssignment.agent_user_id == user.id, AgentAssignment.queue_id == ticket.current_queue_id).first()
+    if not is_agent_assigned:
+        raise HTTPException(status_code=403, detail=detail)
 
 
 def require_role(required_role: str):
@@ -122,6 +202,54 @@ def require_role(required_role: str):
     return _dependency
 
 
+def _test_user_id(request: Request) -> Optional[int]:
+    header = request.headers.get('x-test-user')
+    if not header:
+        return None
+    try:
+        return int(header)
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid X-Test-User header')
+
+
+def _load_test_user(db: Session, uid: int) -> AuthenticatedUser:
+    """Resolve (or, in dev bypass mode, create) the user impersonated via X-Test-User."""
+    user = db.query(User).filter(User.id == uid).first()
+    if not user:
+        # In dev bypass mode, auto-create a minimal test user when the requested id
+        # does not exist. This allows the admin SPA to continue working after the
+        # local test DB was reset without requiring manual user creation.
+        try:
+            user = User(id=uid, keycloak_id=f'dev-{uid}', first_name='Dev', last_name=str(uid), email=None)
+            db.add(user)
+            db.flush()
+            # ensure an 'admin' role exists and assign it to the test user so
+            # admin-only endpoints are accessible in dev mode after DB reset
+            role = db.query(Role).filter(Role.name == 'admin').first()
+            if not role:
+                role = Role(name='admin')
+                db.add(role)
+                db.flush()
+            # create user role mapping if missing
+            ur = db.query(UserRole).filter(UserRole.user_id == user.id, UserRole.role_id == role.id).first()
+            if not ur:
+                ur = UserRole(user_id=user.id, role_id=role.id)
+                db.add(ur)
+            db.commit()
+            db.refresh(user)
+        except Exception:
+            # fallback: surface a clear 404 if we cannot create the user for any reason
+            raise HTTPException(status_code=404, detail='Test user not found and could not be created')
+    logger.info("test user: impersonating test user id=%s", uid)
+    # gather roles from UserRole -> Role
+    role_rows = db.query(Role.name).join(UserRole, Role.id == UserRole.role_id).filter(UserRole.user_id == user.id).all()
+    roles = [r[0] for r in role_rows]
+    logger.debug("test user: resolved roles=%s for user id=%s", roles, uid)
+    logger.info("test user: resolved roles=%s for user id=%s", roles, uid)
+    _ROLE_CACHE.set(uid, (user.keycloak_id, tuple(roles)))
+    return AuthenticatedUser(id=user.id, keycloak_id=user.keycloak_id, roles=roles)
+
+
 def get_current_user_bypass(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Security(HTTPBearer(auto_error=False)), db: Session = Depends(get_db)) -> AuthenticatedUser:
     """Alternate dependency to use when KEYCLOAK_BYPASS is enabled in settings.
     This will accept a header X-Test-User with a numeric user id to impersonate that user.
@@ -133,56 +261,61 @@ def get_current_user_bypass(request: Request, credentials: Optional[HTTPAuthoriz
     """
     if not settings.KEYCLOAK_BYPASS:
         # fall back to normal behavior
-        return get_current_user(credentials)
+        return get_current_user(credentials, db)
 
     # Try X-Test-User header
-    test_user_header = request.headers.get('x-test-user')
+    uid = _test_user_id(request)
     # Use provided db session (this allows tests to override get_db)
-    if test_user_header:
-        try:
-            uid = int(test_user_header)
-        except Exception:
-            raise HTTPException(status_code=400, detail='Invalid X-Test-User header')
-        user = db.query(User).filter(User.id == uid).first()
-        if not user:
-            # In dev bypass mode, auto-create a minimal test user when the requested id
-            # does not exist. This allows the admin SPA to continue working after the
-            # local test DB was reset without requiring manual user creation.
-            try:
-                user = User(id=uid, keycloak_id=f'dev-{uid}', first_name='Dev', last_name=str(uid), email=None)
-                db.add(user)
-                db.flush()
-                # ensure an 'admin' role exists and assign it to the test user so
-                # admin-only endpoints are accessible in dev mode after DB reset
-                from app.models.models import Role, UserRole
-                role = db.query(Role).filter(Role.name == 'admin').first()
-                if not role:
-                    role = Role(name='admin')
-                    db.add(role)
-                    db.flush()
-                # create user role mapping if missing
-                ur = db.query(UserRole).filter(UserRole.user_id == user.id, UserRole.role_id == role.id).first()
-                if not ur:
-                    ur = UserRole(user_id=user.id, role_id=role.id)
-                    db.add(ur)
-                db.commit()
-                db.refresh(user)
-            except Exception:
-                # fallback: surface a clear 404 if we cannot create the user for any reason
-                raise HTTPException(status_code=404, detail='Test user not found and could not be created')
-        logger.debug("get_current_user_bypass: header x-test-user=%s", test_user_header)
-        logger.info("get_current_user_bypass: impersonating test user id=%s", uid)
-        # gather roles from UserRole -> Role
-        from app.models.models import UserRole, Role
-        role_rows = db.query(Role.name).join(UserRole, Role.id == UserRole.role_id).filter(UserRole.user_id == user.id).all()
-        roles = [r[0] for r in role_rows]
-        logger.debug("get_current_user_bypass: resolved roles=%s for user id=%s", roles, uid)
-        logger.info("get_current_user_bypass: resolved roles=%s for user id=%s", roles, uid)
-        return AuthenticatedUser(id=user.id, keycloak_id=user.keycloak_id, roles=roles)
+    if uid is not None:
+        cached = _ROLE_CACHE.get(uid)
+        if cached is not None:
+            keycloak_id, roles = cached
+            return AuthenticatedUser(id=uid, keycloak_id=keycloak_id, roles=list(roles))
+        return _load_test_user(db, uid)
 
     # else fallback to token path
     # If no credentials were provided (e.g., anonymous request in tests), return an anonymous user
     # with no roles so endpoints that don't require authentication can proceed.
     if credentials is None:
         return AuthenticatedUser(id=0, keycloak_id='', roles=[])
-    return get_current_user(credentials)
+    return get_current_user(credentials, db)
+
+
+async def get_current_user_async(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Security(HTTPBearer(auto_error=False)), db: AsyncSession = Depends(get_async_db)) -> AuthenticatedUser:
+    """get_current_user_bypass for the async routers.
+
+    Runs on the request's AsyncSession (FastAPI hands the route the same session), so an
+    authenticated request uses one connection and never waits for a threadpool worker.
+    Cache hits touch no database at all; a token that still needs its signature checked
+    is verified in the threadpool, since a JWKS fetch may block.
+    """
+    if settings.KEYCLOAK_BYPASS:
+        uid = _test_user_id(request)
+        if uid is not None:
+            cached = _ROLE_CACHE.get(uid)
+            if cached is not None:
+                keycloak_id, roles = cached
+                return AuthenticatedUser(id=uid, keycloak_id=keycloak_id, roles=list(roles))
+            return await db.run_sync(_load_test_user, uid)
+    if credentials is None:
+        return AuthenticatedUser(id=0, keycloak_id='', roles=[])
+
+    claims = _token_claims(credentials.credentials, cache_only=True)
+    if claims is None:
+        claims = await run_in_threadpool(_token_claims, credentials.credentials)
+    sub = claims['sub']
+    user_id = _PRINCIPAL_CACHE.get(sub)
+    if user_id is None:
+        user_id = await db.run_sync(_provision_user, sub, claims)
+        _PRINCIPAL_CACHE.set(sub, user_id)
+    return AuthenticatedUser(id=user_id, keycloak_id=sub, roles=_token_roles(claims))
+
+
+def require_role_async(required_role: str):
+    """require_role for routes authenticated with get_current_user_async."""
+    async def _dependency(user: AuthenticatedUser = Depends(get_current_user_async)):
+        if required_role not in user.roles:
+            raise HTTPException(status_code=403, detail='Missing required role')
+        return True
+
+    return _dependency
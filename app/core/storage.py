@@ -1,17 +1,92 @@
+import hashlib
 import os
-from typing import IO
+import tempfile
+from typing import IO, NamedTuple, Optional
+
+from app.core.config import settings
+
+
+class UploadTooLarge(Exception):
+    """Raised by LocalStorage.save when an upload exceeds the configured maximum size."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f'Upload exceeds the maximum size of {max_bytes} bytes')
+        self.max_bytes = max_bytes
+
+
+class StoredFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+class StagedFile(NamedTuple):
+    tmp_path: str
+    sha256: str
+    size: int
 
 
 class LocalStorage:
-    def __init__(self, base_path: str = './uploads'):
-        self.base_path = base_path
+    """Content-addressed file store on the local filesystem.
+
+    Uploads are copied in fixed-size chunks into a temp file under `base_path/tmp` while
+    their SHA-256 is computed, then atomically renamed to `base_path/ab/cd/<sha256>`.
+    Memory use per upload is one chunk, and identical content always lands on the same
+    path, so same-named uploads no longer overwrite each other. save() does both steps;
+    stage() and publish() let a caller claim the content before it appears at its path.
+    """
+
+    def __init__(self, base_path: Optional[str] = None, max_bytes: Optional[int] = None, chunk_size: Optional[int] = None):
+        self.base_path = base_path or settings.STORAGE_PATH
+        self.max_bytes = settings.ATTACHMENT_MAX_BYTES if max_bytes is None else max_bytes
+        self.chunk_size = chunk_size or settings.STORAGE_CHUNK_SIZE
         os.makedirs(self.base_path, exist_ok=True)
 
-    def save(self, file_obj: IO, filename: str) -> str:
-        path = os.path.join(self.base_path, filename)
-        with open(path, 'wb') as f:
-            f.write(file_obj.read())
-        return path
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.base_path, sha256[:2], sha256[2:4], sha256)
+
+    def stage(self, file_obj: IO) -> StagedFile:
+        """Copy `file_obj` into a temp file under `base_path/tmp`, hashing it on the way."""
+        tmp_dir = os.path.join(self.base_path, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file_obj.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if self.max_bytes and size > self.max_bytes:
+                        raise UploadTooLarge(self.max_bytes)
+                    hasher.update(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+        except BaseException:
+            self.discard(StagedFile(tmp_path, '', size))
+            raise
+        return StagedFile(tmp_path, hasher.hexdigest(), size)
+
+    def publish(self, staged: StagedFile) -> StoredFile:
+        """Move a staged file to its content address."""
+        path = self.path_for(staged.sha256)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged.tmp_path, path)
+        except BaseException:
+            self.discard(staged)
+            raise
+        return StoredFile(path, staged.sha256, staged.size)
+
+    def discard(self, staged: StagedFile) -> None:
+        if os.path.exists(staged.tmp_path):
+            os.remove(staged.tmp_path)
 
+    def save(self, file_obj: IO, filename: Optional[str] = None) -> StoredFile:
+        """Stream `file_obj` into the store; `filename` is only kept by the caller's metadata."""
+        return self.publish(self.stage(file_obj))
 
 storage = LocalStorage()
@@ -0,0 +1,151 @@
+"""Bulk user import from CSV rows (keycloak_id,email,first_name,last_name,dni,roles).
+
+Shared by POST /admin/users/bulk and scripts/bulk_create_users.py. Rows are processed in
+batches: existing users, roles and role memberships of a batch are fetched with one IN
+query each, new rows are bulk inserted, updates are applied as one executemany, and each
+batch is committed once. A batch runs inside a SAVEPOINT; if it fails (e.g. a duplicate
+email) only the savepoint is rolled back and the batch is replayed row by row, so just
+the offending rows are reported as errors.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+from app.core.security import invalidate_user_roles
+
+USER_COLUMNS = ('email', 'first_name', 'last_name', 'dni')
+
+
+def _roles(row: dict) -> List[str]:
+    roles_cell = row.get('roles') or ''
+    return [r.strip() for r in roles_cell.split(';') if r.strip()]
+
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[List[Tuple[int, dict]]]:
+    """Numbered rows in batches of `size`; a keycloak_id repeated inside a batch starts a
+    new batch so later rows see the effect of earlier ones, as in a row-by-row import."""
+    batch, seen = [], set()
+    for idx, row in enumerate(rows, start=1):
+        kc = row.get('keycloak_id')
+        if len(batch) >= size or (kc and kc in seen):
+            yield batch
+            batch, seen = [], set()
+        batch.append((idx, row))
+        if kc:
+            seen.add(kc)
+    if batch:
+        yield batch
+
+
+def _role_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    names = set(names)
+    if not names:
+        return {}
+    found = dict(db.query(models.Role.name, models.Role.id).filter(models.Role.name.in_(names)).all())
+    missing = [{'name': n} for n in sorted(names - found.keys())]
+    if missing:
+        for rid, name in db.execute(insert(models.Role).returning(models.Role.id, models.Role.name), missing):
+            found[name] = rid
+    return found
+
+
+def _import_batch(db: Session, batch: List[Tuple[int, dict]]) -> Tuple[List[dict], set]:
+    results: Dict[int, dict] = {}
+    rows = []
+    for idx, row in batch:
+        if not row.get('keycloak_id'):
+            results[idx] = {'row': idx, 'status': 'error', 'message': 'missing keycloak_id'}
+        else:
+            rows.append((idx, row))
+
+    kcs = [row['keycloak_id'] for _, row in rows]
+    existing = dict(db.query(models.User.keycloak_id, models.User.id).filter(models.User.keycloak_id.in_(kcs)).all()) if kcs else {}
+
+    new_rows = [(idx, row) for idx, row in rows if row['keycloak_id'] not in existing]
+    if new_rows:
+        inserted = db.execute(
+            insert(models.User).returning(models.User.id, sort_by_parameter_order=True),
+            [{'keycloak_id': row['keycloak_id'], **{c: row.get(c) for c in USER_COLUMNS}} for _, row in new_rows],
+        ).scalars().all()
+        for (idx, row), uid in zip(new_rows, inserted):
+            results[idx] = {'row': idx, 'status': 'created', 'user_id': uid}
+
+    # existing users: only non-empty cells overwrite stored values
+    updates = []
+    for idx, row in rows:
+        uid = existing.get(row['keycloak_id'])
+        if uid is None:
+            continue
+        results[idx] = {'row': idx, 'status': 'updated', 'user_id': uid}
+        values = {c: row.get(c) for c in USER_COLUMNS if row.get(c)}
+        if values:
+            updates.append({'id': uid, **values})
+    if updates:
+        db.execute(update(models.User), updates)
+
+    # role memberships
+    wanted = {(results[idx]['user_id'], rn) for idx, row in rows for rn in _roles(row)}
+    touched = set()
+    if wanted:
+        role_ids = _role_ids(db, (rn for _, rn in wanted))
+        pairs = {(uid, role_ids[rn]) for uid, rn in wanted}
+        uids = {uid for uid, _ in pairs}
+        have = set(db.query(models.UserRole.user_id, models.UserRole.role_id).filter(models.UserRole.user_id.in_(uids), models.UserRole.role_id.in_(set(role_ids.values()))).all())
+        new_pairs = sorted(pairs - have)
+        if new_pairs:
+            db.execute(insert(models.UserRole), [{'user_id': uid, 'role_id': rid} for uid, rid in new_pairs])
+            touched = {uid for uid, _ in new_pairs}
+    return [results[idx] for idx, _ in batch], touched
+
+
+def _import_row(db: Session, idx: int, row: dict) -> Tuple[dict, Optional[int]]:
+    """Fallback path: one row in its own savepoint."""
+    kc = row.get('keycloak_id')
+    if not kc:
+        return {'row': idx, 'status': 'error', 'message': 'missing keycloak_id'}, None
+    try:
+        with db.begin_nested():
+            u = db.query(models.User).filter(models.User.keycloak_id == kc).first()
+            created = u is None
+            if created:
+                u = models.User(keycloak_id=kc, **{c: row.get(c) for c in USER_COLUMNS})
+                db.add(u)
+                db.flush()
+            else:
+                for c in USER_COLUMNS:
+                    if row.get(c):
+                        setattr(u, c, row.get(c))
+            role_ids = _role_ids(db, _roles(row))
+            have = {rid for (rid,) in db.query(models.UserRole.role_id).filter(models.UserRole.user_id == u.id)}
+            for rid in set(role_ids.values()) - have:
+                db.add(models.UserRole(user_id=u.id, role_id=rid))
+    except Exception as e:
+        return {'row': idx, 'status': 'error', 'message': str(e)}, None
+    return {'row': idx, 'status': 'created' if created else 'updated', 'user_id': u.id}, u.id
+
+
+def import_users(db: Session, rows: Iterable[dict], batch_size: Optional[int] = None) -> List[dict]:
+    """Create or update users (and their roles) from CSV dict rows; returns per-row results
+    ({'row', 'status': 'created'|'updated'|'error', 'user_id' or 'message'}) in input order."""
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    results = []
+    for batch in _batches(rows, batch_size):
+        try:
+            with db.begin_nested():
+                batch_results, touched = _import_batch(db, batch)
+        except Exception:
+            batch_results, touched = [], set()
+            for idx, row in batch:
+                res, uid = _import_row(db, idx, row)
+                batch_results.append(res)
+                if uid is not None:
+                    touched.add(uid)
+        db.commit()
+        # memberships were written with Core statements, which skip the ORM cache hooks
+        for uid in touched:
+            invalidate_user_roles(uid)
+        results.extend(batch_results)
+    return results
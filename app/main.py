@@ -4,6 +4,8 @@ from fastapi.security import HTTPBearer
 from app.core.config import settings
 from app.core.database import engine
 from app.core.database import Base
+from app.core.security import jwks_store
+from app.core.catalog import seed_catalog_versions
 from app.api import logistics, tickets, agents, activities, attachments, admin
 from app.api import users
 
@@ -19,6 +21,11 @@ security_scheme = {"bearerAuth": {"type": "http", "scheme": "bearer", "bearerFor
 def on_startup():
     # For development only: create tables if they don't exist. Alembic is recommended for migrations.
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        seed_catalog_versions(conn)
+    # Keep Keycloak verification keys warm so requests never wait on a JWKS fetch
+    if not settings.KEYCLOAK_BYPASS:
+        jwks_store.start()
 
 
 @app.get("/health")
@@ -1,9 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, Boolean, Index, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 
 
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
@@ -36,12 +42,18 @@ class Group(Base):
 
 class UserGroup(Base):
     __tablename__ = 'user_groups'
+    __table_args__ = (
+        Index('ix_user_groups_group_id', 'group_id'),
+    )
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     group_id = Column(Integer, ForeignKey('groups.id'), primary_key=True)
 
 
 class QueuePermission(Base):
     __tablename__ = 'queue_permissions'
+    __table_args__ = (
+        Index('ix_queue_permissions_queue_group', 'queue_id', 'group_id'),
+    )
     id = Column(Integer, primary_key=True)
     group_id = Column(Integer, ForeignKey('groups.id'))
     queue_id = Column(Integer, ForeignKey('queues.id'))
@@ -83,6 +95,9 @@ class SpaceTemplate(Base):
 
 class SpaceTemplateField(Base):
     __tablename__ = 'space_template_fields'
+    __table_args__ = (
+        Index('ix_space_template_fields_template_id', 'space_template_id'),
+    )
     id = Column(Integer, primary_key=True)
     space_template_id = Column(Integer, ForeignKey('space_templates.id'))
     name = Column(String, nullable=False)
@@ -129,6 +144,9 @@ class ActivityType(Base):
 
 class ActivityTypeField(Base):
     __tablename__ = 'activity_type_fields'
+    __table_args__ = (
+        Index('ix_activity_type_fields_type_id', 'activity_type_id'),
+    )
     id = Column(Integer, primary_key=True)
     activity_type_id = Column(Integer, ForeignKey('activity_types.id'))
     name = Column(String, nullable=False)
@@ -138,6 +156,9 @@ class ActivityTypeField(Base):
 
 class ActivityFieldValue(Base):
     __tablename__ = 'activity_field_values'
+    __table_args__ = (
+        Index('ix_activity_field_values_activity_id', 'activity_id'),
+    )
     id = Column(Integer, primary_key=True)
     activity_id = Column(Integer, ForeignKey('activities.id'))
     field_id = Column(Integer, ForeignKey('activity_type_fields.id'))
@@ -146,6 +167,10 @@ class ActivityFieldValue(Base):
 
 class Activity(Base):
     __tablename__ = 'activities'
+    __table_args__ = (
+        Index('ix_activities_start_end', 'start_time', 'end_time'),
+        Index('ix_activities_organizer', 'organizer_user_id'),
+    )
     id = Column(Integer, primary_key=True)
     category_id = Column(Integer, ForeignKey('activity_categories.id'))
     activity_type_id = Column(Integer, ForeignKey('activity_types.id'), nullable=True)
@@ -158,22 +183,71 @@ class Activity(Base):
 
 class SpaceBooking(Base):
     __tablename__ = 'space_bookings'
+    __table_args__ = (
+        Index('ix_space_bookings_space_window', 'space_id', 'status', 'start_time', 'end_time'),
+        Index('ix_space_bookings_activity_id', 'activity_id'),
+    )
     id = Column(Integer, primary_key=True)
     activity_id = Column(Integer, ForeignKey('activities.id'))
     space_id = Column(Integer, ForeignKey('spaces.id'))
     status = Column(String, nullable=False, default='Pending')
+    # copied from the activity (see app.core.bookings) so overlap checks stay on this index
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
 
 
 class StockBooking(Base):
     __tablename__ = 'stock_bookings'
+    __table_args__ = (
+        Index('ix_stock_bookings_item_window', 'item_id', 'status', 'start_time', 'end_time'),
+        Index('ix_stock_bookings_activity_id', 'activity_id'),
+    )
     id = Column(Integer, primary_key=True)
     activity_id = Column(Integer, ForeignKey('activities.id'))
     item_id = Column(Integer, ForeignKey('stock_items.id'))
     status = Column(String, nullable=False, default='Pending')
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
+
+
+class BookingLock(Base):
+    """One row per bookable resource. Reservations update their resources' rows first, so
+    concurrent bookers of the same space or item queue on that row lock (app.core.bookings)."""
+    __tablename__ = 'booking_locks'
+    resource_type = Column(String, primary_key=True)
+    resource_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # seconds; no booking of the resource is longer, so conflict probes scan no further back.
+    # NULL until lock_resources() computes it from the resource's bookings
+    max_duration = Column(Integer, nullable=True)
+
+
+# On PostgreSQL the database itself refuses overlapping confirmed bookings as well.
+BOOKING_EXCLUSION_CONSTRAINTS = {
+    'space_bookings': ('excl_space_bookings_no_overlap', 'space_id'),
+    'stock_bookings': ('excl_stock_bookings_no_overlap', 'item_id'),
+}
+
+
+def booking_exclusion_ddl(table: str) -> str:
+    name, resource = BOOKING_EXCLUSION_CONSTRAINTS[table]
+    return (
+        f"ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist "
+        f"({resource} WITH =, tsrange(start_time, end_time) WITH &&) "
+        f"WHERE (status = 'Confirmed' AND start_time IS NOT NULL)"
+    )
+
+
+for _table in (SpaceBooking.__table__, StockBooking.__table__):
+    event.listen(_table, 'after_create', DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+    event.listen(_table, 'after_create', DDL(booking_exclusion_ddl(_table.name)).execute_if(dialect='postgresql'))
 
 
 class SpaceFieldValue(Base):
     __tablename__ = 'space_field_values'
+    __table_args__ = (
+        Index('ix_space_field_values_space_id', 'space_id'),
+    )
     id = Column(Integer, primary_key=True)
     space_id = Column(Integer, ForeignKey('spaces.id'))
     field_name = Column(String, nullable=False)
@@ -189,6 +263,9 @@ class Queue(Base):
 
 class AgentAssignment(Base):
     __tablename__ = 'agent_assignments'
+    __table_args__ = (
+        Index('ix_agent_assignments_agent_queue', 'agent_user_id', 'queue_id'),
+    )
     id = Column(Integer, primary_key=True)
     agent_user_id = Column(Integer, ForeignKey('users.id'))
     queue_id = Column(Integer, ForeignKey('queues.id'))
@@ -210,6 +287,9 @@ class TicketTypeAllowedGroup(Base):
 
 class TicketTypeField(Base):
     __tablename__ = 'ticket_type_fields'
+    __table_args__ = (
+        Index('ix_ticket_type_fields_type_id', 'ticket_type_id'),
+    )
     id = Column(Integer, primary_key=True)
     ticket_type_id = Column(Integer, ForeignKey('ticket_types.id'))
     name = Column(String, nullable=False)
@@ -219,6 +299,9 @@ class TicketTypeField(Base):
 
 class TicketFieldValue(Base):
     __tablename__ = 'ticket_field_values'
+    __table_args__ = (
+        Index('ix_ticket_field_values_ticket_id', 'ticket_id'),
+    )
     id = Column(Integer, primary_key=True)
     ticket_id = Column(Integer, ForeignKey('tickets.id'))
     field_id = Column(Integer, ForeignKey('ticket_type_fields.id'))
@@ -227,6 +310,12 @@ class TicketFieldValue(Base):
 
 class Ticket(Base):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        Index('ix_tickets_queue_status_priority', 'current_queue_id', 'status', 'priority'),
+        Index('ix_tickets_queue_updated', 'current_queue_id', 'updated_at', 'id'),
+        Index('ix_tickets_client_user_id', 'client_user_id'),
+        Index('ix_tickets_ticket_type_id', 'ticket_type_id'),
+    )
     id = Column(Integer, primary_key=True)
     subject = Column(String, nullable=False)
     description = Column(Text, nullable=True)
@@ -237,12 +326,18 @@ class Ticket(Base):
     current_queue_id = Column(Integer, ForeignKey('queues.id'))
     ticket_type_id = Column(Integer, ForeignKey('ticket_types.id'))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # set on insert too, so (updated_at, id) is a total order for keyset pagination; set in
+    # Python so every value is stored in the format cursors bind (SQLite's CURRENT_TIMESTAMP
+    # has no fractional seconds and would compare as a different string)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
     resolved_at = Column(DateTime(timezone=True), nullable=True)
 
 
 class TicketComment(Base):
     __tablename__ = 'ticket_comments'
+    __table_args__ = (
+        Index('ix_ticket_comments_ticket_created', 'ticket_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True)
     ticket_id = Column(Integer, ForeignKey('tickets.id'))
     author_user_id = Column(Integer, ForeignKey('users.id'))
@@ -253,6 +348,9 @@ class TicketComment(Base):
 
 class TicketMovementLog(Base):
     __tablename__ = 'ticket_movement_log'
+    __table_args__ = (
+        Index('ix_ticket_movement_log_ticket_ts', 'ticket_id', 'timestamp'),
+    )
     id = Column(Integer, primary_key=True)
     ticket_id = Column(Integer, ForeignKey('tickets.id'))
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -261,11 +359,36 @@ class TicketMovementLog(Base):
     details = Column(Text, nullable=True)
 
 
+class AttachmentBlob(Base):
+    """One stored file per distinct content; attachments with identical bytes share it."""
+    __tablename__ = 'attachment_blobs'
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    path = Column(String, nullable=False)
+    # number of attachments pointing at this blob; maintained by app.core.blobs
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Attachment(Base):
     __tablename__ = 'attachments'
+    __table_args__ = (
+        Index('ix_attachments_ticket_id', 'ticket_id'),
+        Index('ix_attachments_blob_id', 'blob_id'),
+    )
     id = Column(Integer, primary_key=True)
     ticket_id = Column(Integer, ForeignKey('tickets.id'))
     comment_id = Column(Integer, ForeignKey('ticket_comments.id'), nullable=True)
     file_name = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     uploader_user_id = Column(Integer, ForeignKey('users.id'))
+    blob_id = Column(Integer, ForeignKey('attachment_blobs.id'), nullable=True)
+
+
+class CatalogVersion(Base):
+    """Change counter per cached catalog (e.g. 'ticket_types'). Writers bump it in the same
+    transaction as the definition change; readers compare it with their cached copy."""
+    __tablename__ = 'catalog_versions'
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -84,6 +84,28 @@ class StockItemOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class TimeSlot(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class ResourceAvailabilityOut(BaseModel):
+    id: int
+    name: str
+    building_id: Optional[int] = None
+    capacity: Optional[int] = None
+    space_template_id: Optional[int] = None
+    fully_free: bool
+    free_slots: List[TimeSlot]
+
+
+class AvailabilityOut(BaseModel):
+    resource_type: str
+    start: datetime
+    end: datetime
+    resources: List[ResourceAvailabilityOut]
+
+
 class QueueOut(BaseModel):
     id: int
     name: str
@@ -100,6 +122,25 @@ class TicketCreate(BaseModel):
     custom_fields: Optional[List[dict]] = None
 
 
+class TicketBatchCreate(BaseModel):
+    tickets: List[TicketCreate]
+    # when True, nothing is created unless every item is valid
+    atomic: bool = False
+
+
+class TicketBatchItemResult(BaseModel):
+    index: int
+    ticket_id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+
+
+class TicketBatchOut(BaseModel):
+    created: int
+    failed: int
+    results: List[TicketBatchItemResult]
+
+
 class AgentAssignRequest(BaseModel):
     target_agent_id: int
 
@@ -129,6 +170,38 @@ class ActivityCreateRequest(BaseModel):
     custom_fields: Optional[List[dict]] = None
 
 
+class RecurringActivityCreate(ActivityCreateRequest):
+    # start_time/end_time describe the first occurrence; see app.core.recurrence
+    rrule: str
+    space_ids: List[int] = []
+    item_ids: List[int] = []
+    booking_status: Optional[str] = 'Confirmed'
+    # when True, nothing is created unless every occurrence is free
+    atomic: bool = False
+
+
+class BookingConflictOut(BaseModel):
+    kind: str
+    resource_id: int
+    activity_id: int
+
+
+class RecurringOccurrenceResult(BaseModel):
+    index: int
+    start_time: datetime
+    end_time: datetime
+    activity_id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+    conflicts: List[BookingConflictOut] = []
+
+
+class RecurringActivityOut(BaseModel):
+    created: int
+    failed: int
+    occurrences: List[RecurringOccurrenceResult]
+
+
 class ActivityUpdateRequest(BaseModel):
     title: Optional[str] = None
     category_id: Optional[int] = None
@@ -396,7 +469,8 @@ class AttachmentOut(BaseModel):
     ticket_id: int
     comment_id: Optional[int]
     file_name: str
-    file_path: str
+    # GET /attachments/{id}; the stored path is server-side and never returned
+    download_url: str
     uploader: Optional[dict]
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,119 @@
+"""Benchmark SQLite read throughput while bookings are being written.
+
+Runs the same workload against a fresh database file for each PRAGMA profile in
+app.core.database.SQLITE_PRAGMA_PROFILES: writer threads create activities and confirm
+space bookings (one transaction each, like POST /activities/ + space_bookings) while
+reader threads run the activity/booking listing queries.
+
+Usage:
+  PYTHONPATH=. python scripts/bench_sqlite_concurrency.py [--seconds 5] [--readers 8] [--writers 2]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, create_db_engine, SQLITE_PRAGMA_PROFILES
+from app import models
+
+
+def seed(Session, spaces=20, activities=2000):
+    db = Session()
+    cat = models.ActivityCategory(name='Bench')
+    db.add(cat)
+    db.flush()
+    sp = [models.Space(name=f'Room {i}', capacity=30) for i in range(spaces)]
+    db.add_all(sp)
+    db.flush()
+    base = datetime(2025, 1, 1, 8)
+    for i in range(activities):
+        start = base + timedelta(hours=i)
+        a = models.Activity(title=f'A{i}', category_id=cat.id, organizer_user_id=1, start_time=start, end_time=start + timedelta(minutes=50))
+        db.add(a)
+        db.flush()
+        db.add(models.SpaceBooking(activity_id=a.id, space_id=sp[i % spaces].id, status='Confirmed'))
+    db.commit()
+    ids = (cat.id, [s.id for s in sp])
+    db.close()
+    return ids
+
+
+def run_profile(profile, seconds, readers, writers):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_db_engine(f'sqlite:///{path}', pragma_profile=profile)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    Base.metadata.create_all(bind=engine)
+    cat_id, space_ids = seed(Session)
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        db = Session()
+        n = 0
+        while not stop.is_set():
+            db.query(models.Activity).filter(models.Activity.start_time >= datetime(2025, 2, 1)).limit(50).all()
+            db.query(models.SpaceBooking).filter(models.SpaceBooking.space_id == space_ids[n % len(space_ids)]).count()
+            db.rollback()
+            n += 1
+        db.close()
+        with lock:
+            counts['reads'] += n
+
+    def writer(offset):
+        db = Session()
+        n = errors = 0
+        start = datetime(2026, 1, 1) + timedelta(days=offset * 1000)
+        while not stop.is_set():
+            try:
+                t = start + timedelta(hours=n)
+                a = models.Activity(title='W', category_id=cat_id, organizer_user_id=1, start_time=t, end_time=t + timedelta(minutes=30))
+                db.add(a)
+                db.flush()
+                db.add(models.SpaceBooking(activity_id=a.id, space_id=space_ids[n % len(space_ids)], status='Confirmed'))
+                db.commit()
+                n += 1
+            except OperationalError:
+                db.rollback()
+                errors += 1
+        db.close()
+        with lock:
+            counts['writes'] += n
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+    print(f'{"profile":<10} {"reads/s":>10} {"writes/s":>10} {"lock errors/s":>14}')
+    for profile in SQLITE_PRAGMA_PROFILES:
+        r = run_profile(profile, args.seconds, args.readers, args.writers)
+        print(f'{profile:<10} {r["reads"]:>10.0f} {r["writes"]:>10.0f} {r["errors"]:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure /agents/tickets and /tickets/{id}/history latency with and without the hot-path indexes.
+
+Seeds a fresh SQLite file (default 1M tickets, two movement log rows and 0.1 comments per
+ticket), times the router bodies directly with every secondary index dropped, then
+creates the model indexes (alembic revision 0007) and times them again.
+
+Usage:
+  PYTHONPATH=. python scripts/bench_ticket_indexes.py [--tickets 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, create_db_engine
+from app.core.security import AuthenticatedUser
+from app.api.agents import _agent_tickets
+from app.api.tickets import _ticket_history
+from app import models
+
+QUEUES = 50
+STATUSES = ['New', 'Open', 'Pending', 'Resolved', 'Closed']
+PRIORITIES = ['Low', 'Normal', 'High']
+CHUNK = 50000
+
+
+def model_indexes():
+    return [ix for t in Base.metadata.sorted_tables if t.name != 'users' for ix in t.indexes]
+
+
+def seed(engine, n_tickets):
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{'id': i, 'keycloak_id': f'u{i}'} for i in range(1, 52)])
+        conn.execute(insert(models.Queue), [{'id': q, 'name': f'Q{q}'} for q in range(1, QUEUES + 1)])
+        # agent 2 works three queues
+        conn.execute(insert(models.AgentAssignment), [{'agent_user_id': 2, 'queue_id': q, 'access_level': 'Tier 1'} for q in (1, 2, 3)])
+        base = datetime(2024, 1, 1)
+        for start in range(1, n_tickets + 1, CHUNK):
+            ids = range(start, min(start + CHUNK, n_tickets + 1))
+            conn.execute(insert(models.Ticket), [{
+                'id': i, 'subject': f'T{i}', 'status': rnd.choice(STATUSES), 'priority': rnd.choice(PRIORITIES),
+                'client_user_id': 1, 'current_queue_id': rnd.randint(1, QUEUES),
+                'created_at': base + timedelta(minutes=i), 'updated_at': base + timedelta(minutes=i),
+            } for i in ids])
+            conn.execute(insert(models.TicketMovementLog), [{
+                'ticket_id': i, 'action_user_id': 1, 'action_type': a, 'details': '{}', 'timestamp': base + timedelta(minutes=i + k),
+            } for i in ids for k, a in enumerate(('CREATE', 'STATUS_CHANGE'))])
+            conn.execute(insert(models.TicketComment), [{
+                'ticket_id': i, 'author_user_id': 2, 'comment_text': 'c', 'is_internal': False, 'created_at': base + timedelta(minutes=i),
+            } for i in ids if i % 10 == 0])
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples)
+
+
+def measure(Session, n_tickets, repeat):
+    agent = AuthenticatedUser(id=2, keycloak_id='u2', roles=['agent', 'admin'])
+    rnd = random.Random(7)
+    db = Session()
+    try:
+        list_ms = timed(lambda: _agent_tickets(db, status='New', priority=None, unassigned=False, queue_id=None, user=agent, limit=100), repeat)
+        hist_ms = timed(lambda: _ticket_history(db, rnd.randint(1, n_tickets), agent), repeat)
+    finally:
+        db.close()
+    return list_ms, hist_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_db_engine(f'sqlite:///{path}')
+    Session = sessionmaker(bind=engine, autoflush=False)
+    try:
+        Base.metadata.create_all(bind=engine)
+        for ix in model_indexes():
+            ix.drop(bind=engine)
+        t = time.perf_counter()
+        seed(engine, args.tickets)
+        print(f'seeded {args.tickets} tickets in {time.perf_counter() - t:.1f}s')
+
+        before = measure(Session, args.tickets, args.repeat)
+        for ix in model_indexes():
+            ix.create(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+        after = measure(Session, args.tickets, args.repeat)
+
+        print(f'{"endpoint":<28} {"before ms":>10} {"after ms":>10}')
+        print(f'{"/agents/tickets?status=New":<28} {before[0]:>10.1f} {after[0]:>10.1f}')
+        print(f'{"/tickets/{id}/history":<28} {before[1]:>10.1f} {after[1]:>10.1f}')
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,38 @@
 """CLI helper to import users from a CSV file locally using the app database.
 
 CSV expected headers: keycloak_id,email,first_name,last_name,dni,roles
-Roles can be semicolon-separated values. This script mirrors the admin bulk endpoint.
+Roles can be semicolon-separated values. This script uses the same importer as the
+admin bulk endpoint (app.core.user_import), streaming the file in batches.
 
 Usage:
-  .venv/bin/python3 scripts/bulk_create_users.py users.csv
+  .venv/bin/python3 scripts/bulk_create_users.py users.csv [batch_size]
 """
 import sys
 import csv
+from collections import Counter
 from app.core.database import SessionLocal, Base, engine
-from app import models
+from app.core.user_import import import_users
 
 
-def import_csv(path):
+def import_csv(path, batch_size=None):
     Base.metadata.create_all(bind=engine)
     db = SessionLocal()
     try:
-        with open(path, 'r', encoding='utf-8') as fh:
-            reader = csv.DictReader(fh)
-            for row in reader:
-                kc = row.get('keycloak_id')
-                if not kc:
-                    print('skipping row missing keycloak_id')
-                    continue
-                u = db.query(models.User).filter(models.User.keycloak_id == kc).first()
-                if not u:
-                    u = models.User(keycloak_id=kc, email=row.get('email'), first_name=row.get('first_name'), last_name=row.get('last_name'), dni=row.get('dni'))
-                    db.add(u)
-                    db.flush()
-                    print('created user', u.id)
-                else:
-                    if row.get('email'):
-                        u.email = row.get('email')
-                    if row.get('first_name'):
-                        u.first_name = row.get('first_name')
-                    if row.get('last_name'):
-                        u.last_name = row.get('last_name')
-                    if row.get('dni'):
-                        u.dni = row.get('dni')
-                    print('updated user', u.id)
-                roles_cell = row.get('roles') or ''
-                roles = [r.strip() for r in roles_cell.split(';') if r.strip()]
-                for rn in roles:
-                    role = db.query(models.Role).filter(models.Role.name == rn).first()
-                    if not role:
-                        role = models.Role(name=rn)
-                        db.add(role)
-                        db.flush()
-                        print('created role', rn)
-                    ur = db.query(models.UserRole).filter(models.UserRole.user_id == u.id, models.UserRole.role_id == role.id).first()
-                    if not ur:
-                        db.add(models.UserRole(user_id=u.id, role_id=role.id))
-                db.commit()
+        with open(path, 'r', encoding='utf-8', newline='') as fh:
+            results = import_users(db, csv.DictReader(fh), batch_size)
     finally:
         db.close()
+    for r in results:
+        if r['status'] == 'error':
+            print(f"row {r['row']}: {r['message']}")
+    counts = Counter(r['status'] for r in results)
+    print(f"created {counts['created']}, updated {counts['updated']}, errors {counts['error']}")
+    return results
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print('Usage: bulk_create_users.py users.csv')
+        print('Usage: bulk_create_users.py users.csv [batch_size]')
         sys.exit(1)
-    import_csv(sys.argv[1])
+    import_csv(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
     print('done')
@@ -4,9 +4,11 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.main import app
-from app.core.database import Base, get_db
+from app.core.database import Base, get_db, get_async_db
+from app.core.cache import clear_caches
 from app.core.config import settings
 from app.core.config import settings as app_settings
+from app.core.storage import storage
 
 
 TEST_DATABASE_URL = "sqlite:///./test_institution_manager.db"
@@ -16,6 +18,21 @@ engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": Fal
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+class SyncSessionRunner:
+    """Stands in for the AsyncSession of the async routers: their ORM bodies are sync
+    functions run through `run_sync`, so tests run them on the test transaction directly.
+
+    An AsyncSession cannot join that sync transaction; the routers' real `run_sync` path on
+    aiosqlite is covered by tests/test_async_routes.py on its own database.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.session, *args, **kwargs)
+
+
 @pytest.fixture(scope='session')
 def db_engine():
     Base.metadata.create_all(bind=engine)
@@ -37,7 +54,15 @@ def db_session(db_engine):
 
 
 @pytest.fixture(scope='function')
-def client(db_session, monkeypatch):
+def storage_dir(monkeypatch, tmp_path):
+    # uploads go to a per-test directory instead of ./uploads
+    path = tmp_path / 'uploads'
+    monkeypatch.setattr(storage, 'base_path', str(path))
+    return path
+
+
+@pytest.fixture(scope='function')
+def client(db_session, storage_dir):
     # override get_db to use the testing session
     def override_get_db():
         # create a new Session bound to the same connection used by the test's db_session
@@ -47,7 +72,17 @@ def client(db_session, monkeypatch):
         finally:
             db.close()
 
+    async def override_get_async_db():
+        db = TestingSessionLocal(bind=db_session.bind)
+        try:
+            yield SyncSessionRunner(db)
+        finally:
+            db.close()
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # every test rolls back its data, so ids are reused; drop cached principals/roles
+    clear_caches()
     client = TestClient(app)
     # enable bypass for tests
     app_settings.KEYCLOAK_BYPASS = True
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.models import models
+
+
+def test_activity_range_listing_and_ics_feed(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    user = models.User(keycloak_id='cal', email='cal@example.com')
+    b1, b2 = models.Building(name='East'), models.Building(name='West')
+    db_session.add_all([user, b1, b2])
+    db_session.commit()
+    east, west = models.Space(building_id=b1.id, name='E1'), models.Space(building_id=b2.id, name='W1')
+    db_session.add_all([east, west])
+    db_session.commit()
+    day = datetime(2032, 5, 10, 8)
+    acts = []
+    for h in range(6):
+        a = models.Activity(title=f'Talk {h}', category_id=1, organizer_user_id=user.id, start_time=day + timedelta(hours=h), end_time=day + timedelta(hours=h, minutes=90))
+        db_session.add(a)
+        db_session.flush()
+        db_session.add(models.SpaceBooking(activity_id=a.id, space_id=(east if h % 2 == 0 else west).id, status='Confirmed'))
+        acts.append(a)
+    acts[5].description = 'Room; change, see\\notes'
+    acts[5].title = 'Closing keynote with a deliberately long title that must be folded across lines'
+    db_session.commit()
+
+    # [09:30, 11:00) overlaps talks 0 (08:00-09:30 does not), 1, 2 and starts before 3 (11:00)
+    window = {'start': (day + timedelta(minutes=90)).isoformat(), 'end': (day + timedelta(hours=3)).isoformat()}
+    r = client.get('/activities/', params=window)
+    assert r.status_code == 200
+    assert [a['title'] for a in r.json()] == ['Talk 1', 'Talk 2']
+    # offset-aware bounds are compared as the naive UTC the times are stored in
+    shifted = timezone(timedelta(hours=2))
+    aware = {k: datetime.fromisoformat(v).replace(tzinfo=timezone.utc).astimezone(shifted).isoformat() for k, v in window.items()}
+    r = client.get('/activities/', params=aware)
+    assert [a['title'] for a in r.json()] == ['Talk 1', 'Talk 2']
+    r = client.get('/activities/calendar.ics', params=aware)
+    assert r.text.count('BEGIN:VEVENT') == 2
+
+    titles, cursor = [], None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        r = client.get('/activities/', params=params)
+        titles += [a['title'] for a in r.json()]
+        cursor = r.headers.get('x-next-cursor')
+        if not cursor:
+            break
+    assert titles[:5] == [f'Talk {h}' for h in range(5)] and len(titles) == 6
+
+    r = client.get('/activities/', params={'building_id': b1.id})
+    assert [a['title'] for a in r.json()] == ['Talk 0', 'Talk 2', 'Talk 4']
+    r = client.get('/activities/', params={'space_id': west.id, 'start': (day + timedelta(hours=3)).isoformat()})
+    assert [a['id'] for a in r.json()] == [acts[3].id, acts[5].id]
+
+    r = client.get('/activities/calendar.ics', params={'space_id': west.id})
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/calendar')
+    body = r.text
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert body.count('BEGIN:VEVENT') == 3
+    assert f'UID:activity-{acts[1].id}@institution-manager' in body
+    assert 'DTSTART:20320510T090000Z' in body
+    assert r'DESCRIPTION:Room\; change\, see\\notes' in body
+    assert all(len(line.encode()) <= 75 for line in body.split('\r\n'))
+    assert 'SUMMARY:Closing keynote' in body and '\r\n ' in body
+
+
+
+def test_activity_listing_and_feed_reject_invalid_credentials(client, monkeypatch):
+    # results are not scoped to the caller: anonymous requests are served, bad tokens are not
+    monkeypatch.setattr(settings, 'KEYCLOAK_BYPASS', False)
+    for path in ('/activities/', '/activities/calendar.ics'):
+        assert client.get(path).status_code == 200
+        assert client.get(path, headers={'Authorization': 'Bearer not-a-jwt'}).status_code == 401
@@ -98,3 +98,40 @@ def test_activity_field_crud_and_value_cleanup(client, db_session):
     assert r.status_code in (200, 204)
     vals5 = db_session.query(models.ActivityFieldValue).filter(models.ActivityFieldValue.activity_id == a['id']).all()
     assert len(vals5) == 0
+
+
+def test_activity_type_catalog_follows_field_edits(client, db_session):
+    from app.core.catalog import activity_type_catalog
+    settings.KEYCLOAK_BYPASS = True
+
+    admin = create_user(db_session, keycloak_id='admin-cat', email='admin-cat@example.com')
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+    headers = {'x-test-user': str(admin.id)}
+
+    at = client.post('/activities/types', json={'name': 'Lab', 'fields': [{'name': 'Level', 'field_type': 'select', 'options': ['1', '2']}]}, headers=headers).json()
+    types = client.get('/activities/types', headers=headers).json()
+    assert [t['name'] for t in types] == ['Lab']
+    reloads = activity_type_catalog.reloads
+    client.get('/activities/types', headers=headers)
+    assert activity_type_catalog.reloads == reloads
+
+    fid = at['fields'][0]['id']
+    r = client.patch(f"/activities/types/{at['id']}/fields/{fid}", json={'options': ['1', '2', '3']}, headers=headers)
+    assert r.status_code == 200
+    types = client.get('/activities/types', headers=headers).json()
+    assert types[0]['fields'][0]['options'] == ['1', '2', '3']
+
+    r = client.post(f"/activities/types/{at['id']}/fields", json={'name': 'Room', 'field_type': 'text'}, headers=headers)
+    assert r.status_code == 200
+    r = client.get(f"/admin/ui/activity_types/{at['id']}", headers=headers)
+    assert r.status_code == 200
+    assert 'Room' in r.text and 'Level' in r.text
+
+    r = client.delete(f"/activities/types/{at['id']}", headers=headers)
+    assert r.status_code == 204
+    assert client.get('/activities/types', headers=headers).json() == []
+    assert client.get(f"/admin/ui/activity_types/{at['id']}", headers=headers).status_code == 404
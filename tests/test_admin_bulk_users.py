@@ -35,3 +35,45 @@ def test_bulk_create_users_endpoint(client, db_session):
     roles = db_session.query(models.Role.name).join(models.UserRole, models.Role.id == models.UserRole.role_id).filter(models.UserRole.user_id == u1.id).all()
     names = [r[0] for r in roles]
     assert 'agent' in names and 'activity-manager' in names
+
+
+def test_bulk_import_batches_updates_and_row_fallback(client, db_session):
+    from app.core import security
+    settings.KEYCLOAK_BYPASS = True
+    admin = models.User(keycloak_id='adm-bulk2', first_name='AdminB2', email='adm-bulk2@example.com')
+    existing = models.User(keycloak_id='old1', first_name='Old', last_name='Name', email='old1@example.com')
+    db_session.add_all([admin, existing])
+    db_session.commit()
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+    headers = {'x-test-user': str(admin.id)}
+    # roles of the existing user are cached before the import
+    client.get('/agents/queues', headers={'x-test-user': str(existing.id)})
+    assert security._ROLE_CACHE.get(existing.id) is not None
+
+    lines = ['keycloak_id,email,first_name,last_name,dni,roles']
+    lines += [f'n{i},n{i}@example.com,New,{i},,' for i in range(7)]
+    lines.append('old1,,Renamed,,,agent')
+    lines.append(',nobody@example.com,,,,')
+    # duplicate email: fails the bulk insert of its batch, which is replayed row by row
+    lines.append('dup,n1@example.com,Dup,,,')
+    lines.append('n0,,Again,,,')
+    files = {'file': ('users.csv', '\n'.join(lines) + '\n')}
+    r = client.post('/admin/users/bulk?batch_size=4', files=files, headers=headers)
+    assert r.status_code == 200
+    results = r.json()['results']
+    assert [x['row'] for x in results] == list(range(1, 12))
+    assert [x['status'] for x in results] == ['created'] * 7 + ['updated', 'error', 'error', 'updated']
+    assert results[8]['message'] == 'missing keycloak_id'
+
+    db_session.expire_all()
+    old = db_session.query(models.User).filter(models.User.keycloak_id == 'old1').one()
+    assert (old.first_name, old.last_name, old.email) == ('Renamed', 'Name', 'old1@example.com')
+    assert db_session.query(models.User).filter(models.User.keycloak_id == 'n0').one().first_name == 'Again'
+    assert db_session.query(models.User).filter(models.User.keycloak_id == 'dup').first() is None
+    # the new agent membership is visible to the auth layer right away
+    assert security._ROLE_CACHE.get(old.id) is None
+    assert client.get('/agents/queues', headers={'x-test-user': str(old.id)}).status_code == 200
@@ -34,3 +34,39 @@ def test_get_user_roles(client, db_session):
     assert r.status_code == 200
     body = r.json()
     assert 'agent' in body and 'activity-manager' in body
+
+
+def test_role_cache_invalidated_by_admin_role_changes(client, db_session):
+    from app.core import security
+    settings.KEYCLOAK_BYPASS = True
+
+    admin = models.User(keycloak_id='adm-rc', first_name='AdminRC', email='adm-rc@example.com')
+    u = models.User(keycloak_id='agent-rc', first_name='AgentRC', email='agent-rc@example.com')
+    db_session.add_all([admin, u])
+    db_session.commit()
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+
+    admin_headers = {'x-test-user': str(admin.id)}
+    user_headers = {'x-test-user': str(u.id)}
+
+    # not an agent yet; the (empty) role set is now cached
+    r = client.get('/agents/queues', headers=user_headers)
+    assert r.status_code == 403
+    hits = security._ROLE_CACHE.hits
+    r = client.get('/agents/queues', headers=user_headers)
+    assert r.status_code == 403
+    assert security._ROLE_CACHE.hits > hits
+
+    r = client.post('/admin/roles/make_agent', json={'user_id': u.id}, headers=admin_headers)
+    assert r.status_code == 200
+    r = client.get('/agents/queues', headers=user_headers)
+    assert r.status_code == 200
+
+    r = client.post('/admin/roles/remove_agent', json={'user_id': u.id}, headers=admin_headers)
+    assert r.status_code == 200
+    r = client.get('/agents/queues', headers=user_headers)
+    assert r.status_code == 403
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from app.models import models
+from app.core.config import settings
+
+
+def _seed(db_session, n=5):
+    agent = models.User(keycloak_id='agent-pg', first_name='Agent', email='agent-pg@example.com')
+    db_session.add(agent)
+    db_session.commit()
+    role = models.Role(name='agent')
+    db_session.add(role)
+    queue = models.Queue(name='Paging Q')
+    db_session.add(queue)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=agent.id, role_id=role.id))
+    db_session.add(models.AgentAssignment(agent_user_id=agent.id, queue_id=queue.id, access_level='Tier 1'))
+    base = datetime(2025, 1, 1)
+    for i in range(n):
+        db_session.add(models.Ticket(subject=f'T{i}', client_user_id=agent.id, current_queue_id=queue.id, status='New', priority='Normal', created_at=base, updated_at=base + timedelta(minutes=i)))
+    db_session.commit()
+    return agent, base
+
+
+def test_agent_tickets_cursor_pages(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    agent, _ = _seed(db_session)
+    headers = {'x-test-user': str(agent.id)}
+
+    r = client.get('/agents/tickets?limit=2', headers=headers)
+    assert r.status_code == 200
+    first = [t['subject'] for t in r.json()]
+    assert first == ['T4', 'T3']
+    cursor = r.headers['x-next-cursor']
+
+    seen = list(first)
+    while cursor:
+        r = client.get(f'/agents/tickets?limit=2&cursor={cursor}', headers=headers)
+        assert r.status_code == 200
+        seen += [t['subject'] for t in r.json()]
+        cursor = r.headers.get('x-next-cursor')
+    assert seen == ['T4', 'T3', 'T2', 'T1', 'T0']
+
+    r = client.get('/agents/tickets?cursor=not-a-cursor', headers=headers)
+    assert r.status_code == 400
+
+
+def test_agent_tickets_since_and_fields(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    agent, base = _seed(db_session)
+    headers = {'x-test-user': str(agent.id)}
+
+    since = (base + timedelta(minutes=2)).isoformat()
+    r = client.get(f'/agents/tickets?since={since}&fields=id,subject&order=asc', headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert [t['subject'] for t in body] == ['T3', 'T4']
+    assert set(body[0]) == {'id', 'subject'}
+    assert 'x-next-cursor' not in r.headers
+
+    r = client.get('/agents/tickets?fields=subject,secret', headers=headers)
+    assert r.status_code == 400
+
+
+def test_agent_tickets_page_through_tickets_created_in_one_second(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    agent, _ = _seed(db_session, n=0)
+    queue = db_session.query(models.Queue).filter(models.Queue.name == 'Paging Q').one()
+    group = models.Group(name='Paging clients')
+    db_session.add(group)
+    db_session.commit()
+    db_session.add(models.UserGroup(user_id=agent.id, group_id=group.id))
+    db_session.add(models.QueuePermission(group_id=group.id, queue_id=queue.id))
+    db_session.commit()
+    headers = {'x-test-user': str(agent.id)}
+
+    r = client.post('/tickets/batch', json={'tickets': [{'subject': f'B{i}', 'description': None, 'queue_id': queue.id} for i in range(6)]}, headers=headers)
+    assert r.json()['created'] == 6
+    # two of them share one timestamp to the microsecond; the id breaks the tie
+    same = datetime(2025, 2, 1, 12, 0, 0)
+    for t in db_session.query(models.Ticket).filter(models.Ticket.subject.in_(['B1', 'B2'])):
+        t.updated_at = same
+    db_session.commit()
+    ids = [t.id for t in db_session.query(models.Ticket).filter(models.Ticket.current_queue_id == queue.id).order_by(models.Ticket.updated_at, models.Ticket.id)]
+
+    for order, expected in (('asc', ids), ('desc', ids[::-1])):
+        seen, cursor = [], None
+        for _ in range(10):
+            r = client.get(f'/agents/tickets?limit=2&order={order}' + (f'&cursor={cursor}' if cursor else ''), headers=headers)
+            seen += [t['id'] for t in r.json()]
+            cursor = r.headers.get('x-next-cursor')
+            if not cursor:
+                break
+        assert seen == expected
@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import app.main
+from app.main import app as fastapi_app
+from app.core.cache import clear_caches
+from app.core.config import settings
+from app.core.database import Base, create_db_engine, create_async_db_engine, get_db, get_async_db
+from app.models import models
+
+
+def test_ticket_and_agent_routes_on_real_async_session(tmp_path, monkeypatch):
+    url = f'sqlite:///{tmp_path / "async.db"}'
+    sync_engine = create_db_engine(url)
+    # startup runs create_all/seeding on this engine rather than ./institution_manager.db
+    monkeypatch.setattr(app.main, 'engine', sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
+    db = sessionmaker(bind=sync_engine, autoflush=False)()
+    client_user = models.User(keycloak_id='async-client', email='async-client@example.com')
+    agent = models.User(keycloak_id='async-agent', email='async-agent@example.com')
+    q = models.Queue(name='AsyncQ')
+    g = models.Group(name='AsyncG')
+    role = models.Role(name='agent')
+    db.add_all([client_user, agent, q, g, role])
+    db.flush()
+    db.add_all([
+        models.UserGroup(user_id=client_user.id, group_id=g.id),
+        models.QueuePermission(group_id=g.id, queue_id=q.id),
+        models.UserRole(user_id=agent.id, role_id=role.id),
+        models.AgentAssignment(agent_user_id=agent.id, queue_id=q.id, access_level='Manager'),
+    ])
+    db.commit()
+    client_id, agent_id, queue_id = client_user.id, agent.id, q.id
+    db.close()
+
+    engine = create_async_db_engine(url)
+    Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    sessions = []
+
+    async def override_get_async_db():
+        async with Session() as s:
+            sessions.append(s)
+            yield s
+
+    def no_sync_db():
+        raise AssertionError('async routes must not open a sync session')
+        yield
+
+    monkeypatch.setattr(settings, 'KEYCLOAK_BYPASS', True)
+    fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
+    fastapi_app.dependency_overrides[get_db] = no_sync_db
+    clear_caches()
+    try:
+        # one event loop for every request, as the aiosqlite pool expects
+        with TestClient(fastapi_app) as c:
+            client_headers, agent_headers = {'x-test-user': str(client_id)}, {'x-test-user': str(agent_id)}
+            r = c.get('/agents/queues', headers=agent_headers)
+            assert r.status_code == 200 and [x['name'] for x in r.json()] == ['AsyncQ']
+            # the role lookup and the route query shared the request's single session
+            assert len(sessions) == 1 and all(isinstance(s, AsyncSession) for s in sessions)
+            assert c.get('/agents/queues', headers=client_headers).status_code == 403
+
+            r = c.post('/tickets/', json={'subject': 'async', 'description': 'd', 'queue_id': queue_id}, headers=client_headers)
+            assert r.status_code == 200, r.text
+            ticket_id = r.json()['id']
+            r = c.get('/tickets/me', headers=client_headers)
+            assert [t['id'] for t in r.json()] == [ticket_id]
+
+            r = c.post(f'/agents/tickets/{ticket_id}/claim', headers=agent_headers)
+            assert r.status_code == 200, r.text
+            r = c.get(f'/tickets/{ticket_id}/history', headers=agent_headers)
+            assert [m['action_type'] for m in r.json()['movements']] == ['CREATE', 'CLAIM']
+            assert len(sessions) == 6
+            c.portal.call(engine.dispose)
+    finally:
+        fastapi_app.dependency_overrides.clear()
+        clear_caches()
+        sync_engine.dispose()
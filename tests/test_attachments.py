@@ -0,0 +1,186 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.models import models
+from app.core.config import settings
+from app.core.blobs import collect_garbage, store_blob
+from app.core.storage import LocalStorage, UploadTooLarge, storage
+
+
+def test_local_storage_streams_into_content_addressed_path(tmp_path):
+    store = LocalStorage(str(tmp_path), max_bytes=1000, chunk_size=7)
+    data = b'x' * 100 + b'y' * 50
+    stored = store.save(io.BytesIO(data), 'a.txt')
+    digest = hashlib.sha256(data).hexdigest()
+    assert stored.sha256 == digest and stored.size == 150
+    assert stored.path == os.path.join(str(tmp_path), digest[:2], digest[2:4], digest)
+    with open(stored.path, 'rb') as f:
+        assert f.read() == data
+
+    # same name, different content: a different file
+    other = store.save(io.BytesIO(b'other'), 'a.txt')
+    assert other.path != stored.path and os.path.exists(stored.path)
+
+    with pytest.raises(UploadTooLarge):
+        store.save(io.BytesIO(b'z' * 1001), 'big.bin')
+    # the partial temp file is cleaned up
+    assert os.listdir(tmp_path / 'tmp') == []
+
+
+def test_upload_over_limit_is_413(client, db_session, monkeypatch):
+    settings.KEYCLOAK_BYPASS = True
+    u = models.User(keycloak_id='att-u', email='att-u@example.com')
+    q = models.Queue(name='Att Q')
+    db_session.add_all([u, q])
+    db_session.commit()
+    t = models.Ticket(subject='with file', client_user_id=u.id, current_queue_id=q.id, status='New')
+    db_session.add(t)
+    db_session.commit()
+    headers = {'x-test-user': str(u.id)}
+    monkeypatch.setattr(storage, 'max_bytes', 10)
+
+    r = client.post(f'/attachments/upload?ticket_id={t.id}', files={'file': ('big.txt', b'0123456789ABC')}, headers=headers)
+    assert r.status_code == 413
+    r = client.post(f'/attachments/upload?ticket_id={t.id}', files={'file': ('ok.txt', b'small')}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert 'file_path' not in body and body['download_url'] == f"/attachments/{body['id']}"
+    att = db_session.get(models.Attachment, body['id'])
+    assert att.file_path.endswith(hashlib.sha256(b'small').hexdigest())
+
+
+def test_identical_uploads_share_a_blob_and_gc_reclaims_it(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    u = models.User(keycloak_id='blob-u', email='blob-u@example.com')
+    admin_role = models.Role(name='admin')
+    q = models.Queue(name='Blob Q')
+    db_session.add_all([u, admin_role, q])
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=u.id, role_id=admin_role.id))
+    tickets = [models.Ticket(subject=f'T{i}', client_user_id=u.id, current_queue_id=q.id, status='New') for i in range(3)]
+    db_session.add_all(tickets)
+    db_session.commit()
+    headers = {'x-test-user': str(u.id)}
+
+    form = b'%PDF-1.4 the same form' * 100
+    ids = []
+    for i, t in enumerate(tickets):
+        r = client.post(f'/attachments/upload?ticket_id={t.id}', files={'file': (f'form{i}.pdf', form)}, headers=headers)
+        assert r.status_code == 200
+        ids.append(r.json()['id'])
+    atts = db_session.query(models.Attachment).filter(models.Attachment.id.in_(ids)).all()
+    assert len({a.blob_id for a in atts}) == 1
+    blob = db_session.get(models.AttachmentBlob, atts[0].blob_id)
+    assert blob.ref_count == 3
+
+    report = client.get('/admin/attachments/storage', headers=headers).json()
+    assert report['stored_bytes'] == len(form)
+    assert report['logical_bytes'] == 3 * len(form)
+    assert report['saved_bytes'] == 2 * len(form)
+
+    # a stray temp file from an interrupted upload
+    stray = os.path.join(storage.base_path, 'tmp', 'leftover')
+    with open(stray, 'wb') as f:
+        f.write(b'partial')
+    fresh = os.path.join(storage.base_path, 'tmp', 'in-flight')
+    with open(fresh, 'wb') as f:
+        f.write(b'uploading')
+    old = time.time() - 7200
+    os.utime(stray, (old, old))
+
+    for a in atts:
+        db_session.delete(a)
+    db_session.commit()
+    db_session.refresh(blob)
+    assert blob.ref_count == 0
+
+    # the floor for stray files cannot be lowered by the caller
+    assert client.post('/admin/attachments/gc?min_age_seconds=0', headers=headers).status_code == 422
+    r = client.post('/admin/attachments/gc?dry_run=true', headers=headers)
+    assert r.json()['removed_blobs'] == 1 and os.path.exists(blob.path)
+    r = client.post('/admin/attachments/gc', headers=headers)
+    body = r.json()
+    assert body['removed_blobs'] == 1 and body['removed_files'] == 1
+    assert body['freed_bytes'] == len(form) + len(b'partial')
+    assert not os.path.exists(blob.path) and not os.path.exists(stray)
+    assert os.path.exists(fresh)
+    os.remove(fresh)
+    assert db_session.query(models.AttachmentBlob).filter(models.AttachmentBlob.id == blob.id).first() is None
+
+
+def test_gc_spares_a_blob_claimed_after_it_was_listed(db_session, storage_dir):
+    data = b'claimed while collecting'
+    blob = store_blob(db_session, io.BytesIO(data))
+    db_session.commit()
+    blob_table = models.AttachmentBlob.__table__
+    db_session.execute(blob_table.update().where(blob_table.c.id == blob.id).values(ref_count=0))
+    db_session.commit()
+
+    engine = db_session.get_bind().engine
+    claimed = []
+
+    def claim_first(conn, cursor, statement, parameters, context, executemany):
+        # an upload of the same content claims the blob between the listing and the delete
+        if statement.startswith('DELETE FROM attachment_blobs') and not claimed:
+            claimed.append(True)
+            cursor.execute('UPDATE attachment_blobs SET ref_count = ref_count + 1 WHERE id = ?', (blob.id,))
+
+    event.listen(engine, 'before_cursor_execute', claim_first)
+    try:
+        result = collect_garbage(db_session)
+    finally:
+        event.remove(engine, 'before_cursor_execute', claim_first)
+    assert claimed and result['removed_blobs'] == 0
+    db_session.refresh(blob)
+    assert blob.ref_count == 1 and os.path.exists(blob.path)
+
+    # content lost from under a live row is put back by the next upload of it
+    os.remove(blob.path)
+    store_blob(db_session, io.BytesIO(data))
+    db_session.commit()
+    with open(blob.path, 'rb') as f:
+        assert f.read() == data
+    assert blob.path.startswith(str(storage_dir))
+
+
+def test_download_with_etag_and_range(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    owner = models.User(keycloak_id='dl-owner', email='dl-owner@example.com')
+    other = models.User(keycloak_id='dl-other', email='dl-other@example.com')
+    q = models.Queue(name='DL Q')
+    db_session.add_all([owner, other, q])
+    db_session.commit()
+    t = models.Ticket(subject='dl', client_user_id=owner.id, current_queue_id=q.id, status='New')
+    db_session.add(t)
+    db_session.commit()
+    headers = {'x-test-user': str(owner.id)}
+    data = bytes(range(256)) * 40
+
+    r = client.post(f'/attachments/upload?ticket_id={t.id}', files={'file': ('dump.bin', data)}, headers=headers)
+    att_id = r.json()['id']
+
+    r = client.get(f'/attachments/{att_id}', headers=headers)
+    assert r.status_code == 200
+    assert r.content == data
+    etag = r.headers['etag']
+    assert etag == f'"{hashlib.sha256(data).hexdigest()}"'
+    assert 'dump.bin' in r.headers['content-disposition']
+
+    r = client.get(f'/attachments/{att_id}', headers={**headers, 'If-None-Match': etag})
+    assert r.status_code == 304 and r.content == b''
+
+    r = client.get(f'/attachments/{att_id}', headers={**headers, 'Range': 'bytes=100-199'})
+    assert r.status_code == 206
+    assert r.content == data[100:200]
+    assert r.headers['content-range'] == f'bytes 100-199/{len(data)}'
+
+    assert client.get(f'/attachments/{att_id}', headers={'x-test-user': str(other.id)}).status_code == 403
+    assert client.get('/attachments/999999', headers=headers).status_code == 404
+
+    body = client.get(f'/tickets/{t.id}/history', headers=headers).json()
+    assert body['attachments'][0]['download_url'] == f'/attachments/{att_id}'
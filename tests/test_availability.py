@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models import models
+
+
+def test_availability_sweeps_booking_intervals(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    user = models.User(keycloak_id='avail', email='avail@example.com')
+    b1, b2 = models.Building(name='North'), models.Building(name='South')
+    tpl = models.SpaceTemplate(name='Auditorium')
+    db_session.add_all([user, b1, b2, tpl])
+    db_session.commit()
+    hall = models.Space(building_id=b1.id, name='Hall', capacity=400, space_template_id=tpl.id)
+    aula = models.Space(building_id=b2.id, name='Aula', capacity=320, space_template_id=tpl.id)
+    small = models.Space(building_id=b2.id, name='Seminar', capacity=20)
+    item = models.StockItem(name='Mic', sku='AV-MIC')
+    broken = models.StockItem(name='Old mic', sku='AV-MIC-2', status='Repair')
+    db_session.add_all([hall, aula, small, item, broken])
+    db_session.commit()
+
+    day = datetime(2031, 3, 3, 8)
+
+    def book(space=None, item_id=None, start_h=0, hours=1, status='Confirmed'):
+        a = models.Activity(title='x', category_id=1, organizer_user_id=user.id, start_time=day + timedelta(hours=start_h), end_time=day + timedelta(hours=start_h + hours))
+        db_session.add(a)
+        db_session.flush()
+        if space is not None:
+            db_session.add(models.SpaceBooking(activity_id=a.id, space_id=space.id, status=status))
+        else:
+            db_session.add(models.StockBooking(activity_id=a.id, item_id=item_id, status=status))
+
+    # hall: 9-10 and overlapping 9:30-11 (legacy data), 12-13; aula: pending only
+    book(hall, start_h=1)
+    book(hall, start_h=1.5, hours=1.5)
+    book(hall, start_h=4)
+    book(aula, start_h=2, status='Pending')
+    book(item_id=item.id, start_h=0, hours=10)
+    db_session.commit()
+
+    headers = {'x-test-user': str(user.id)}
+    window = {'start': day.isoformat(), 'end': (day + timedelta(hours=10)).isoformat()}
+
+    r = client.get('/logistics/availability', params={**window, 'min_capacity': 300, 'template': tpl.id}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert [s['name'] for s in body['resources']] == ['Aula', 'Hall']
+    aula_out, hall_out = body['resources']
+    assert aula_out['fully_free'] is True
+    assert hall_out['fully_free'] is False
+    h = lambda x: (day + timedelta(hours=x)).isoformat()
+    assert [(s['start'], s['end']) for s in hall_out['free_slots']] == [(h(0), h(1)), (h(3), h(4)), (h(5), h(10))]
+
+    r = client.get('/logistics/availability', params={**window, 'min_capacity': 300, 'min_free_minutes': 90}, headers=headers)
+    hall_out = [s for s in r.json()['resources'] if s['name'] == 'Hall'][0]
+    assert [(s['start'], s['end']) for s in hall_out['free_slots']] == [(h(5), h(10))]
+
+    r = client.get('/logistics/availability', params={**window, 'fully_free': True, 'building_id': b2.id}, headers=headers)
+    assert sorted(s['name'] for s in r.json()['resources']) == ['Aula', 'Seminar']
+
+    # the only available item is booked all day; the other one is out for repair
+    r = client.get('/logistics/availability', params={**window, 'resource': 'stock'}, headers=headers)
+    assert r.json()['resources'] == []
+    r = client.get('/logistics/availability', params={'start': h(10), 'end': h(12), 'resource': 'stock'}, headers=headers)
+    assert [(i['name'], i['fully_free']) for i in r.json()['resources']] == [('Mic', True)]
+
+    assert client.get('/logistics/availability', params={'start': h(2), 'end': h(1)}, headers=headers).status_code == 400
+    assert client.get('/logistics/availability', params={**window, 'resource': 'stock', 'min_capacity': 5}, headers=headers).status_code == 400
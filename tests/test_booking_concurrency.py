@@ -0,0 +1,71 @@
+import threading
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.core.cache import clear_caches
+from app.core.config import settings
+from app.core.database import Base, create_db_engine, get_db
+from app.models import models
+
+
+THREADS = 50
+
+
+def test_concurrent_bookings_of_one_room(tmp_path):
+    # a real file database so every request gets its own connection and transaction
+    engine = create_db_engine(f'sqlite:///{tmp_path / "bookings.db"}', pragma_profile='wal')
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        user = models.User(keycloak_id='stress', email='stress@example.com')
+        space = models.Space(name='Contended room')
+        db.add_all([user, space])
+        db.flush()
+        start = datetime(2030, 6, 1, 9)
+        # every activity overlaps every other one, so exactly one booking may win
+        activities = [
+            models.Activity(title=f'S{i}', category_id=1, organizer_user_id=user.id, start_time=start + timedelta(minutes=i), end_time=start + timedelta(hours=2))
+            for i in range(THREADS)
+        ]
+        db.add_all(activities)
+        db.commit()
+        user_id, space_id, activity_ids = user.id, space.id, [a.id for a in activities]
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    settings.KEYCLOAK_BYPASS = True
+    clear_caches()
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def book(i):
+        client = TestClient(app)
+        barrier.wait()
+        r = client.post(f'/activities/{activity_ids[i]}/space_bookings', json={'space_id': space_id, 'status': 'Confirmed'}, headers={'x-test-user': str(user_id)})
+        results[i] = r.status_code
+
+    try:
+        threads = [threading.Thread(target=book, args=(i,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        app.dependency_overrides.clear()
+
+    try:
+        assert sorted(results) == [200] + [409] * (THREADS - 1)
+        with Session() as db:
+            assert db.query(models.SpaceBooking).filter(models.SpaceBooking.space_id == space_id).count() == 1
+            assert db.get(models.BookingLock, ('space', space_id)) is not None
+    finally:
+        engine.dispose()
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from app.core import bookings
+from app.core.config import settings
+from app.models import models
+
+
+def _setup(db_session):
+    settings.KEYCLOAK_BYPASS = True
+    manager = models.User(keycloak_id='bk-manager', email='bk-manager@example.com')
+    role = models.Role(name='activity-manager')
+    bld = models.Building(name='BK')
+    db_session.add_all([manager, role, bld])
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=manager.id, role_id=role.id))
+    spaces = [models.Space(building_id=bld.id, name=f'Room {i}') for i in range(3)]
+    item = models.StockItem(name='Projector', sku='BK-PROJ')
+    db_session.add_all(spaces + [item])
+    db_session.commit()
+    return manager, spaces, item
+
+
+def _activity(db_session, start, hours=1):
+    a = models.Activity(title='A', category_id=1, start_time=start, end_time=start + timedelta(hours=hours), organizer_user_id=1)
+    db_session.add(a)
+    db_session.commit()
+    return a
+
+
+def test_conflicts_use_denormalized_windows(client, db_session):
+    manager, spaces, item = _setup(db_session)
+    headers = {'x-test-user': str(manager.id)}
+    base = datetime(2030, 1, 1, 9)
+
+    # a day of back-to-back hourly bookings on room 0; inserted directly, windows are filled in
+    for h in range(8):
+        a = _activity(db_session, base + timedelta(hours=h))
+        db_session.add(models.SpaceBooking(activity_id=a.id, space_id=spaces[0].id, status='Confirmed'))
+    db_session.commit()
+    assert db_session.query(models.SpaceBooking).filter(models.SpaceBooking.start_time == None).count() == 0
+
+    # touching intervals do not conflict; overlapping ones do
+    assert bookings.find_conflicts(db_session, base - timedelta(hours=1), base, spaces=[spaces[0].id]) == []
+    hits = bookings.find_conflicts(db_session, base + timedelta(hours=3, minutes=30), base + timedelta(hours=4), spaces=[spaces[0].id, spaces[1].id])
+    assert [(c.kind, c.resource_id) for c in hits] == [('space', spaces[0].id)]
+
+    late = _activity(db_session, base + timedelta(hours=7, minutes=30))
+    r = client.post(f'/activities/{late.id}/space_bookings', json={'space_id': spaces[0].id}, headers=headers)
+    assert r.status_code == 409
+    r = client.post(f'/activities/{late.id}/space_bookings', json={'space_id': spaces[1].id}, headers=headers)
+    assert r.status_code == 200
+    r = client.post(f'/activities/{late.id}/stock_bookings', json={'item_id': item.id, 'status': 'Confirmed'}, headers=headers)
+    assert r.status_code == 200
+
+    other = _activity(db_session, base + timedelta(hours=10))
+    r = client.post(f'/activities/{other.id}/stock_bookings', json={'item_id': item.id, 'status': 'Confirmed'}, headers=headers)
+    assert r.status_code == 200
+
+    # all of the activity's resources are probed in one statement
+    space_id, item_id, late_id, other_id = spaces[1].id, item.id, late.id, other.id
+    statements = []
+    listener = lambda conn, cursor, stmt, params, context, executemany: statements.append(stmt)
+    event.listen(db_session.bind, 'before_cursor_execute', listener)
+    try:
+        hits = bookings.find_conflicts(db_session, base + timedelta(hours=10), base + timedelta(hours=11), spaces=[space_id], items=[item_id], exclude_activity_id=late_id)
+    finally:
+        event.remove(db_session.bind, 'before_cursor_execute', listener)
+    assert len(statements) == 1
+    assert [(c.kind, c.activity_id) for c in hits] == [('stock', other_id)]
+
+    # moving onto the stock item's next booking is refused, moving to a free slot carries the bookings along
+    r = client.patch(f'/activities/{late.id}', json={'start_time': (base + timedelta(hours=10)).isoformat(), 'end_time': (base + timedelta(hours=11)).isoformat()}, headers=headers)
+    assert r.status_code == 400
+    assert r.json()['detail'] == 'Stock booking conflict with updated time range'
+    new_start = base + timedelta(hours=12)
+    r = client.patch(f'/activities/{late.id}', json={'start_time': new_start.isoformat(), 'end_time': (new_start + timedelta(hours=1)).isoformat()}, headers=headers)
+    assert r.status_code == 200
+    windows = {b.start_time for b in db_session.query(models.StockBooking).filter(models.StockBooking.activity_id == late.id)}
+    windows |= {b.start_time for b in db_session.query(models.SpaceBooking).filter(models.SpaceBooking.activity_id == late.id)}
+    assert windows == {new_start}
+
+
+def test_conflict_probe_is_an_index_seek(db_session):
+    # bounded from below by the resource's longest booking, so the range is closed on both ends
+    probe = bookings._probe('space', 1, datetime(2030, 1, 1), datetime(2030, 1, 2), None, timedelta(hours=3))
+    compiled = probe.compile(db_session.bind, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(str(row[-1]) for row in db_session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+    assert 'ix_space_bookings_space_window' in plan
+    assert 'start_time>? AND start_time<?' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_conflicts_found_among_overlapping_bookings(db_session):
+    # legacy data: a long booking and a short one inside it, on the same room
+    _, spaces, _ = _setup(db_session)
+    base = datetime(2031, 1, 1, 8)
+    long_stay = _activity(db_session, base, hours=10)
+    short = _activity(db_session, base + timedelta(hours=1))
+    for a in (long_stay, short):
+        db_session.add(models.SpaceBooking(activity_id=a.id, space_id=spaces[2].id, status='Confirmed'))
+    db_session.commit()
+
+    window = (base + timedelta(hours=5), base + timedelta(hours=6))
+    hits = bookings.find_conflicts(db_session, *window, spaces=[spaces[2].id])
+    assert [c.activity_id for c in hits] == [long_stay.id]
+
+    per_window = bookings.find_conflicts_for_windows(db_session, [window, (base + timedelta(hours=1), base + timedelta(hours=2)), (base + timedelta(hours=11), base + timedelta(hours=12))], spaces=[spaces[2].id])
+    assert [sorted(c.activity_id for c in hits) for hits in per_window] == [[long_stay.id], sorted([long_stay.id, short.id]), []]
+
+
+def test_lock_bounds_probes_by_the_longest_booking(db_session):
+    _, spaces, _ = _setup(db_session)
+    room = spaces[1].id
+    base = datetime(2032, 3, 1, 8)
+    # booked before the room had a lock row: the first lock derives the bound from the data
+    long_stay = _activity(db_session, base, hours=30)
+    db_session.add(models.SpaceBooking(activity_id=long_stay.id, space_id=room, status='Confirmed'))
+    db_session.commit()
+    longest = bookings.lock_resources(db_session, spaces=[room], duration=timedelta(hours=1))
+    assert longest == {('space', room): timedelta(hours=30)}
+    window = (base + timedelta(hours=29), base + timedelta(hours=31))
+    assert [c.activity_id for c in bookings.find_conflicts(db_session, *window, spaces=[room], longest=longest)] == [long_stay.id]
+
+    # a longer booking added without the lock still widens the stored bound
+    longer = _activity(db_session, base + timedelta(days=10), hours=50)
+    db_session.add(models.SpaceBooking(activity_id=longer.id, space_id=room, status='Confirmed'))
+    db_session.commit()
+    longest = bookings.lock_resources(db_session, spaces=[room], duration=timedelta(hours=1))
+    assert longest == {('space', room): timedelta(hours=50)}
+    window = (base + timedelta(days=12), base + timedelta(days=12, hours=1))
+    assert [c.activity_id for c in bookings.find_conflicts(db_session, *window, spaces=[room], longest=longest)] == [longer.id]
@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from app.models import models
+from app.core.custom_fields import CompiledField, CompiledFieldSet
+
+
+def _fields(n_spaces):
+    fields = [CompiledField(1, 'Level', 'select', ['a', 'b']), CompiledField(2, 'Flag', 'boolean', None), CompiledField(3, 'When', 'date', None)]
+    fields += [CompiledField(10 + i, f'Room {i}', 'space', None) for i in range(n_spaces)]
+    return CompiledFieldSet(fields)
+
+
+def test_normalizers_and_lookup_by_name_or_id(db_session):
+    fs = _fields(0)
+    out = fs.validate(db_session, [{'name': 'Level', 'value': 'b'}, {'field_id': 2, 'value': 'Yes'}, {'name': 'When', 'value': '2025-03-01'}])
+    assert [(f.id, v) for f, v in out] == [(1, 'b'), (2, 'true'), (3, '2025-03-01')]
+
+    for bad in ({'name': 'Level', 'value': 'z'}, {'field_id': 2, 'value': 'maybe'}, {'name': 'When', 'value': '03/01/2025'}, {'name': 'Nope', 'value': 1}, {'field_id': 99, 'value': 1}):
+        with pytest.raises(HTTPException) as e:
+            fs.validate(db_session, [bad])
+        assert e.value.status_code == 400
+
+
+def test_space_references_checked_in_one_query(db_session):
+    spaces = [models.Space(name=f'S{i}', capacity=1) for i in range(5)]
+    db_session.add_all(spaces)
+    db_session.commit()
+    fs = _fields(5)
+    payload = [{'field_id': 10 + i, 'value': spaces[i].id} for i in range(5)]
+
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind().engine
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        out = fs.validate(db_session, payload)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+    assert [v for _, v in out] == [str(s.id) for s in spaces]
+    assert len(statements) == 1
+
+    payload[3]['value'] = max(s.id for s in spaces) + 1000
+    with pytest.raises(HTTPException) as e:
+        fs.validate(db_session, payload)
+    assert e.value.detail == 'Invalid space id for field Room 3'
+
+
+def test_select_rejects_unhashable_values_and_tolerates_unhashable_options(db_session):
+    fs = _fields(0)
+    for value in (['a'], {'a': 1}):
+        with pytest.raises(HTTPException) as e:
+            fs.validate(db_session, [{'name': 'Level', 'value': value}])
+        assert e.value.status_code == 400
+
+    odd = CompiledFieldSet([CompiledField(1, 'Odd', 'select', ['a', ['b']])])
+    assert [v for _, v in odd.validate(db_session, [{'name': 'Odd', 'value': 'a'}])] == ['a']
+    with pytest.raises(HTTPException):
+        odd.validate(db_session, [{'name': 'Odd', 'value': 'b'}])
+
+
+def test_untyped_validation_only_checks_select_and_space(db_session):
+    fs = _fields(1)
+    out = fs.validate(db_session, [{'field_id': 2, 'value': 'maybe'}, {'name': 'When', 'value': '03/01/2025'}], typed=False)
+    assert [v for _, v in out] == ['maybe', '03/01/2025']
+    for bad in ({'name': 'Level', 'value': 'z'}, {'field_id': 10, 'value': 'x'}):
+        with pytest.raises(HTTPException) as e:
+            fs.validate(db_session, [bad], typed=False)
+        assert e.value.status_code == 400
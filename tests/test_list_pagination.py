@@ -0,0 +1,73 @@
+import json
+
+from app.models import models
+from app.core.config import settings
+
+
+def _admin(db_session):
+    admin = models.User(keycloak_id='adm-page', first_name='Admin', email='adm-page@example.com')
+    db_session.add(admin)
+    db_session.commit()
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+    return {'x-test-user': str(admin.id)}
+
+
+def test_admin_queues_pages_total_and_ndjson(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    headers = _admin(db_session)
+    db_session.add_all([models.Queue(name=f'Q{i}') for i in range(5)])
+    db_session.commit()
+
+    # unpaged: the whole listing, streamed as a plain JSON array
+    r = client.get('/admin/queues', headers=headers)
+    assert r.status_code == 200
+    assert [q['name'] for q in r.json()] == [f'Q{i}' for i in range(5)]
+
+    r = client.get('/admin/queues?limit=2&include_total=true', headers=headers)
+    assert r.status_code == 200
+    assert [q['name'] for q in r.json()] == ['Q0', 'Q1']
+    assert r.headers['x-total-count'] == '5'
+    names = [q['name'] for q in r.json()]
+    cursor = r.headers['x-next-cursor']
+    while cursor:
+        r = client.get(f'/admin/queues?limit=2&cursor={cursor}', headers=headers)
+        names += [q['name'] for q in r.json()]
+        cursor = r.headers.get('x-next-cursor')
+    assert names == [f'Q{i}' for i in range(5)]
+
+    r = client.get('/admin/queues?format=ndjson&include_total=true', headers=headers)
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('application/x-ndjson')
+    assert r.headers['x-total-count'] == '5'
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [q['name'] for q in lines] == [f'Q{i}' for i in range(5)]
+
+
+def test_admin_users_and_my_tickets_paged(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    headers = _admin(db_session)
+    db_session.add_all([models.User(keycloak_id=f'pu{i}', email=f'pu{i}@example.com') for i in range(3)])
+    q = models.Queue(name='Mine')
+    db_session.add(q)
+    db_session.commit()
+    admin_id = int(headers['x-test-user'])
+    db_session.add_all([models.Ticket(subject=f'T{i}', client_user_id=admin_id, current_queue_id=q.id, status='New') for i in range(3)])
+    db_session.commit()
+
+    r = client.get('/admin/users?limit=2&include_total=true', headers=headers)
+    assert r.status_code == 200
+    assert len(r.json()) == 2 and set(r.json()[0]) == {'id', 'keycloak_id', 'first_name', 'last_name', 'email'}
+    assert r.headers['x-total-count'] == '4'
+
+    r = client.get('/tickets/me?limit=2', headers=headers)
+    assert [t['subject'] for t in r.json()] == ['T0', 'T1']
+    r = client.get(f'/tickets/me?cursor={r.headers["x-next-cursor"]}', headers=headers)
+    assert [t['subject'] for t in r.json()] == ['T2']
+    assert 'x-next-cursor' not in r.headers
+
+    r = client.get('/tickets/me?format=ndjson', headers=headers)
+    assert [json.loads(line)['subject'] for line in r.text.splitlines()] == ['T0', 'T1', 'T2']
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.core.recurrence import expand, parse_rrule
+from app.models import models
+
+
+def _days(rrule, start=datetime(2030, 9, 2, 10), hours=2, limit=500):
+    # 2030-09-02 is a Monday
+    return [s.strftime('%a %d') for s, _ in expand(parse_rrule(rrule), start, start + timedelta(hours=hours), limit)]
+
+
+def test_rrule_expansion():
+    assert _days('FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4') == ['Mon 02', 'Wed 04', 'Mon 09', 'Wed 11']
+    assert _days('RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20300916') == ['Mon 02', 'Mon 16']
+    assert _days('FREQ=DAILY;BYDAY=SA,SU;UNTIL=20300908T235959Z') == ['Sat 07', 'Sun 08']
+    # DTSTART that does not match BYDAY is not an occurrence
+    assert _days('FREQ=WEEKLY;BYDAY=FR;COUNT=2') == ['Fri 06', 'Fri 13']
+    for bad in ('FREQ=MONTHLY;COUNT=2', 'FREQ=DAILY', 'FREQ=DAILY;COUNT=2;UNTIL=20300910', 'FREQ=DAILY;BYDAY=1MO;COUNT=2', 'FREQ=DAILY;BYMONTH=1;COUNT=2', 'FREQ=DAILY;INTERVAL=0;COUNT=2'):
+        with pytest.raises(ValueError):
+            parse_rrule(bad)
+    with pytest.raises(ValueError):
+        _days('FREQ=DAILY;COUNT=10', limit=5)
+    with pytest.raises(ValueError):
+        _days('FREQ=DAILY;COUNT=3', hours=30)
+
+
+def test_rrule_expansion_is_bounded():
+    # a stride of whole weeks only ever lands on DTSTART's weekday
+    assert _days('FREQ=DAILY;INTERVAL=14;BYDAY=MO,TU;COUNT=2') == ['Mon 02', 'Mon 16']
+    for rule in ('FREQ=DAILY;INTERVAL=7;BYDAY=TU;COUNT=3', 'FREQ=DAILY;INTERVAL=7;BYDAY=TU;UNTIL=20301231'):
+        with pytest.raises(ValueError, match='BYDAY'):
+            _days(rule)
+    # reachable but sparse: stops at UNTIL instead of walking the calendar
+    assert _days('FREQ=DAILY;INTERVAL=3;BYDAY=SU;UNTIL=20300930') == ['Sun 08', 'Sun 29']
+    # strides that run off the calendar are rejected rather than overflowing
+    for rule in ('FREQ=DAILY;INTERVAL=10000000;COUNT=3', 'FREQ=WEEKLY;INTERVAL=10000000;COUNT=3'):
+        with pytest.raises(ValueError):
+            _days(rule)
+
+
+def test_recurring_activity_reports_conflicts_per_occurrence(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    user = models.User(keycloak_id='rec', email='rec@example.com')
+    bld = models.Building(name='Rec')
+    db_session.add_all([user, bld])
+    db_session.commit()
+    room = models.Space(building_id=bld.id, name='Lab', capacity=30)
+    beamer = models.StockItem(name='Beamer', sku='REC-BEAM')
+    db_session.add_all([room, beamer])
+    db_session.commit()
+    first = datetime(2030, 9, 2, 10)
+    # the room is taken during the fourth occurrence (Wednesday of week 2)
+    taken = models.Activity(title='Exam', category_id=1, organizer_user_id=user.id, start_time=first + timedelta(days=9, hours=1), end_time=first + timedelta(days=9, hours=3))
+    db_session.add(taken)
+    db_session.flush()
+    db_session.add(models.SpaceBooking(activity_id=taken.id, space_id=room.id, status='Confirmed'))
+    db_session.commit()
+    taken_id = taken.id
+
+    headers = {'x-test-user': str(user.id)}
+    payload = {
+        'title': 'Course', 'category_id': 1, 'activity_type_id': None, 'organizer_user_id': user.id,
+        'start_time': first.isoformat(), 'end_time': (first + timedelta(hours=2)).isoformat(),
+        'rrule': 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=30', 'space_ids': [room.id], 'item_ids': [beamer.id],
+    }
+
+    r = client.post('/activities/recurring', json={**payload, 'atomic': True}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body['created'] == 0
+    assert [o['status_code'] for o in body['occurrences']].count(424) == 29
+
+    r = client.post('/activities/recurring', json=payload, headers=headers)
+    body = r.json()
+    assert body['created'] == 29 and body['failed'] == 1
+    clash = body['occurrences'][3]
+    assert clash['status_code'] == 409
+    assert clash['conflicts'] == [{'kind': 'space', 'resource_id': room.id, 'activity_id': taken_id}]
+    assert body['occurrences'][-1]['start_time'] == (first + timedelta(weeks=14, days=2)).isoformat()
+    ids = [o['activity_id'] for o in body['occurrences'] if o['status_code'] == 201]
+    assert db_session.query(models.SpaceBooking).filter(models.SpaceBooking.activity_id.in_(ids), models.SpaceBooking.start_time != None).count() == 29
+    assert db_session.query(models.StockBooking).filter(models.StockBooking.activity_id.in_(ids)).count() == 29
+
+    # the series now occupies the room, so a second copy conflicts everywhere except the gap
+    r = client.post('/activities/recurring', json=payload, headers=headers)
+    body = r.json()
+    assert body['created'] == 0
+    assert body['occurrences'][0]['conflicts'][0]['activity_id'] == ids[0]
+    assert {c['kind'] for c in body['occurrences'][0]['conflicts']} == {'space', 'stock'}
+    assert [c['activity_id'] for c in body['occurrences'][3]['conflicts']] == [taken_id]
+
+    assert client.post('/activities/recurring', json={**payload, 'rrule': 'FREQ=HOURLY;COUNT=2'}, headers=headers).status_code == 400
+    assert client.post('/activities/recurring', json={**payload, 'space_ids': [987654]}, headers=headers).status_code == 404
+
+
+def test_recurring_activity_with_offset_aware_start(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    user = models.User(keycloak_id='rec-tz', email='rec-tz@example.com')
+    bld = models.Building(name='Rec TZ')
+    db_session.add_all([user, bld])
+    db_session.commit()
+    room = models.Space(building_id=bld.id, name='Hall', capacity=10)
+    db_session.add(room)
+    db_session.commit()
+    # 2030-09-02 10:00 UTC is taken; the series below starts at 12:00+02:00, the same instant
+    taken = models.Activity(title='Taken', category_id=1, organizer_user_id=user.id, start_time=datetime(2030, 9, 2, 10), end_time=datetime(2030, 9, 2, 11))
+    # and one that only the unconverted wall-clock times (12:00-13:00) would collide with
+    decoy = models.Activity(title='Decoy', category_id=1, organizer_user_id=user.id, start_time=datetime(2030, 9, 9, 12, 30), end_time=datetime(2030, 9, 9, 13))
+    db_session.add_all([taken, decoy])
+    db_session.flush()
+    db_session.add_all([models.SpaceBooking(activity_id=a.id, space_id=room.id, status='Confirmed') for a in (taken, decoy)])
+    db_session.commit()
+
+    cest = timezone(timedelta(hours=2))
+    # 01:00+02:00 on a Tuesday is still Monday in UTC; BYDAY follows the caller's offset
+    for start, expected in ((datetime(2030, 9, 2, 12, tzinfo=cest), datetime(2030, 9, 2, 10)), (datetime(2030, 9, 3, 1, tzinfo=cest), datetime(2030, 9, 2, 23))):
+        payload = {
+            'title': 'Series', 'category_id': 1, 'activity_type_id': None, 'organizer_user_id': user.id,
+            'start_time': start.isoformat(), 'end_time': (start + timedelta(hours=1)).isoformat(),
+            'rrule': f"FREQ=WEEKLY;BYDAY={start.strftime('%a')[:2].upper()};COUNT=2", 'space_ids': [room.id], 'item_ids': [],
+        }
+        r = client.post('/activities/recurring', json=payload, headers={'x-test-user': str(user.id)})
+        assert r.status_code == 200
+        occurrences = r.json()['occurrences']
+        assert [datetime.fromisoformat(o['start_time']) for o in occurrences] == [expected, expected + timedelta(weeks=1)]
+        assert [o['status_code'] for o in occurrences] == ([409, 201] if expected.hour == 10 else [201, 201])
@@ -1,3 +1,4 @@
+import pytest
 from unittest.mock import patch
 from fastapi.testclient import TestClient
 from app.main import app
@@ -39,3 +40,151 @@ def test_require_role_fail(mock_decode):
         assert False, 'require_role should raise when user missing required role'
     except Exception:
         assert True
+
+
+def test_get_current_user_caches_principal(db_session, monkeypatch):
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.core import security
+    from app.core.config import settings
+    from app.models.models import User
+
+    monkeypatch.setattr(settings, 'KEYCLOAK_BYPASS', False)
+    monkeypatch.setattr(security.jwks_store, 'get_key', lambda kid: object())
+    monkeypatch.setattr(security.jwt, 'get_unverified_header', lambda token: {'kid': 'k1', 'alg': 'RS256'})
+    monkeypatch.setattr(security.jwt, 'decode', fake_decode_valid)
+    security._PRINCIPAL_CACHE.clear()
+
+    creds = HTTPAuthorizationCredentials(scheme='Bearer', credentials='tok')
+    first = get_current_user(creds, db_session)
+    hits = security._PRINCIPAL_CACHE.hits
+    second = get_current_user(creds, db_session)
+
+    assert first.id == second.id
+    assert second.roles == ['agent', 'user']
+    assert security._PRINCIPAL_CACHE.hits == hits + 1
+    assert db_session.query(User).filter(User.keycloak_id == 'kc-sub-1').count() == 1
+
+
+def _rsa_jwk(kid):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jose import jwk
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    d = jwk.construct(pem, 'RS256').to_dict()
+    d.update({'kid': kid, 'use': 'sig'})
+    return d
+
+
+def test_jwks_store_indexes_keys_and_single_flights_fetches():
+    import threading
+    from unittest.mock import MagicMock
+    from app.core.jwks import JWKSKeyStore
+
+    calls = []
+    jwks = {'keys': [_rsa_jwk('k1')]}
+
+    def fake_get(url, timeout):
+        calls.append(url)
+        resp = MagicMock()
+        resp.json.return_value = jwks
+        return resp
+
+    store = JWKSKeyStore(lambda: 'http://kc/certs', ttl=3600, min_refetch_interval=0)
+    with patch('app.core.jwks.requests.get', side_effect=fake_get):
+        threads = [threading.Thread(target=store.get_key, args=('k1',)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert store.get_key('k1') is store.get_key('k1')
+        assert len(calls) == 1
+
+        # unknown kid (rotation) triggers a refetch that picks the new key up
+        jwks['keys'].append(_rsa_jwk('k2'))
+        assert store.get_key('k2') is not None
+        assert len(calls) == 2
+
+
+def test_verified_token_cache_skips_repeat_decode(db_session, monkeypatch):
+    import time
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.core import security
+    from app.core.config import settings
+
+    calls = []
+
+    def decode_with_exp(token, *args, **kwargs):
+        calls.append(token)
+        claims = fake_decode_valid(token)
+        claims['exp'] = int(time.time()) + 600
+        return claims
+
+    monkeypatch.setattr(settings, 'KEYCLOAK_BYPASS', False)
+    monkeypatch.setattr(security.jwks_store, 'get_key', lambda kid: object())
+    monkeypatch.setattr(security.jwt, 'get_unverified_header', lambda token: {'kid': 'k1', 'alg': 'RS256'})
+    monkeypatch.setattr(security.jwt, 'decode', decode_with_exp)
+    security._TOKEN_CACHE.clear()
+
+    creds = HTTPAuthorizationCredentials(scheme='Bearer', credentials='tok-exp')
+    for _ in range(3):
+        u = get_current_user(creds, db_session)
+        assert u.roles == ['agent', 'user']
+    assert calls == ['tok-exp']
+    assert security._TOKEN_CACHE.stats()['hits'] >= 2
+
+
+def test_jwks_store_serves_stale_keys_and_backs_off_after_failed_refresh():
+    from unittest.mock import MagicMock
+    import requests
+    from app.core.jwks import JWKSKeyStore, JWKSFetchError
+
+    calls = []
+    jwks = {'keys': [_rsa_jwk('k1')]}
+    issuer_up = [True]
+
+    def fake_get(url, timeout):
+        calls.append(url)
+        if not issuer_up[0]:
+            raise requests.ConnectionError('issuer down')
+        resp = MagicMock()
+        resp.json.return_value = jwks
+        return resp
+
+    clock = [1000.0]
+    store = JWKSKeyStore(lambda: 'http://kc/certs', ttl=60, min_refetch_interval=10)
+    with patch('app.core.jwks.requests.get', side_effect=fake_get), patch('app.core.jwks.time.time', lambda: clock[0]):
+        k1 = store.get_key('k1')
+        assert k1 is not None and len(calls) == 1
+
+        # TTL runs out while the issuer is down: one attempt, then the stale key is served
+        issuer_up[0] = False
+        clock[0] += 61
+        assert store.get_key('k1') is k1
+        assert len(calls) == 2
+        # within the backoff interval neither expiry nor unknown kids refetch
+        clock[0] += 5
+        assert store.get_key('k1') is k1
+        assert store.get_key('unknown') is None
+        assert len(calls) == 2
+
+        # after the interval one more attempt is made; once the issuer is back keys refresh
+        clock[0] += 6
+        assert store.get_key('k1') is k1
+        assert len(calls) == 3
+        issuer_up[0] = True
+        clock[0] += 11
+        assert store.get_key('k1') is not None
+        assert len(calls) == 4
+        assert store.get_key('k1') is not None and len(calls) == 4
+
+    # with nothing cached a failure is reported, and repeated requests fail fast
+    cold = JWKSKeyStore(lambda: 'http://kc/certs', ttl=60, min_refetch_interval=10)
+    issuer_up[0] = False
+    calls.clear()
+    with patch('app.core.jwks.requests.get', side_effect=fake_get):
+        for _ in range(3):
+            with pytest.raises(JWKSFetchError):
+                cold.get_key('k1')
+    assert len(calls) == 1
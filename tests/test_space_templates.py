@@ -0,0 +1,37 @@
+from app.models import models
+from app.core.config import settings
+from app.core.catalog import space_template_catalog
+
+
+def test_space_template_listing_follows_edits(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    admin = models.User(keycloak_id='st-admin', email='st-admin@example.com')
+    db_session.add(admin)
+    db_session.commit()
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+    headers = {'x-test-user': str(admin.id)}
+
+    r = client.post('/logistics/space_templates', json={'name': 'Lab', 'fields': [{'name': 'Benches', 'field_type': 'number'}, {'name': 'Hazard', 'field_type': 'select', 'options': ['low', 'high']}]}, headers=headers)
+    assert r.status_code == 200
+    tid = r.json()['id']
+
+    body = client.get('/logistics/space_templates', headers=headers).json()
+    assert [t['name'] for t in body] == ['Lab']
+    assert body[0]['fields'][1]['options'] == ['low', 'high']
+    reloads = space_template_catalog.reloads
+    client.get('/logistics/space_templates', headers=headers)
+    assert space_template_catalog.reloads == reloads
+
+    r = client.patch(f'/logistics/space_templates/{tid}', json={'name': 'Wet lab', 'fields': [{'name': 'Sinks', 'field_type': 'number'}]}, headers=headers)
+    assert r.status_code == 200
+    body = client.get('/logistics/space_templates', headers=headers).json()
+    assert body[0]['name'] == 'Wet lab'
+    assert [f['name'] for f in body[0]['fields']] == ['Sinks']
+
+    r = client.delete(f'/logistics/space_templates/{tid}', headers=headers)
+    assert r.status_code == 204
+    assert client.get('/logistics/space_templates', headers=headers).json() == []
@@ -0,0 +1,64 @@
+import json
+
+from app.models import models
+from app.core.config import settings
+from app.core.catalog import bump_catalog_version, TICKET_TYPES
+
+
+def _setup(db_session):
+    u = models.User(keycloak_id='batch-client', email='batch-client@example.com')
+    g = models.Group(name='Batch clients')
+    open_q = models.Queue(name='Batch open')
+    closed_q = models.Queue(name='Batch closed')
+    db_session.add_all([u, g, open_q, closed_q])
+    db_session.commit()
+    db_session.add(models.UserGroup(user_id=u.id, group_id=g.id))
+    db_session.add(models.QueuePermission(group_id=g.id, queue_id=open_q.id))
+    tt = models.TicketType(queue_id=open_q.id, name='Hardware')
+    db_session.add(tt)
+    db_session.flush()
+    db_session.add(models.TicketTypeField(ticket_type_id=tt.id, name='Kind', field_type='select', options=json.dumps(['laptop', 'phone'])))
+    bump_catalog_version(db_session, TICKET_TYPES)
+    db_session.commit()
+    return u, open_q, closed_q, tt
+
+
+def test_batch_creates_valid_items_and_reports_failures(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    u, open_q, closed_q, tt = _setup(db_session)
+    headers = {'x-test-user': str(u.id)}
+    tickets = [{'subject': f'Bulk {i}', 'description': None, 'queue_id': open_q.id} for i in range(50)]
+    tickets.append({'subject': 'Typed', 'description': 'x', 'queue_id': open_q.id, 'ticket_type_id': tt.id, 'custom_fields': [{'name': 'Kind', 'value': 'phone'}]})
+    tickets.append({'subject': 'Bad option', 'description': None, 'queue_id': open_q.id, 'ticket_type_id': tt.id, 'custom_fields': [{'name': 'Kind', 'value': 'tablet'}]})
+    tickets.append({'subject': 'No permission', 'description': None, 'queue_id': closed_q.id})
+
+    r = client.post('/tickets/batch', json={'tickets': tickets}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body['created'] == 51 and body['failed'] == 2
+    results = body['results']
+    assert all(res['status_code'] == 201 and res['ticket_id'] for res in results[:51])
+    assert results[51]['status_code'] == 400 and results[51]['ticket_id'] is None
+    assert results[52] == {'index': 52, 'ticket_id': None, 'status_code': 403, 'detail': 'User groups lack permission to post in this queue'}
+
+    typed_id = results[50]['ticket_id']
+    fv = db_session.query(models.TicketFieldValue).filter(models.TicketFieldValue.ticket_id == typed_id).one()
+    assert fv.value == 'phone'
+    ids = [res['ticket_id'] for res in results[:51]]
+    assert db_session.query(models.TicketMovementLog).filter(models.TicketMovementLog.ticket_id.in_(ids), models.TicketMovementLog.action_type == 'CREATE').count() == 51
+    assert len(client.get('/tickets/me', headers=headers).json()) == 51
+    assert db_session.get(models.Ticket, ids[3]).subject == 'Bulk 3'
+
+
+def test_atomic_batch_creates_nothing_on_failure(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    u, open_q, closed_q, _ = _setup(db_session)
+    headers = {'x-test-user': str(u.id)}
+    tickets = [{'subject': 'ok', 'description': None, 'queue_id': open_q.id}, {'subject': 'no', 'description': None, 'queue_id': closed_q.id}]
+
+    r = client.post('/tickets/batch', json={'tickets': tickets, 'atomic': True}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body['created'] == 0
+    assert [res['status_code'] for res in body['results']] == [424, 403]
+    assert client.get('/tickets/me', headers=headers).json() == []
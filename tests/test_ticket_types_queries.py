@@ -0,0 +1,122 @@
+import json
+
+from sqlalchemy import event
+
+from app.models import models
+from app.core.catalog import bump_catalog_version, ticket_type_catalog, TICKET_TYPES
+from app.core.config import settings
+
+
+def _seed_types(db_session, queue, group, n):
+    for i in range(n):
+        tt = models.TicketType(queue_id=queue.id, name=f'Type {i}')
+        db_session.add(tt)
+        db_session.flush()
+        db_session.add(models.TicketTypeAllowedGroup(ticket_type_id=tt.id, group_id=group.id))
+        db_session.add(models.TicketTypeField(ticket_type_id=tt.id, name='kind', field_type='select', options=json.dumps(['a', 'b'])))
+        db_session.add(models.TicketTypeField(ticket_type_id=tt.id, name='note', field_type='text'))
+    bump_catalog_version(db_session, TICKET_TYPES)
+    db_session.commit()
+
+
+def _count_queries(client, db_session, headers):
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind().engine
+    # count a cold catalog load, not a cache hit
+    ticket_type_catalog.clear()
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        r = client.get('/tickets/types', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+    assert r.status_code == 200
+    return r.json(), len(statements)
+
+
+def test_ticket_types_query_count_is_constant(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    u = models.User(keycloak_id='tt-n1', email='tt-n1@example.com')
+    other = models.Group(name='Other')
+    g = models.Group(name='Requesters')
+    q = models.Queue(name='Types Q')
+    db_session.add_all([u, g, other, q])
+    db_session.commit()
+    db_session.add(models.UserGroup(user_id=u.id, group_id=g.id))
+    db_session.commit()
+    headers = {'x-test-user': str(u.id)}
+
+    _seed_types(db_session, q, g, 2)
+    # warm the auth caches so only the endpoint's own queries are counted
+    client.get('/tickets/types', headers=headers)
+    body, few = _count_queries(client, db_session, headers)
+    assert len(body) == 2
+    assert body[0]['fields'][0]['options'] == ['a', 'b']
+
+    _seed_types(db_session, q, g, 20)
+    # a type restricted to another group is filtered out
+    _seed_types(db_session, q, other, 1)
+    body, many = _count_queries(client, db_session, headers)
+    assert len(body) == 22
+    assert many == few
+
+
+def test_ticket_type_catalog_reloads_after_admin_write(client, db_session):
+    settings.KEYCLOAK_BYPASS = True
+    admin = models.User(keycloak_id='tt-admin', email='tt-admin@example.com')
+    q = models.Queue(name='Catalog Q')
+    db_session.add_all([admin, q])
+    db_session.commit()
+    role = models.Role(name='admin')
+    db_session.add(role)
+    db_session.commit()
+    db_session.add(models.UserRole(user_id=admin.id, role_id=role.id))
+    db_session.commit()
+    headers = {'x-test-user': str(admin.id)}
+
+    r = client.post('/admin/ticket_types', json={'queue_id': q.id, 'name': 'First', 'fields': []}, headers=headers)
+    assert r.status_code == 200
+    type_id = r.json()['id']
+    assert [t['name'] for t in client.get('/tickets/types', headers=headers).json()] == ['First']
+    reloads = ticket_type_catalog.reloads
+    assert [t['name'] for t in client.get('/tickets/types', headers=headers).json()] == ['First']
+    assert ticket_type_catalog.reloads == reloads
+
+    r = client.put(f'/admin/ticket_types/{type_id}', json={'name': 'Renamed'}, headers=headers)
+    assert r.status_code == 200
+    assert [t['name'] for t in client.get('/tickets/types', headers=headers).json()] == ['Renamed']
+    assert ticket_type_catalog.reloads == reloads + 1
+
+    r = client.delete(f'/admin/ticket_types/{type_id}', headers=headers)
+    assert r.status_code == 200
+    assert client.get('/tickets/types', headers=headers).json() == []
+
+
+def test_catalog_version_rows_are_seeded_and_first_bumps_do_not_race(db_session):
+    from app.core.catalog import CATALOG_NAMES, bump_catalog_version, catalog_version, seed_catalog_versions
+
+    conn = db_session.connection()
+    seed_catalog_versions(conn)
+    seed_catalog_versions(conn)
+    rows = dict(db_session.query(models.CatalogVersion.name, models.CatalogVersion.version))
+    assert {'ticket_types', 'activity_types', 'space_templates'} <= set(CATALOG_NAMES) <= set(rows)
+
+    # a catalog without a row whose first bump races another worker's first bump
+    db_session.query(models.CatalogVersion).filter(models.CatalogVersion.name == 'activity_types').delete()
+    raced = []
+
+    def other_worker_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE catalog_versions') and not raced:
+            raced.append(True)
+            conn.exec_driver_sql("INSERT INTO catalog_versions (name, version) VALUES ('activity_types', 1)")
+
+    event.listen(conn, 'after_cursor_execute', other_worker_inserts)
+    try:
+        bump_catalog_version(db_session, 'activity_types')
+    finally:
+        event.remove(conn, 'after_cursor_execute', other_worker_inserts)
+    assert raced
+    assert catalog_version(db_session, 'activity_types') == 2